@@ -2,41 +2,177 @@ from flask import Flask
 import os
 from dotenv import load_dotenv
 from models import db
+from utils.database import opcoes_engine
+from utils.replica import configurar_replica
+from utils.instrumentacao import configurar_logs, instrumentar
 from routes.operacoes import bp_operacoes
 from routes.ativos import bp_ativos
 from routes.main import bp_inicio
+from comandos import (
+    cli_cotacoes,
+    cli_operacoes,
+    cli_historico,
+    cli_carteiras,
+    cli_ativos,
+)
+from services.cotacao_service import iniciar_atualizador_em_segundo_plano
+from services.agendamento_service import iniciar_agendador_em_segundo_plano
 
 from flask_migrate import Migrate
 
-
 load_dotenv()
 
 
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv("DB_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool de conexões: tamanho, excedente e espera (s) vazios = padrão do SQLAlchemy;
+    # testa a conexão antes de usar e a renova após DB_POOL_RECYCLE segundos (-1 = nunca)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE")) if os.getenv("DB_POOL_SIZE") else None
+    DB_POOL_MAX_OVERFLOW = (
+        int(os.getenv("DB_POOL_MAX_OVERFLOW"))
+        if os.getenv("DB_POOL_MAX_OVERFLOW")
+        else None
+    )
+    DB_POOL_TIMEOUT = (
+        float(os.getenv("DB_POOL_TIMEOUT")) if os.getenv("DB_POOL_TIMEOUT") else None
+    )
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    # Réplica para as rotas somente leitura (vazio = tudo no banco principal) e por
+    # quantos segundos o navegador que gravou continua lendo do principal
+    DB_REPLICA_URL = os.getenv("DB_REPLICA_URL")
+    DB_REPLICA_PRIMARIO_APOS_ESCRITA = float(
+        os.getenv("DB_REPLICA_PRIMARIO_APOS_ESCRITA", 10)
+    )
     SECRET_KEY = os.getenv("SECRET_KEY")
     POLYGON_API_KEY = os.getenv("POLYGON_API_KEY")
     ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
     SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
     BRAPI_API_KEY = os.getenv("BRAPI_API_KEY")
     BRAPI_API_BASE_URL = "https://brapi.dev/api/quote/"
+    # Quantidade de tickers por requisição aceita pelo plano da brapi
+    BRAPI_TICKERS_POR_REQUISICAO = int(os.getenv("BRAPI_TICKERS_POR_REQUISICAO", 10))
+    BRAPI_MAX_REQUISICOES_SIMULTANEAS = int(
+        os.getenv("BRAPI_MAX_REQUISICOES_SIMULTANEAS", 4)
+    )
+    # Provedor de cotações: "brapi" ou "fake" (preços simulados, para uso offline)
+    COTACOES_PROVEDOR = os.getenv("COTACOES_PROVEDOR", "brapi")
+    # Atualizador de cotações em segundo plano (tabela "cotacoes")
+    COTACOES_ATUALIZADOR_INTERVALO = int(
+        os.getenv("COTACOES_ATUALIZADOR_INTERVALO", 60)
+    )
+    COTACOES_ATUALIZADOR_CONCORRENCIA = int(
+        os.getenv("COTACOES_ATUALIZADOR_CONCORRENCIA", 4)
+    )
+    # Roda o atualizador dentro do processo web (útil em desenvolvimento)
+    COTACOES_ATUALIZADOR_EMBUTIDO = (
+        os.getenv("COTACOES_ATUALIZADOR_EMBUTIDO", "0") == "1"
+    )
+    # A cada quantas operações a posição guarda um snapshot para recálculos
+    POSICAO_SNAPSHOT_INTERVALO = int(os.getenv("POSICAO_SNAPSHOT_INTERVALO", 250))
+    # Paginação das listagens: "keyset" (por cursor) ou "offset" (por número da página)
+    PAGINACAO_MODO = os.getenv("PAGINACAO_MODO", "keyset")
+    # Operações por página na listagem: padrão e máximo aceito em ?por_pagina=
+    OPERACOES_POR_PAGINA = int(os.getenv("OPERACOES_POR_PAGINA", 10))
+    OPERACOES_POR_PAGINA_MAXIMO = int(os.getenv("OPERACOES_POR_PAGINA_MAXIMO", 500))
+    # Cache de cotações: "memoria" (por processo) ou "sqlite" (compartilhado)
+    COTACAO_CACHE_BACKEND = os.getenv("COTACAO_CACHE_BACKEND", "memoria")
+    COTACAO_CACHE_SQLITE_PATH = os.getenv("COTACAO_CACHE_SQLITE_PATH")
+    COTACAO_CACHE_MAX_ITENS = int(os.getenv("COTACAO_CACHE_MAX_ITENS", 1000))
+    COTACAO_CACHE_TTL_PREGAO = int(os.getenv("COTACAO_CACHE_TTL_PREGAO", 60))
+    COTACAO_CACHE_TTL_FORA_PREGAO = int(
+        os.getenv("COTACAO_CACHE_TTL_FORA_PREGAO", 6 * 60 * 60)
+    )
+    COTACAO_CACHE_STALE_WHILE_REVALIDATE = (
+        os.getenv("COTACAO_CACHE_STALE_WHILE_REVALIDATE", "1") == "1"
+    )
+    # Por quanto tempo após expirar uma cotação ainda pode ser servida
+    COTACAO_CACHE_DEFASAGEM_MAXIMA = int(
+        os.getenv("COTACAO_CACHE_DEFASAGEM_MAXIMA", 24 * 60 * 60)
+    )
+    # Cache das páginas de listagem e detalhe: "memoria" (por processo), "sqlite"
+    # (compartilhado entre os processos) ou "nenhum"
+    PAGINAS_CACHE_BACKEND = os.getenv("PAGINAS_CACHE_BACKEND", "memoria")
+    PAGINAS_CACHE_SQLITE_PATH = os.getenv("PAGINAS_CACHE_SQLITE_PATH")
+    PAGINAS_CACHE_MAX_ITENS = int(os.getenv("PAGINAS_CACHE_MAX_ITENS", 200))
+    # Intervalo (segundos) entre as verificações de versão dos dados de referência
+    REFERENCIAS_VERIFICACAO = float(os.getenv("REFERENCIAS_VERIFICACAO", 5))
+    # Pasta do histórico de preços diários (padrão: instance/historico)
+    HISTORICO_DIR = os.getenv("HISTORICO_DIR")
+    # Transmissão de cotações (SSE): intervalo (s) entre as verificações de versão,
+    # eventos pendentes por navegador antes de desconectá-lo e heartbeat (s)
+    COTACOES_STREAM_VERIFICACAO = float(os.getenv("COTACOES_STREAM_VERIFICACAO", 2))
+    COTACOES_STREAM_FILA = int(os.getenv("COTACOES_STREAM_FILA", 50))
+    COTACOES_STREAM_HEARTBEAT = float(os.getenv("COTACOES_STREAM_HEARTBEAT", 15))
+    # Consulta de nome/segmento dos tickers: "serpapi" ou "fake" (uso offline)
+    METADADOS_PROVEDOR = os.getenv("METADADOS_PROVEDOR", "serpapi")
+    # Validade (horas) dos metadados encontrados e dos tickers não encontrados
+    METADADOS_TTL = float(os.getenv("METADADOS_TTL", 30 * 24))
+    METADADOS_TTL_NAO_ENCONTRADO = float(os.getenv("METADADOS_TTL_NAO_ENCONTRADO", 24))
+    # Limite de consultas ao provedor: taxa (por segundo), rajada e espera máxima (s)
+    METADADOS_TAXA = float(os.getenv("METADADOS_TAXA", 1))
+    METADADOS_RAJADA = int(os.getenv("METADADOS_RAJADA", 5))
+    METADADOS_ESPERA_MAXIMA = float(os.getenv("METADADOS_ESPERA_MAXIMA", 5))
+    # Cópia do catálogo de ativos da B3 atualizada pela brapi (padrão: instance/)
+    CATALOGO_ARQUIVO = os.getenv("CATALOGO_ARQUIVO")
+    # Executor das operações agendadas: intervalo (s) e operações por transação
+    AGENDADAS_INTERVALO = int(os.getenv("AGENDADAS_INTERVALO", 60))
+    AGENDADAS_LOTE = int(os.getenv("AGENDADAS_LOTE", 500))
+    # Roda o executor dentro do processo web (útil em desenvolvimento)
+    AGENDADAS_EMBUTIDO = os.getenv("AGENDADAS_EMBUTIDO", "0") == "1"
+    # Logs: nível, formato ("texto" ou "json") e uma linha por requisição
+    # (LOG_REQUISICOES=1); o JSON e o log das requisições são ligados na implantação
+    LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO")
+    LOG_FORMATO = os.getenv("LOG_FORMATO", "texto")
+    LOG_REQUISICOES = os.getenv("LOG_REQUISICOES", "0") == "1"
+    # Vezes que a mesma consulta pode se repetir em uma requisição antes do aviso de N+1
+    INSTRUMENTACAO_CONSULTAS_REPETIDAS = int(
+        os.getenv("INSTRUMENTACAO_CONSULTAS_REPETIDAS", 5)
+    )
+    # Perfilador por amostragem: 1 a cada N requisições (0 = desligado), intervalo
+    # entre amostras (ms), duração mínima para gravar (ms) e pasta (padrão: instance/perfis)
+    PERFILADOR_AMOSTRAGEM = int(os.getenv("PERFILADOR_AMOSTRAGEM", 0))
+    PERFILADOR_INTERVALO_MS = float(os.getenv("PERFILADOR_INTERVALO_MS", 5))
+    PERFILADOR_LIMITE_MS = float(os.getenv("PERFILADOR_LIMITE_MS", 500))
+    PERFILADOR_DIR = os.getenv("PERFILADOR_DIR")
 
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    configurar_logs(app)
 
     # Registra seus Blueprints
     app.register_blueprint(bp_operacoes)
     app.register_blueprint(bp_ativos)
     app.register_blueprint(bp_inicio)
 
+    # Registra os comandos de linha de comando (flask cotacoes ..., flask operacoes ...)
+    app.cli.add_command(cli_cotacoes)
+    app.cli.add_command(cli_operacoes)
+    app.cli.add_command(cli_historico)
+    app.cli.add_command(cli_carteiras)
+    app.cli.add_command(cli_ativos)
+
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", opcoes_engine(app.config))
+    configurar_replica(app)
+
     Migrate(app, db)
     db.init_app(app)
+    instrumentar(app)
 
     with app.app_context():
-        db.create_all()
+        # Cria as tabelas novas; índices e alterações em tabelas existentes vêm
+        # das migrações (flask db upgrade, no deploy). Só no banco principal: a
+        # réplica recebe o esquema pela replicação
+        db.create_all(bind_key=None)
+
+    if app.config["COTACOES_ATUALIZADOR_EMBUTIDO"]:
+        iniciar_atualizador_em_segundo_plano(app)
+
+    if app.config["AGENDADAS_EMBUTIDO"]:
+        iniciar_agendador_em_segundo_plano(app)
 
     return app
 
@@ -0,0 +1,328 @@
+# benchmarks/executar.py
+"""
+Mede as rotas e funções de serviço principais sobre dados sintéticos:
+latência (p50, p95, p99), consultas SQL por chamada e pico de memória
+(tracemalloc). Roda sem internet: as cotações vêm do provedor fake.
+
+Os resultados são gravados em JSON (benchmarks/resultados/) e podem ser
+comparados com uma execução anterior; com --comparar, o comando termina com
+código 1 se algum caso piorar além da tolerância.
+
+Uso (a partir da pasta app/):
+    python -m benchmarks.executar --db sqlite:///bench.db --perfil medio
+    python -m benchmarks.executar --db postgresql://localhost/bench \\
+        --perfil grande --comparar benchmarks/resultados/base.json
+
+O banco deve ser exclusivo do benchmark: os casos de escrita gravam operações.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+
+PASTA_RESULTADOS = os.path.join(os.path.dirname(__file__), "resultados")
+
+
+class ContadorConsultas:
+    """Conta os comandos SQL enviados pelo engine enquanto está ligado."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.total = 0
+        event.listen(engine, "before_cursor_execute", self._contar)
+
+    def _contar(self, *args, **kwargs):
+        self.total += 1
+
+
+def _percentil(ordenados: list[float], percentil: float) -> float:
+    # Método do posto mais próximo, sobre a lista já ordenada
+    posto = max(0, min(len(ordenados) - 1, round(percentil / 100 * len(ordenados)) - 1))
+    return ordenados[posto]
+
+
+def medir(funcao, contador: ContadorConsultas, repeticoes: int, aquecimento: int):
+    """
+    Executa `funcao` `aquecimento` vezes sem medir e `repeticoes` vezes medindo
+    tempo e consultas; depois, uma vez com o tracemalloc ligado para o pico de
+    memória (fora das medições de tempo, que ele deixaria mais lentas).
+    """
+
+    for _ in range(aquecimento):
+        funcao()
+
+    tempos = []
+    consultas = []
+    for _ in range(repeticoes):
+        antes = contador.total
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(contador.total - antes)
+
+    tracemalloc.start()
+    try:
+        funcao()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    tempos.sort()
+    consultas.sort()
+    return {
+        "repeticoes": repeticoes,
+        "min_ms": round(tempos[0], 3),
+        "p50_ms": round(_percentil(tempos, 50), 3),
+        "p95_ms": round(_percentil(tempos, 95), 3),
+        "p99_ms": round(_percentil(tempos, 99), 3),
+        "max_ms": round(tempos[-1], 3),
+        "consultas": consultas[len(consultas) // 2],
+        "memoria_pico_kb": round(pico / 1024, 1),
+    }
+
+
+def montar_casos(app, db, semente: int) -> dict:
+    """Casos medidos: nome -> função sem argumentos (dentro do contexto da aplicação)."""
+
+    from models import Ativo, Operacao
+    from services.analise_service import analisar_carteiras
+    from services.posicao_service import recalcular_posicao_historico
+
+    cliente = app.test_client()
+    aleatorio = random.Random(semente)
+
+    # A posição com mais operações é o pior caso do recálculo
+    ativo_id, carteira_id = db.session.execute(
+        db.select(Operacao.ativo_id, Operacao.carteira_id)
+        .group_by(Operacao.ativo_id, Operacao.carteira_id)
+        .order_by(db.func.count().desc())
+        .limit(1)
+    ).one()
+    ultima_data = db.session.execute(
+        db.select(db.func.max(Operacao.data)).filter_by(
+            ativo_id=ativo_id, carteira_id=carteira_id
+        )
+    ).scalar()
+    ticker = db.session.get(Ativo, ativo_id).ticker
+    ativos = db.session.execute(db.select(Ativo.id)).scalars().all()
+
+    def obter(url):
+        def requisitar():
+            resposta = cliente.get(url)
+            assert resposta.status_code == 200, (url, resposta.status_code)
+
+        return requisitar
+
+    def adicionar_operacao():
+        resposta = cliente.post(
+            "/operacao/adicionar",
+            data={
+                "data_operacao": date.today().isoformat(),
+                "tipo": "1",
+                "ativo": str(aleatorio.choice(ativos)),
+                "carteira": str(carteira_id),
+                "quantidade": "1",
+                "preco_unitario": "10.00",
+                "custos": "0",
+            },
+        )
+        assert resposta.status_code == 302, resposta.status_code
+
+    def recalcular(a_partir_de):
+        def executar():
+            # Mede o recálculo sem alterar o banco
+            try:
+                recalcular_posicao_historico(
+                    ativo_id, carteira_id, a_partir_de=a_partir_de
+                )
+                db.session.flush()
+            finally:
+                db.session.rollback()
+
+        return executar
+
+    return {
+        "GET / (dashboard)": obter("/"),
+        "GET /api/dashboard": obter("/api/dashboard"),
+        "GET /operacao/ (exibir_operacoes)": obter("/operacao/"),
+        "GET /operacao/?ticker= (filtro)": obter(f"/operacao/?ticker={ticker[:4]}"),
+        "POST /operacao/adicionar": adicionar_operacao,
+        "recalcular_posicao_historico (completo)": recalcular(None),
+        "recalcular_posicao_historico (última data)": recalcular(ultima_data),
+        "analisar_carteiras": lambda: analisar_carteiras(),
+    }
+
+
+def preparar_dados(db, perfil: dict, semente: int):
+    from models import Operacao
+    from benchmarks.gerador import gerar_dados, gerar_posicoes
+    from services.cotacao_service import atualizar_cotacoes
+
+    if db.session.query(Operacao.id).limit(1).first() is not None:
+        return
+
+    print(
+        f"Gerando {perfil['num_ativos']} ativos e {perfil['num_operacoes']} operações..."
+    )
+    inicio = time.perf_counter()
+    gerar_dados(semente=semente, **perfil)
+    posicoes = gerar_posicoes()
+    cotacoes = atualizar_cotacoes()
+    print(
+        f"Dados gerados em {time.perf_counter() - inicio:.1f}s "
+        f"({posicoes} posições, {cotacoes} cotações)"
+    )
+
+
+def _commit_atual() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual: dict, base: dict, tolerancia: float) -> list[str]:
+    """
+    Imprime a variação de cada caso em relação à execução `base` e retorna os
+    casos que pioraram além da tolerância (p50/p95 em %, ou mais consultas).
+    """
+
+    regressoes = []
+    print(f"\nComparação com {base['meta']['data']} ({base['meta'].get('commit')}):")
+    for nome, medida in atual["casos"].items():
+        anterior = base["casos"].get(nome)
+        if anterior is None:
+            print(f"  {nome}: novo caso")
+            continue
+
+        variacoes = {
+            chave: (medida[chave] - anterior[chave]) / anterior[chave] * 100
+            for chave in ("p50_ms", "p95_ms")
+            if anterior[chave]
+        }
+        piorou = [
+            chave for chave, variacao in variacoes.items() if variacao > tolerancia
+        ]
+        if medida["consultas"] > anterior["consultas"]:
+            piorou.append("consultas")
+
+        print(
+            f"  {nome}: p50 {variacoes.get('p50_ms', 0):+.1f}%, "
+            f"p95 {variacoes.get('p95_ms', 0):+.1f}%, "
+            f"consultas {anterior['consultas']} -> {medida['consultas']}"
+            + (f"  <-- REGRESSÃO ({', '.join(piorou)})" if piorou else "")
+        )
+        if piorou:
+            regressoes.append(nome)
+
+    return regressoes
+
+
+def executar(opcoes) -> int:
+    # Configuração lida pela aplicação ao ser criada: banco e provedores offline
+    os.environ["DB_URL"] = opcoes.db
+    os.environ["COTACOES_PROVEDOR"] = "fake"
+    os.environ["METADADOS_PROVEDOR"] = "fake"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    # Mede a renderização das páginas, não o cache delas (pode ser religado pelo ambiente)
+    os.environ.setdefault("PAGINAS_CACHE_BACKEND", "nenhum")
+
+    from app import create_app
+    from models import db
+    from benchmarks.gerador import PERFIS
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+
+    perfil = dict(PERFIS[opcoes.perfil])
+    if opcoes.ativos:
+        perfil["num_ativos"] = opcoes.ativos
+    if opcoes.operacoes:
+        perfil["num_operacoes"] = opcoes.operacoes
+
+    with app.app_context():
+        preparar_dados(db, perfil, opcoes.semente)
+        contador = ContadorConsultas(db.engine)
+        casos = montar_casos(app, db, opcoes.semente)
+
+        resultado = {
+            "meta": {
+                "data": datetime.now().isoformat(timespec="seconds"),
+                "commit": _commit_atual(),
+                "banco": db.engine.dialect.name,
+                "perfil": opcoes.perfil,
+                **perfil,
+                "python": platform.python_version(),
+            },
+            "casos": {},
+        }
+
+        for nome, funcao in casos.items():
+            if opcoes.filtro and opcoes.filtro.lower() not in nome.lower():
+                continue
+            medida = medir(funcao, contador, opcoes.repeticoes, opcoes.aquecimento)
+            resultado["casos"][nome] = medida
+            print(
+                f"{nome}: p50 {medida['p50_ms']:.2f} ms, p95 {medida['p95_ms']:.2f} ms, "
+                f"p99 {medida['p99_ms']:.2f} ms, {medida['consultas']} consultas, "
+                f"pico {medida['memoria_pico_kb']:.0f} KB"
+            )
+
+    os.makedirs(opcoes.saida, exist_ok=True)
+    arquivo = os.path.join(
+        opcoes.saida,
+        f"{datetime.now():%Y%m%d-%H%M%S}-{resultado['meta']['banco']}-"
+        f"{opcoes.perfil}.json",
+    )
+    with open(arquivo, "w", encoding="utf-8") as saida:
+        json.dump(resultado, saida, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em {arquivo}")
+
+    if opcoes.comparar:
+        with open(opcoes.comparar, encoding="utf-8") as entrada:
+            base = json.load(entrada)
+        if comparar(resultado, base, opcoes.tolerancia):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    from benchmarks.gerador import PERFIS
+
+    argumentos = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    argumentos.add_argument("--db", default="sqlite:///benchmark.db")
+    argumentos.add_argument("--perfil", choices=PERFIS, default="pequeno")
+    argumentos.add_argument("--ativos", type=int, help="Substitui o do perfil.")
+    argumentos.add_argument("--operacoes", type=int, help="Substitui o do perfil.")
+    argumentos.add_argument("--semente", type=int, default=42)
+    argumentos.add_argument("--repeticoes", type=int, default=30)
+    argumentos.add_argument("--aquecimento", type=int, default=3)
+    argumentos.add_argument(
+        "--filtro", help="Mede só os casos com este trecho no nome."
+    )
+    argumentos.add_argument("--saida", default=PASTA_RESULTADOS)
+    argumentos.add_argument("--comparar", help="JSON de uma execução anterior.")
+    argumentos.add_argument(
+        "--tolerancia",
+        type=float,
+        default=20.0,
+        help="Piora aceita em p50/p95 (%%) antes de acusar regressão.",
+    )
+
+    sys.exit(executar(argumentos.parse_args()))
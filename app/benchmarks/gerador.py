@@ -0,0 +1,145 @@
+# benchmarks/gerador.py
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from models import (
+    db,
+    Ativo,
+    Carteira,
+    Operacao,
+    StatusOperacao,
+    TipoAtivo,
+    TipoOperacao,
+)
+
+TIPOS_OPERACAO = ["Compra", "Venda", "Dividendo", "JCP", "Bonificação"]
+TIPOS_ATIVO = ["Ações", "FII", "ETF", "BDR"]
+SEGMENTOS = ["Bancos", "Energia", "Varejo", "Logística", "Papel", "Mineração"]
+
+# Tamanhos aceitos pelo gerador e perfis prontos para os benchmarks
+LIMITES_ATIVOS = (10, 10_000)
+LIMITES_OPERACOES = (1_000, 10_000_000)
+PERFIS = {
+    "pequeno": {"num_ativos": 10, "num_operacoes": 1_000},
+    "medio": {"num_ativos": 100, "num_operacoes": 100_000},
+    "grande": {"num_ativos": 1_000, "num_operacoes": 1_000_000},
+    "maximo": {"num_ativos": 10_000, "num_operacoes": 10_000_000},
+}
+
+
+def gerar_dados(
+    num_carteiras: int = 3,
+    num_ativos: int = 100,
+    num_operacoes: int = 100_000,
+    semente: int = 42,
+    tamanho_lote: int = 10_000,
+    data_inicial: date = date(2015, 1, 2),
+    anos: int = 10,
+) -> dict:
+    """
+    Popula o banco com carteiras, ativos e operações sintéticos.
+
+    A mesma `semente` gera sempre os mesmos dados, para que execuções diferentes
+    do benchmark sejam comparáveis. As operações são inseridas em lotes
+    (executemany) e em ordem cronológica por ativo. As posições não são
+    calculadas (ver gerar_posicoes()).
+    """
+
+    if not LIMITES_ATIVOS[0] <= num_ativos <= LIMITES_ATIVOS[1]:
+        raise ValueError(
+            f"num_ativos deve estar entre {LIMITES_ATIVOS[0]} e {LIMITES_ATIVOS[1]}."
+        )
+    if not LIMITES_OPERACOES[0] <= num_operacoes <= LIMITES_OPERACOES[1]:
+        raise ValueError(
+            f"num_operacoes deve estar entre {LIMITES_OPERACOES[0]} e "
+            f"{LIMITES_OPERACOES[1]}."
+        )
+
+    aleatorio = random.Random(semente)
+
+    # Tabelas de referência, com os IDs fixos esperados pelo cálculo de posição
+    if not db.session.get(TipoOperacao, 1):
+        for i, nome in enumerate(TIPOS_OPERACAO, start=1):
+            db.session.add(TipoOperacao(id=i, nome=nome))
+    if not db.session.get(StatusOperacao, 1):
+        db.session.add_all(
+            [
+                StatusOperacao(id=1, nome="Efetivada"),
+                StatusOperacao(id=2, nome="Agendada"),
+            ]
+        )
+    if not db.session.get(TipoAtivo, 1):
+        for i, nome in enumerate(TIPOS_ATIVO, start=1):
+            db.session.add(TipoAtivo(id=i, nome=nome))
+    db.session.commit()
+
+    carteiras = []
+    for i in range(num_carteiras):
+        carteira = Carteira(nome=f"Carteira Sintética {semente}-{i + 1}")
+        db.session.add(carteira)
+        carteiras.append(carteira)
+
+    ativos = []
+    for i in range(num_ativos):
+        ativo = Ativo(
+            ticker=f"S{semente % 100:02d}{i:04d}"[:7],
+            nome=f"Ativo Sintético {i + 1}",
+            segmento=aleatorio.choice(SEGMENTOS),
+            tipo_id=aleatorio.randint(1, len(TIPOS_ATIVO)),
+        )
+        db.session.add(ativo)
+        ativos.append(ativo)
+    db.session.commit()
+
+    ids_carteiras = [carteira.id for carteira in carteiras]
+    ids_ativos = [ativo.id for ativo in ativos]
+    total_dias = anos * 365
+    # Fixo (e não datetime.now()) para que a ordem de registro se repita
+    registro = datetime.combine(data_inicial, datetime.min.time())
+
+    lote = []
+    for i in range(num_operacoes):
+        data_operacao = data_inicial + timedelta(days=aleatorio.randrange(total_dias))
+        # Compras são mais frequentes que vendas, como numa carteira real
+        tipo_id = 1 if aleatorio.random() < 0.7 else 2
+        quantidade = Decimal(aleatorio.randint(1, 500))
+        preco_unitario = Decimal(aleatorio.randint(100, 20_000)) / 100
+        custos = Decimal(aleatorio.randint(0, 1_000)) / 100
+        lote.append(
+            {
+                "data": data_operacao,
+                "tipo_id": tipo_id,
+                "ativo_id": aleatorio.choice(ids_ativos),
+                "carteira_id": aleatorio.choice(ids_carteiras),
+                "quantidade": quantidade,
+                "preco_unitario": preco_unitario,
+                "custos": custos,
+                "valor_total": quantidade * preco_unitario + custos,
+                "status_id": 1,
+                "registro": registro + timedelta(microseconds=i),
+            }
+        )
+        if len(lote) >= tamanho_lote:
+            db.session.execute(db.insert(Operacao), lote)
+            lote.clear()
+
+    if lote:
+        db.session.execute(db.insert(Operacao), lote)
+    db.session.commit()
+
+    return {
+        "carteiras": ids_carteiras,
+        "ativos": ids_ativos,
+        "operacoes": num_operacoes,
+    }
+
+
+def gerar_posicoes() -> int:
+    """
+    Calcula as posições (e snapshots e ganhos realizados) das operações
+    geradas, reaplicando o histórico de cada uma. Retorna quantas posições.
+    """
+
+    from services.posicao_service import reprocessar_posicoes
+
+    return reprocessar_posicoes()
@@ -0,0 +1,65 @@
+# benchmarks/imposto.py
+"""
+Mede a apuração mensal do imposto sobre um histórico sintético de 10 anos:
+o reprocessamento que grava o livro de ganhos realizados (custo de apurar
+reaplicando as operações) e a apuração a partir do livro já gravado.
+
+Uso (a partir da pasta app/):
+    python -m benchmarks.imposto --db sqlite:///bench.db --operacoes 200000
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+
+def executar(url_banco: str, num_operacoes: int, repeticoes: int):
+    # A URL precisa estar no ambiente antes de carregar a configuração da aplicação
+    os.environ["DB_URL"] = url_banco
+
+    from app import create_app
+    from models import db, GanhoRealizado, Operacao
+    from benchmarks.gerador import gerar_dados
+    from services.imposto_service import apurar_imposto
+    from services.posicao_service import reprocessar_posicoes
+
+    app = create_app()
+
+    with app.app_context():
+        if db.session.query(Operacao.id).limit(1).first() is None:
+            print(f"Gerando {num_operacoes} operações sintéticas (10 anos)...")
+            inicio = time.perf_counter()
+            gerar_dados(num_operacoes=num_operacoes, anos=10)
+            print(f"Dados gerados em {time.perf_counter() - inicio:.1f}s")
+
+        inicio = time.perf_counter()
+        posicoes = reprocessar_posicoes()
+        vendas = db.session.query(GanhoRealizado.operacao_id).count()
+        print(
+            f"Reprocessamento de {posicoes} posições ({vendas} vendas no livro): "
+            f"{time.perf_counter() - inicio:.2f}s"
+        )
+
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            apuracao = apurar_imposto()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+
+        tempos.sort()
+        print(
+            f"Apuração de {len(apuracao['meses'])} meses pelo livro: "
+            f"mediana {statistics.median(tempos):.2f} ms, "
+            f"p95 {tempos[int(len(tempos) * 0.95) - 1 if len(tempos) > 1 else 0]:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    argumentos = argparse.ArgumentParser(description=__doc__)
+    argumentos.add_argument("--db", default="sqlite:///benchmark_imposto.db")
+    argumentos.add_argument("--operacoes", type=int, default=200_000)
+    argumentos.add_argument("--repeticoes", type=int, default=20)
+    opcoes = argumentos.parse_args()
+
+    executar(opcoes.db, opcoes.operacoes, opcoes.repeticoes)
@@ -0,0 +1,131 @@
+# benchmarks/indices_operacoes.py
+"""
+Compara os planos de execução e a latência das consultas de operações com e
+sem os índices compostos de "operacoes".
+
+Uso (a partir da pasta app/):
+    python -m benchmarks.indices_operacoes --db sqlite:///bench.db --operacoes 1000000
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+
+def _plano(db, sql: str, parametros: dict) -> list[str]:
+    if db.engine.dialect.name == "postgresql":
+        linhas = db.session.execute(db.text(f"EXPLAIN ANALYZE {sql}"), parametros)
+        return [linha[0] for linha in linhas]
+
+    linhas = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}"), parametros)
+    return [linha[-1] for linha in linhas]
+
+
+def _medir(db, consulta, parametros: dict, repeticoes: int) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        db.session.execute(consulta, parametros).all()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    tempos.sort()
+    return {
+        "mediana_ms": statistics.median(tempos),
+        "p95_ms": tempos[int(len(tempos) * 0.95) - 1 if len(tempos) > 1 else 0],
+    }
+
+
+def executar(url_banco: str, num_operacoes: int, repeticoes: int):
+    # A URL precisa estar no ambiente antes de carregar a configuração da aplicação
+    os.environ["DB_URL"] = url_banco
+
+    from flask_migrate import upgrade
+    from app import create_app
+    from models import db, Ativo, Operacao
+    from benchmarks.gerador import gerar_dados
+
+    app = create_app()
+
+    with app.app_context():
+        # Índices das tabelas existentes e, no PostgreSQL, o de trigramas do ticker
+        upgrade(directory=os.path.join(app.root_path, "migrations"))
+
+        if db.session.query(Operacao.id).limit(1).first() is None:
+            print(f"Gerando {num_operacoes} operações sintéticas...")
+            inicio = time.perf_counter()
+            gerar_dados(num_operacoes=num_operacoes)
+            print(f"Dados gerados em {time.perf_counter() - inicio:.1f}s")
+
+        ativo = db.session.execute(db.select(Ativo).limit(1)).scalar_one()
+        operacao = db.session.execute(db.select(Operacao).limit(1)).scalar_one()
+        parametros = {
+            "ativo_id": ativo.id,
+            "carteira_id": operacao.carteira_id,
+            "inicio": "2020-01-01",
+            "fim": "2020-12-31",
+            "trecho": "%" + ativo.ticker[1:4] + "%",
+        }
+        # O LIKE do SQLite já não diferencia maiúsculas (em ASCII)
+        ilike = "ILIKE" if db.engine.dialect.name == "postgresql" else "LIKE"
+
+        consultas = {
+            "recalculo da posicao": """
+                SELECT id, data, tipo_id, quantidade, valor_total FROM operacoes
+                WHERE ativo_id = :ativo_id AND carteira_id = :carteira_id
+                ORDER BY data, registro, id
+            """,
+            "listagem por carteira e periodo": """
+                SELECT id FROM operacoes
+                WHERE carteira_id = :carteira_id AND data BETWEEN :inicio AND :fim
+                ORDER BY data DESC LIMIT 10
+            """,
+            "ticker por trecho (subconsulta em ativos)": f"""
+                SELECT id FROM operacoes WHERE ativo_id IN (
+                    SELECT id FROM ativos WHERE ticker {ilike} :trecho
+                ) ORDER BY data DESC LIMIT 10
+            """,
+            "ticker com ILIKE '%x%' (antigo)": """
+                SELECT operacoes.id FROM operacoes
+                JOIN ativos ON ativos.id = operacoes.ativo_id
+                WHERE lower(ativos.ticker) LIKE lower(:trecho)
+                ORDER BY operacoes.data DESC LIMIT 10
+            """,
+        }
+
+        indices = list(Operacao.__table__.indexes)
+
+        for cenario in ("com índices", "sem índices"):
+            if cenario == "sem índices":
+                # Usa a conexão da sessão para que ela enxergue o esquema alterado
+                for indice in indices:
+                    indice.drop(bind=db.session.connection(), checkfirst=True)
+                db.session.commit()
+
+            print(f"\n===== {cenario} =====")
+            for nome, sql in consultas.items():
+                # O comentário muda o texto da consulta e evita reaproveitar
+                # planos preparados no cenário anterior
+                sql = f"{sql} /* {cenario} */"
+                plano = _plano(db, sql, parametros)
+                resultado = _medir(db, db.text(sql), parametros, repeticoes)
+                print(
+                    f"\n{nome}: mediana {resultado['mediana_ms']:.2f} ms, "
+                    f"p95 {resultado['p95_ms']:.2f} ms"
+                )
+                for linha in plano:
+                    print(f"    {linha}")
+
+        for indice in indices:
+            indice.create(bind=db.session.connection(), checkfirst=True)
+        db.session.commit()
+
+
+if __name__ == "__main__":
+    argumentos = argparse.ArgumentParser(description=__doc__)
+    argumentos.add_argument("--db", default="sqlite:///benchmark_operacoes.db")
+    argumentos.add_argument("--operacoes", type=int, default=1_000_000)
+    argumentos.add_argument("--repeticoes", type=int, default=20)
+    opcoes = argumentos.parse_args()
+
+    executar(opcoes.db, opcoes.operacoes, opcoes.repeticoes)
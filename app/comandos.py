@@ -0,0 +1,371 @@
+# comandos.py
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from models import db, Ativo, Carteira
+from services.cotacao_service import atualizar_cotacoes, executar_atualizador
+from services.importacao_service import ler_linhas_csv, importar_operacoes
+from services.analise_service import analisar_carteiras
+from services.valor_diario_service import atualizar_valor_diario
+from services.catalogo_service import atualizar_catalogo_brapi
+from services.evento_service import TIPOS_EVENTO, aplicar_evento_corporativo
+from services.imposto_service import apurar_imposto
+from services.agendamento_service import efetivar_agendadas, executar_agendador
+from services.posicao_service import atualizar_regras_posicao, reprocessar_posicoes
+from services.historico_service import (
+    carregar_historico_provedor,
+    importar_historico_csv,
+    ler_historico,
+)
+from utils.conversao import converter_decimal
+
+cli_cotacoes = AppGroup("cotacoes", help="Atualização das cotações dos ativos.")
+cli_operacoes = AppGroup("operacoes", help="Manutenção das operações.")
+cli_historico = AppGroup("historico", help="Histórico local de preços diários.")
+cli_carteiras = AppGroup("carteiras", help="Valores materializados das carteiras.")
+cli_ativos = AppGroup("ativos", help="Catálogo de ativos da B3.")
+
+
+@cli_cotacoes.command("refresh")
+@click.option(
+    "--loop/--uma-vez",
+    default=False,
+    help="Continua atualizando a cada intervalo, em vez de rodar uma única vez.",
+)
+@click.option("--intervalo", type=int, help="Segundos entre as atualizações.")
+@click.option(
+    "--concorrencia", type=int, help="Máximo de requisições simultâneas ao provedor."
+)
+@click.option(
+    "--fake", is_flag=True, help="Usa cotações simuladas, sem acessar a internet."
+)
+def atualizar_cotacoes_comando(loop, intervalo, concorrencia, fake):
+    """Busca as cotações dos ativos em custódia e grava na tabela de cotações."""
+
+    if fake:
+        current_app.config["COTACOES_PROVEDOR"] = "fake"
+
+    if loop:
+        executar_atualizador(intervalo=intervalo, max_requisicoes=concorrencia)
+    else:
+        quantidade = atualizar_cotacoes(max_requisicoes=concorrencia)
+        click.echo(f"{quantidade} cotações atualizadas.")
+
+
+@cli_operacoes.command("importar")
+@click.argument("arquivo", type=click.File("r", encoding="utf-8-sig"))
+@click.option(
+    "--carteira", help="Nome da carteira das linhas que não informam a carteira."
+)
+@click.option("--dry-run", is_flag=True, help="Apenas valida o arquivo, sem gravar.")
+@click.option(
+    "--lote", type=int, default=1000, show_default=True, help="Linhas por INSERT."
+)
+def importar_operacoes_comando(arquivo, carteira, dry_run, lote):
+    """Importa operações de um extrato CSV da B3 ou da corretora."""
+
+    carteira_id = None
+    if carteira:
+        carteira_id = db.session.execute(
+            db.select(Carteira.id).filter_by(nome=carteira)
+        ).scalar_one_or_none()
+        if carteira_id is None:
+            raise click.BadParameter(f"Carteira '{carteira}' não encontrada.")
+
+    try:
+        resultado = importar_operacoes(
+            ler_linhas_csv(arquivo),
+            carteira_id=carteira_id,
+            dry_run=dry_run,
+            tamanho_lote=lote,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    for numero, erro in resultado["erros"]:
+        click.echo(f"Linha {numero}: {erro}", err=True)
+    for numero in resultado["duplicadas"]:
+        click.echo(f"Linha {numero}: operação já cadastrada, ignorada", err=True)
+
+    acao = "validadas" if dry_run else "importadas"
+    click.echo(
+        f"{resultado['importadas']} de {resultado['linhas']} operações {acao} em "
+        f"{resultado['segundos']:.2f}s ({resultado['linhas_por_segundo']:.0f} linhas/s); "
+        f"{len(resultado['duplicadas'])} já cadastradas; "
+        f"{resultado['posicoes_recalculadas']} posições recalculadas."
+    )
+
+
+@cli_operacoes.command("analise")
+@click.option("--carteira", help="Nome da carteira (padrão: todas).")
+def analisar_operacoes_comando(carteira):
+    """Resume posições, resultado realizado e rentabilidade (TWR e TIR)."""
+
+    carteira_ids = None
+    if carteira:
+        carteira_id = db.session.execute(
+            db.select(Carteira.id).filter_by(nome=carteira)
+        ).scalar_one_or_none()
+        if carteira_id is None:
+            raise click.BadParameter(f"Carteira '{carteira}' não encontrada.")
+        carteira_ids = [carteira_id]
+
+    resultado = analisar_carteiras(carteira_ids)
+
+    for posicao in resultado["posicoes"]:
+        click.echo(
+            f"{posicao['ticker']:<8} carteira {posicao['carteira_id']}: "
+            f"custódia {posicao['custodia']:.2f}, PM {posicao['preco_medio']:.2f}, "
+            f"realizado {posicao['resultado_realizado']:.2f}"
+        )
+
+    twr = "-" if resultado["twr"] is None else f"{resultado['twr']:.2%}"
+    xirr = "-" if resultado["xirr"] is None else f"{resultado['xirr']:.2%} ao ano"
+    click.echo(
+        f"{resultado['operacoes']} operações analisadas em "
+        f"{resultado['segundos']:.2f}s; realizado "
+        f"{resultado['resultado_realizado']:.2f}; proventos "
+        f"{resultado['proventos']:.2f}; TWR {twr}; TIR {xirr}."
+    )
+
+
+@cli_operacoes.command("evento")
+@click.argument("ticker")
+@click.argument("tipo", type=click.Choice(TIPOS_EVENTO, case_sensitive=False))
+@click.argument("data", type=click.DateTime(formats=["%Y-%m-%d", "%d/%m/%Y"]))
+@click.argument("fator")
+@click.option(
+    "--custo", default="0", help="Custo atribuído por ação recebida (bonificação)."
+)
+def aplicar_evento_comando(ticker, tipo, data, fator, custo):
+    """
+    Aplica um evento corporativo a todas as carteiras com o ativo.
+
+    FATOR: 2 em um desdobramento de 1 para 2; 10 em um grupamento de 10 para 1;
+    0.1 em uma bonificação de 10%; o valor por ação em Dividendo e JCP.
+    """
+
+    ativo_id = db.session.execute(
+        db.select(Ativo.id).filter_by(ticker=ticker.strip().upper())
+    ).scalar_one_or_none()
+    if ativo_id is None:
+        raise click.BadParameter(f"Ativo '{ticker}' não encontrado.")
+
+    tipo = next(nome for nome in TIPOS_EVENTO if nome.lower() == tipo.lower())
+    try:
+        operacoes = aplicar_evento_corporativo(
+            ativo_id,
+            tipo,
+            data.date(),
+            converter_decimal(fator),
+            converter_decimal(custo),
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"{tipo} aplicado em {len(operacoes)} carteira(s).")
+
+
+@cli_operacoes.command("agendadas")
+@click.option(
+    "--loop/--uma-vez",
+    default=False,
+    help="Continua verificando a cada intervalo, em vez de rodar uma única vez.",
+)
+@click.option("--intervalo", type=int, help="Segundos entre as verificações.")
+@click.option("--lote", type=int, help="Operações efetivadas por transação.")
+def efetivar_agendadas_comando(loop, intervalo, lote):
+    """
+    Efetiva as operações agendadas cuja data chegou e atualiza as posições.
+    Pode rodar em vários processos ao mesmo tempo.
+    """
+
+    if loop:
+        executar_agendador(intervalo=intervalo, tamanho_lote=lote)
+    else:
+        resultado = efetivar_agendadas(tamanho_lote=lote)
+        click.echo(
+            f"{resultado['operacoes']} operações efetivadas "
+            f"({resultado['posicoes']} posições, {resultado['lotes']} lotes) "
+            f"em {resultado['segundos']:.2f}s."
+        )
+
+
+@cli_operacoes.command("reprocessar")
+@click.option("--carteira", help="Nome da carteira (padrão: todas).")
+@click.option(
+    "--se-desatualizadas",
+    is_flag=True,
+    help="Só reprocessa se as posições foram gravadas por regras de cálculo "
+    "anteriores às atuais (para rodar a cada deploy).",
+)
+def reprocessar_posicoes_comando(carteira, se_desatualizadas):
+    """
+    Reaplica o histórico de todas as posições, refazendo custódia, preço
+    médio, snapshots e o resultado das vendas usado na apuração do imposto.
+    """
+
+    if se_desatualizadas:
+        if carteira:
+            raise click.BadParameter(
+                "--se-desatualizadas vale para todas as carteiras.",
+                param_hint="--carteira",
+            )
+        refeitas = atualizar_regras_posicao()
+        if refeitas is None:
+            click.echo("Posições já calculadas pelas regras atuais.")
+        else:
+            click.echo(f"{refeitas} posições refeitas pelas regras atuais.")
+        return
+
+    carteira_ids = None
+    if carteira:
+        carteira_id = db.session.execute(
+            db.select(Carteira.id).filter_by(nome=carteira)
+        ).scalar_one_or_none()
+        if carteira_id is None:
+            raise click.BadParameter(f"Carteira '{carteira}' não encontrada.")
+        carteira_ids = [carteira_id]
+
+    quantidade = reprocessar_posicoes(carteira_ids)
+    click.echo(f"{quantidade} posições reprocessadas.")
+
+
+@cli_operacoes.command("imposto")
+@click.option("--ano", type=int, help="Ano da apuração (padrão: todos).")
+@click.option("--carteira", help="Nome da carteira (padrão: todas).")
+def apurar_imposto_comando(ano, carteira):
+    """Apuração mensal do imposto de renda sobre as vendas (valores do DARF)."""
+
+    carteira_ids = None
+    if carteira:
+        carteira_id = db.session.execute(
+            db.select(Carteira.id).filter_by(nome=carteira)
+        ).scalar_one_or_none()
+        if carteira_id is None:
+            raise click.BadParameter(f"Carteira '{carteira}' não encontrada.")
+        carteira_ids = [carteira_id]
+
+    apuracao = apurar_imposto(carteira_ids, ano)
+
+    for mes in apuracao["meses"]:
+        isencao = f", isento {mes['ganho_isento']:.2f}" if mes["ganho_isento"] else ""
+        click.echo(
+            f"{mes['mes']:%m/%Y}: vendas de ações {mes['vendas_acoes']:.2f}{isencao}; "
+            f"imposto {mes['imposto']:.2f}; DARF {mes['darf']:.2f}"
+        )
+        for grupo, valores in mes["grupos"].items():
+            if valores["resultado"] or valores["prejuizo_compensado"]:
+                click.echo(
+                    f"    {grupo:<10} resultado {valores['resultado']:>12.2f}  "
+                    f"compensado {valores['prejuizo_compensado']:>10.2f}  "
+                    f"imposto {valores['imposto']:>10.2f}"
+                )
+
+    prejuizos = ", ".join(
+        f"{grupo} {valor:.2f}" for grupo, valor in apuracao["prejuizos"].items()
+    )
+    click.echo(
+        f"{len(apuracao['meses'])} meses apurados em "
+        f"{apuracao['segundos'] * 1000:.1f} ms; prejuízos a compensar: {prejuizos}; "
+        f"imposto abaixo do mínimo: {apuracao['imposto_pendente']:.2f}."
+    )
+
+
+@cli_historico.command("backfill")
+@click.argument("tickers", nargs=-1)
+@click.option(
+    "--periodo",
+    default="5y",
+    show_default=True,
+    help="Período pedido ao provedor (1mo, 1y, 5y, max...).",
+)
+@click.option(
+    "--fake", is_flag=True, help="Gera um histórico simulado, sem acessar a internet."
+)
+def carregar_historico_comando(tickers, periodo, fake):
+    """Carrega do provedor o histórico diário dos tickers (padrão: todos os ativos)."""
+
+    if fake:
+        current_app.config["COTACOES_PROVEDOR"] = "fake"
+
+    if not tickers:
+        tickers = db.session.execute(db.select(Ativo.ticker)).scalars().all()
+
+    resultado = carregar_historico_provedor(list(tickers), periodo=periodo)
+    for ticker, pregoes in sorted(resultado.items()):
+        click.echo(f"{ticker}: {pregoes} pregões")
+
+    faltando = {ticker.strip().upper() for ticker in tickers} - set(resultado)
+    if faltando:
+        click.echo(f"Sem histórico: {', '.join(sorted(faltando))}", err=True)
+
+
+@cli_historico.command("importar")
+@click.argument("arquivo", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--ticker", help="Ticker das barras, se o CSV não tiver a coluna.")
+def importar_historico_comando(arquivo, ticker):
+    """Importa barras diárias de um arquivo CSV (uso offline)."""
+
+    try:
+        resultado = importar_historico_csv(arquivo, ticker=ticker)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    for codigo, pregoes in sorted(resultado.items()):
+        click.echo(f"{codigo}: {pregoes} pregões")
+
+
+@cli_historico.command("mostrar")
+@click.argument("ticker")
+@click.option("--inicio", type=click.DateTime(["%Y-%m-%d"]), help="AAAA-MM-DD")
+@click.option("--fim", type=click.DateTime(["%Y-%m-%d"]), help="AAAA-MM-DD")
+def mostrar_historico_comando(ticker, inicio, fim):
+    """Lista as barras diárias de um ticker no período."""
+
+    barras = ler_historico(
+        ticker, inicio.date() if inicio else None, fim.date() if fim else None
+    )
+    for indice, data in enumerate(barras["datas"]):
+        click.echo(
+            f"{data}  A {barras['abertura'][indice]:.2f}  "
+            f"M {barras['maxima'][indice]:.2f}  m {barras['minima'][indice]:.2f}  "
+            f"F {barras['fechamento'][indice]:.2f}  V {barras['volume'][indice]:.0f}"
+        )
+
+
+@cli_carteiras.command("valor-diario")
+@click.option(
+    "--ate", type=click.DateTime(["%Y-%m-%d"]), help="Último dia (padrão: ontem)."
+)
+@click.option("--carteira", help="Nome da carteira (padrão: todas).")
+@click.option("--refazer", is_flag=True, help="Recalcula todo o histórico.")
+def atualizar_valor_diario_comando(ate, carteira, refazer):
+    """Grava o valor diário das carteiras (job noturno, incremental)."""
+
+    carteira_ids = None
+    if carteira:
+        carteira_id = db.session.execute(
+            db.select(Carteira.id).filter_by(nome=carteira)
+        ).scalar_one_or_none()
+        if carteira_id is None:
+            raise click.BadParameter(f"Carteira '{carteira}' não encontrada.")
+        carteira_ids = [carteira_id]
+
+    gravados = atualizar_valor_diario(
+        carteira_ids, ate=ate.date() if ate else None, refazer=refazer
+    )
+    for carteira_id, dias in gravados.items():
+        click.echo(f"Carteira {carteira_id}: {dias} dias gravados.")
+
+
+@cli_ativos.command("catalogo")
+def atualizar_catalogo_comando():
+    """Atualiza o catálogo local de ativos da B3 a partir da lista da brapi."""
+
+    try:
+        quantidade = atualizar_catalogo_brapi()
+    except Exception as e:
+        raise click.ClickException(f"Erro ao atualizar o catálogo: {e}")
+
+    click.echo(f"{quantidade} ativos gravados no catálogo.")
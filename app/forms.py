@@ -1,16 +1,29 @@
 from flask_wtf import FlaskForm
-from wtforms import DecimalField, DateField, SubmitField, SelectField, StringField
-from wtforms.validators import DataRequired, NumberRange
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import (
+    BooleanField,
+    DecimalField,
+    DateField,
+    SubmitField,
+    HiddenField,
+    SelectField,
+    StringField,
+)
+from wtforms.validators import DataRequired, NumberRange, ValidationError
 from wtforms.widgets import NumberInput
 from decimal import Decimal
+from models import db, Ativo
 
 
 class OperacaoForm(FlaskForm):
     # Campo para a data da operação
     data_operacao = DateField("Data da Operação", validators=[DataRequired()])
 
-    # Campo para o ticker do ativo
-    ativo = SelectField("Ticker do Ativo", validators=[DataRequired()])
+    # Ticker digitado na busca; o ativo é o escolhido entre as sugestões
+    ativo_busca = StringField("Ticker do Ativo")
+    ativo = HiddenField(
+        validators=[DataRequired("Selecione o ativo entre as sugestões da busca.")]
+    )
 
     # Campo para o tipo de operação (compra, venda, etc.)
     tipo = SelectField("Tipo de Operação", validators=[DataRequired()])
@@ -43,6 +56,15 @@ class OperacaoForm(FlaskForm):
     # Botão de envio do formulário
     submit = SubmitField("Registrar Operação")
 
+    def validate_ativo(self, campo):
+        # O id vem do navegador: precisa ser de um ativo cadastrado
+        try:
+            ativo = db.session.get(Ativo, int(campo.data))
+        except (TypeError, ValueError):
+            ativo = None
+        if ativo is None:
+            raise ValidationError("Ativo não encontrado; selecione-o na busca.")
+
 
 class FormularioAtivo(FlaskForm):
     ativo_ticker = StringField("Ticker do Ativo", validators=[DataRequired()])
@@ -52,3 +74,23 @@ class FormularioAtivo(FlaskForm):
 
     # Botão de envio do formulário
     submit = SubmitField("Registrar Ativo")
+
+
+class FormularioImportacao(FlaskForm):
+    # Extrato em CSV (B3/corretora) com uma operação por linha
+    arquivo = FileField(
+        "Arquivo CSV",
+        validators=[
+            FileRequired(),
+            FileAllowed(["csv", "txt"], "Envie um arquivo CSV."),
+        ],
+    )
+
+    # Carteira usada nas linhas que não informam a carteira
+    carteira = SelectField("Carteira", validators=[DataRequired()])
+
+    # Apenas valida o arquivo, sem gravar as operações
+    dry_run = BooleanField("Apenas validar (não gravar)")
+
+    # Botão de envio do formulário
+    submit = SubmitField("Importar Operações")
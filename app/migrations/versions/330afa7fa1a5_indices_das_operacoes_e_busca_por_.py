@@ -0,0 +1,87 @@
+"""indices das operacoes e busca por trecho do ticker
+
+Índices das consultas de recálculo da posição, da listagem de operações
+(filtro por carteira e período, paginação por cursor) e da listagem de
+ativos, criados nas tabelas que já existiam. No PostgreSQL, os índices são
+criados com CONCURRENTLY (sem bloquear as gravações) e a busca por trecho do
+ticker (ILIKE '%x%') ganha um índice de trigramas (pg_trgm), que substitui o
+antigo índice por prefixo.
+
+Em bancos novos, o db.create_all() da inicialização já cria as tabelas com
+os índices declarados nos modelos; aqui eles são ignorados (IF NOT EXISTS).
+
+Revision ID: 330afa7fa1a5
+Revises:
+Create Date: 2026-10-18 15:29:02.752132
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "330afa7fa1a5"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDICES = [
+    (
+        "ix_operacoes_ativo_carteira_data",
+        "operacoes",
+        ["ativo_id", "carteira_id", "data", "registro"],
+    ),
+    ("ix_operacoes_carteira_data", "operacoes", ["carteira_id", "data"]),
+    ("ix_operacoes_data_id", "operacoes", ["data", "id"]),
+    ("ix_ativos_nome_id", "ativos", ["nome", "id"]),
+]
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == "postgresql"
+    if postgresql:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # CREATE INDEX CONCURRENTLY não pode rodar dentro de uma transação
+    with op.get_context().autocommit_block():
+        for nome, tabela, colunas in INDICES:
+            op.create_index(
+                nome,
+                tabela,
+                colunas,
+                if_not_exists=True,
+                postgresql_concurrently=postgresql,
+            )
+
+        if postgresql:
+            op.create_index(
+                "ix_ativos_ticker_trgm",
+                "ativos",
+                ["ticker"],
+                if_not_exists=True,
+                postgresql_using="gin",
+                postgresql_ops={"ticker": "gin_trgm_ops"},
+                postgresql_concurrently=True,
+            )
+        op.drop_index(
+            "ix_ativos_ticker_prefixo",
+            table_name="ativos",
+            if_exists=True,
+            postgresql_concurrently=postgresql,
+        )
+
+
+def downgrade():
+    postgresql = op.get_bind().dialect.name == "postgresql"
+
+    indices = [("ix_ativos_ticker_trgm", "ativos")]
+    indices += [(nome, tabela) for nome, tabela, _ in INDICES]
+    with op.get_context().autocommit_block():
+        for nome, tabela in indices:
+            op.drop_index(
+                nome,
+                table_name=tabela,
+                if_exists=True,
+                postgresql_concurrently=postgresql,
+            )
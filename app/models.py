@@ -1,10 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
 from decimal import Decimal
+from utils.replica import SessaoRoteada
 
 # from typing import Optional
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": SessaoRoteada})
 
 
 class PosicaoAtivo(db.Model):
@@ -21,6 +22,96 @@ class PosicaoAtivo(db.Model):
         super().__init__(**kwargs)
 
 
+# Estado da posição após a N-ésima operação (na ordem data, registro, id), usado
+# para recalcular a posição a partir de um ponto intermediário do histórico
+class PosicaoSnapshot(db.Model):
+    __tablename__ = "posicao_snapshots"
+    id = db.Column(db.Integer, primary_key=True)
+    carteira_id = db.Column(db.Integer, db.ForeignKey("carteiras.id"), nullable=False)
+    ativo_id = db.Column(db.Integer, db.ForeignKey("ativos.id"), nullable=False)
+    # Chave de ordenação da última operação aplicada
+    data = db.Column(db.Date, nullable=False)
+    registro = db.Column(db.DateTime, nullable=False)
+    operacao_id = db.Column(db.Integer, nullable=False)
+    num_operacoes = db.Column(db.Integer, nullable=False)
+    # Precisão maior que a da posição para não acumular arredondamentos
+    custodia = db.Column(db.Numeric(38, 18), nullable=False)
+    preco_medio = db.Column(db.Numeric(38, 18), nullable=False)
+
+    __table_args__ = (
+        db.Index(
+            "ix_posicao_snapshots_posicao_data", "ativo_id", "carteira_id", "data"
+        ),
+    )
+
+
+# Versão de cada conjunto de dados, incrementada a cada gravação. Permite que
+# caches de outros processos percebam a alteração sem recarregar as tabelas
+class VersaoDados(db.Model):
+    __tablename__ = "versao_dados"
+    nome = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Valor da carteira ao fim de cada dia útil, materializado pelo job noturno
+# (services/valor_diario_service.py) para os gráficos de evolução
+class CarteiraValorDiario(db.Model):
+    __tablename__ = "carteira_valor_diario"
+    carteira_id = db.Column(db.Integer, db.ForeignKey("carteiras.id"), primary_key=True)
+    data = db.Column(db.Date, primary_key=True)
+    valor_investido = db.Column(db.Numeric(15, 2), nullable=False)
+    valor_mercado = db.Column(db.Numeric(15, 2), nullable=False)
+    lucro_prejuizo = db.Column(db.Numeric(15, 2), nullable=False)
+
+    __table_args__ = (
+        # Série somando todas as carteiras (a chave primária cobre a de uma carteira)
+        db.Index("ix_carteira_valor_diario_data", "data"),
+    )
+
+
+# Resultado de cada venda para a apuração do imposto de renda, separado em
+# operação comum e day trade. Gravado pelo recálculo das posições
+# (services/posicao_service.py) e somado por mês em services/imposto_service.py
+class GanhoRealizado(db.Model):
+    __tablename__ = "ganhos_realizados"
+    operacao_id = db.Column(
+        db.Integer,
+        db.ForeignKey("operacoes.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    carteira_id = db.Column(db.Integer, db.ForeignKey("carteiras.id"), nullable=False)
+    ativo_id = db.Column(db.Integer, db.ForeignKey("ativos.id"), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    # Operação comum: quantidade, valor bruto da venda e resultado (após custos)
+    quantidade = db.Column(db.Numeric(15, 5), nullable=False)
+    valor_venda = db.Column(db.Numeric(15, 2), nullable=False)
+    resultado = db.Column(db.Numeric(15, 2), nullable=False)
+    # Parte casada com compras do mesmo dia
+    quantidade_day_trade = db.Column(db.Numeric(15, 5), nullable=False)
+    valor_venda_day_trade = db.Column(db.Numeric(15, 2), nullable=False)
+    resultado_day_trade = db.Column(db.Numeric(15, 2), nullable=False)
+
+    __table_args__ = (
+        # Apuração mensal (por período) e recálculo de uma posição
+        db.Index("ix_ganhos_realizados_data", "data"),
+        db.Index(
+            "ix_ganhos_realizados_posicao_data", "ativo_id", "carteira_id", "data"
+        ),
+    )
+
+
+# Nome e segmento de cada ticker obtidos do provedor de metadados
+# (services/metadados_service.py). Tickers não encontrados também são gravados
+# (encontrado=False) para não repetir a consulta a cada tentativa
+class TickerMetadados(db.Model):
+    __tablename__ = "ticker_metadados"
+    ticker = db.Column(db.String(20), primary_key=True)
+    nome = db.Column(db.String(100))
+    segmento = db.Column(db.String(100))
+    encontrado = db.Column(db.Boolean, nullable=False)
+    consultado_em = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
 class Carteira(db.Model):
     __tablename__ = "carteiras"
     id = db.Column(db.Integer, primary_key=True)
@@ -41,9 +132,27 @@ class Ativo(db.Model):
 
     posicoes_ativos = db.relationship("PosicaoAtivo", back_populates="ativo")
     operacoes = db.relationship("Operacao", back_populates="ativo")
+
+    __table_args__ = (
+        # Busca por trecho do ticker (ILIKE '%ETR%') no PostgreSQL, com trigramas.
+        # Depende da extensão pg_trgm, por isso só é criado pela migração
+        # (flask db upgrade), não pelo db.create_all(). Nos outros bancos a
+        # tabela é pequena e é percorrida inteira
+        db.Index(
+            "ix_ativos_ticker_trgm",
+            "ticker",
+            postgresql_using="gin",
+            postgresql_ops={"ticker": "gin_trgm_ops"},
+        ).ddl_if(callable_=lambda *args, **kwargs: False),
+        # Paginação por cursor da listagem de ativos (ordem por nome, id)
+        db.Index("ix_ativos_nome_id", "nome", "id"),
+    )
     # AQUI ESTÁ A CORREÇÃO: ADICIONE ESTA LINHA!
     # "tipo_ativo" é o nome da relação que o outro modelo espera
     tipo_ativo = db.relationship("TipoAtivo", back_populates="ativos")
+    cotacao = db.relationship(
+        "Cotacao", back_populates="ativo", uselist=False, cascade="all, delete-orphan"
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -52,6 +161,19 @@ class Ativo(db.Model):
         return f"<Ativo: {self.ticker}>"
 
 
+# Última cotação conhecida de cada ativo, gravada pelo atualizador de cotações
+class Cotacao(db.Model):
+    __tablename__ = "cotacoes"
+    ativo_id = db.Column(db.Integer, db.ForeignKey("ativos.id"), primary_key=True)
+    preco = db.Column(db.Numeric(15, 5), nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    ativo = db.relationship("Ativo", back_populates="cotacao")
+
+    def __repr__(self):
+        return f"<Cotacao: {self.ativo_id} = {self.preco}>"
+
+
 class TipoAtivo(db.Model):
     __tablename__ = "tipos_ativos"
     id = db.Column(db.Integer, primary_key=True)
@@ -101,6 +223,21 @@ class Operacao(db.Model):
     carteira = db.relationship("Carteira", back_populates="operacoes")
     status_operacao = db.relationship("StatusOperacao", back_populates="operacoes")
 
+    __table_args__ = (
+        # Recálculo da posição: filtra (ativo, carteira) e ordena por (data, registro)
+        db.Index(
+            "ix_operacoes_ativo_carteira_data",
+            "ativo_id",
+            "carteira_id",
+            "data",
+            "registro",
+        ),
+        # Listagem filtrada por carteira e período
+        db.Index("ix_operacoes_carteira_data", "carteira_id", "data"),
+        # Paginação por cursor da listagem de operações (ordem por data, id)
+        db.Index("ix_operacoes_data_id", "data", "id"),
+    )
+
     @property
     def valor_total_calculado(self):
         return (self.quantidade * self.preco_unitario) + self.custos
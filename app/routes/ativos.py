@@ -1,3 +1,4 @@
+import logging
 from flask import (
     Blueprint,
     render_template,
@@ -9,9 +10,17 @@ from flask import (
     current_app,
     request,
 )
-from models import db, Ativo, TipoAtivo
+from models import db, Ativo
 from forms import FormularioAtivo
 from sqlalchemy.exc import IntegrityError
+from services.referencia_service import opcoes, registrar_alteracao
+from services.metadados_service import consultar_metadados, ConsultaIndisponivel
+from services.catalogo_service import buscar_no_catalogo, buscar_ativos_cadastrados
+from utils.paginacao import paginar_keyset, contar_registros
+from utils.cache_paginas import cache_pagina
+from utils.replica import somente_leitura
+
+logger = logging.getLogger(__name__)
 
 
 bp_ativos = Blueprint("ativos", __name__, url_prefix="/ativo")
@@ -19,11 +28,25 @@ bp_ativos = Blueprint("ativos", __name__, url_prefix="/ativo")
 
 @bp_ativos.route("/", methods=["GET", "POST"])
 @bp_ativos.route("/<int:page>")
-def exibir_ativos(page=1):
+@somente_leitura
+@cache_pagina("ativos", "tipos_ativo")
+def exibir_ativos(page=None):
     PER_PAGE = 10
     query = db.select(Ativo)
     query = query.order_by(Ativo.nome.asc())
-    ativos_paginados = db.paginate(query, page=page, per_page=PER_PAGE)
+
+    # Com número de página na URL (ou no modo "offset"), mantém a paginação antiga
+    if page is not None or current_app.config["PAGINACAO_MODO"] == "offset":
+        ativos_paginados = db.paginate(query, page=page or 1, per_page=PER_PAGE)
+    else:
+        ativos_paginados = paginar_keyset(
+            query,
+            [Ativo.nome, Ativo.id],
+            cursor=request.args.get("cursor"),
+            direcao=request.args.get("direcao", "next"),
+            por_pagina=PER_PAGE,
+            total=contar_registros(query, exato=request.args.get("contar") == "1"),
+        )
     return render_template(
         "ativos_listar.html",
         ativos=ativos_paginados.items,
@@ -35,8 +58,7 @@ def exibir_ativos(page=1):
 def adicionar_ativo():
     formulario = FormularioAtivo()
 
-    tipos_ativo = db.session.execute(db.select(TipoAtivo)).scalars().all()
-    formulario.tipo_ativo.choices = [(tipo.id, tipo.nome) for tipo in tipos_ativo]
+    formulario.tipo_ativo.choices = opcoes("tipos_ativo")
 
     if formulario.validate_on_submit():
         try:
@@ -47,6 +69,7 @@ def adicionar_ativo():
                 tipo_id=formulario.tipo_ativo.data,
             )
             db.session.add(novo_ativo)
+            registrar_alteracao("ativos")
             db.session.commit()
 
             mensagem = f'Ativo cadastrado com sucesso! <a href="{url_for('ativos.exibir_ativos')}">\
@@ -71,61 +94,37 @@ def adicionar_ativo():
 
 @bp_ativos.route("/consultar_ticker/<string:ticker>", methods=["GET"])
 def consultar_ticker(ticker):
-    ticker = ticker.strip().upper()
-
-    print(f"🔍 Consultando: {ticker}")
-
-    api_key = current_app.config.get("SERPAPI_API_KEY")
-
     try:
-        # Remove qualquer sufixo existente e adiciona :BVMF
-        ticker_clean = (
-            ticker.replace(".SAO", "").replace(".SA", "").replace(".BVMF", "")
-        )
-        ticker_query = f"{ticker_clean}:BVMF"
-
-        print(f"📊 Query formatada: {ticker_query}")
-
-        # Usa a biblioteca serpapi como você sugeriu
-        from serpapi import GoogleSearch
-
-        params = {
-            "api_key": api_key,
-            "engine": "google_finance",
-            "q": ticker_query,
-            "hl": "pt-br",
-        }
-
-        search = GoogleSearch(params)
-        results = search.get_dict()
-
-        print(f"📋 Estrutura da resposta: {list(results.keys())}")
+        metadados = consultar_metadados(ticker)
+    except ConsultaIndisponivel as e:
+        logger.warning("Erro ao consultar o ticker %s: %s", ticker, e)
+        return jsonify(nome="Erro na consulta", segmento="Tente novamente")
 
-        # VERIFICA SE EXISTE SUMMARY
-        if "summary" in results:
-            summary = results["summary"]
-            print(f"📊 Dados do summary: {summary}")
+    if metadados is None:
+        return jsonify(nome="Não Encontrado", segmento="Ticker inválido")
 
-            nome = summary.get("title", "Não Encontrado")
-            # Para segmento, podemos usar exchange + currency
-            segmento = ""
+    return jsonify(nome=metadados["nome"], segmento=metadados["segmento"])
 
-            print(f"✅ Encontrado: {nome} - {segmento}")
 
-            return jsonify(nome=nome, segmento=segmento)
-        else:
-            print("❌ Summary não encontrado na resposta")
-            return jsonify(nome="Não Encontrado", segmento="Ticker inválido")
+@bp_ativos.route("/buscar", methods=["GET"])
+@somente_leitura
+def buscar_ativos():
+    """
+    Autocompletar: ativos do catálogo da B3 (ou, com cadastrados=1, só os já
+    cadastrados) para o texto em `q`, aceitando pequenos erros de digitação.
+    """
 
-    except Exception as e:
-        print(f"❌ Erro: {e}")
-        import traceback
+    consulta = request.args.get("q", "")
+    limite = min(request.args.get("limite", 10, type=int), 50)
 
-        traceback.print_exc()
-        return jsonify(nome="Erro na consulta", segmento="Tente novamente")
+    if request.args.get("cadastrados") == "1":
+        return jsonify(buscar_ativos_cadastrados(consulta, limite))
+    return jsonify(buscar_no_catalogo(consulta, limite))
 
 
 @bp_ativos.route("/exibir/<int:ativo_id>", methods=["GET"])
+@somente_leitura
+@cache_pagina("ativos", "tipos_ativo")
 def mostrar_ativo(ativo_id):
     ativo_especifico = db.session.get(Ativo, ativo_id)
 
@@ -143,10 +142,8 @@ def editar_ativo(ativo_id):
         flash("Ativo não encontrado.", "danger")
         return redirect(url_for("ativos.exibir_ativos"))
 
-    tipos = db.session.execute(db.select(TipoAtivo)).scalars().all()
-
     formulario_ativo = FormularioAtivo()
-    formulario_ativo.tipo_ativo.choices = [(t.id, t.nome) for t in tipos]
+    formulario_ativo.tipo_ativo.choices = opcoes("tipos_ativo")
 
     if request.method == "GET":
         formulario_ativo.ativo_ticker.data = ativo_para_editar.ticker
@@ -160,6 +157,7 @@ def editar_ativo(ativo_id):
         ativo_para_editar.segmento = formulario_ativo.segmento.data
         ativo_para_editar.tipo_id = formulario_ativo.tipo_ativo.data
 
+        registrar_alteracao("ativos")
         db.session.commit()
         flash("Operação atualizada com sucesso!", "success")
         return redirect(url_for("ativos.editar_ativo", ativo_id=ativo_id))
@@ -178,6 +176,7 @@ def deletar_ativo(ativo_id):
 
     try:
         db.session.delete(ativo)
+        registrar_alteracao("ativos")
         db.session.commit()
         flash("Ativo excluído com sucesso.", "success")
         return redirect(url_for("ativos.exibir_ativos"))
@@ -1,100 +1,36 @@
 # routes/main.py
-from flask import Blueprint, jsonify, render_template
-from models import Carteira, PosicaoAtivo, TipoAtivo
-from collections import defaultdict
+from datetime import date, datetime
 from decimal import Decimal
-from services.api_service import buscar_cotacao_atual
+from flask import Blueprint, abort, current_app, jsonify, render_template, request
+from models import db, Carteira
+from services.agendamento_service import contar_agendadas, obter_metricas_agendamento
+from services.dashboard_service import montar_dados_dashboard
+from services.valor_diario_service import consultar_valor_diario
+from services.transmissao_service import obter_transmissor, transmitir
+from services.versao_service import obter_versoes
+from utils.instrumentacao import metricas
+from utils.replica import somente_leitura
+from utils.respostas import cliente_tem_versao, comprimir, gerar_etag
 
 bp_inicio = Blueprint("main", __name__)
 
 
 @bp_inicio.route("/")
+@somente_leitura
 def dashboard():
-    posicoes = PosicaoAtivo.query.all()
-
-    dados_dashboard = []
-
-    total_investido = 0
-    total_valor_atual = 0
-    total_valor_mercado = Decimal("0")  # NOVO TOTAL
-    carteira_valor_atual = 0
-
-    # Dicionários para dados dos gráficos
-    distribuicao_por_tipo = defaultdict(float)
-    distribuicao_por_segmento = defaultdict(float)
-
-    for posicao in posicoes:
-        if posicao.custodia == 0:
-            continue
-
-        valor_investido_posicao = posicao.custodia * posicao.preco_medio
-        total_investido += valor_investido_posicao
-
-        # 2. BUSCA COTAÇÃO ATUAL
-        preco_atual = buscar_cotacao_atual(posicao.ativo.ticker)
-
-        # 3. CÁLCULO DE VALORIZAÇÃO
-        valor_mercado_posicao = posicao.custodia * preco_atual
-        total_valor_mercado += valor_mercado_posicao
-
-        lucro_prejuizo_posicao = valor_mercado_posicao - valor_investido_posicao
-
-        # Evita divisão por zero se o valor investido for 0
-        if valor_investido_posicao == 0:
-            percentual_valorizacao = Decimal("0")
-        else:
-            percentual_valorizacao = (
-                lucro_prejuizo_posicao / valor_investido_posicao
-            ) * Decimal("100")
-
-        # O valor atual será o valor investido por enquanto
-        valor_atual_posicao = valor_investido_posicao
-        total_valor_atual += valor_atual_posicao
-
-        # Adiciona o valor investido para o tipo e segmento correspondentes
-        tipo_ativo = TipoAtivo.query.get(posicao.ativo.tipo_id)
-        segmento_ativo = posicao.ativo.segmento
-
-        # 4. AGRUPAMENTO PARA GRÁFICOS
-        distribuicao_por_tipo[tipo_ativo] += float(
-            valor_mercado_posicao
-        )  # Use float para o gráfico, mas mantenha Decimal no resto
-        distribuicao_por_segmento[segmento_ativo] += float(valor_investido_posicao)
-
-        # 5. ADICIONA OS DADOS À LISTA
-        dados_dashboard.append(
-            {
-                "ticker": posicao.ativo.ticker,
-                "nome": posicao.ativo.nome,
-                "custodia": posicao.custodia,
-                "preco_medio": posicao.preco_medio,
-                "preco_atual": preco_atual,  # NOVO
-                "valor_investido": valor_investido_posicao,
-                "valor_mercado": valor_mercado_posicao,  # NOVO
-                "lucro_prejuizo": lucro_prejuizo_posicao,  # NOVO
-                "percentual_valorizacao": percentual_valorizacao,  # NOVO
-                "tipo": tipo_ativo,
-            }
-        )
-    lucro_prejuizo_total = total_valor_mercado - total_investido
-
-    print(dados_dashboard)
-    print()
+    dados_dashboard = montar_dados_dashboard()
 
-    lucro_prejuizo = total_valor_atual - total_investido
-
-    print(total_investido, lucro_prejuizo)
     # Renderize o template, passando os NOVOS dados
     return render_template(
         "index.html",
-        total_valor_mercado=total_valor_mercado,
-        lucro_prejuizo=lucro_prejuizo_total,
-        dados=dados_dashboard,
-        total_investido=total_investido,
+        total_valor_mercado=dados_dashboard["total_valor_mercado"],
+        lucro_prejuizo=dados_dashboard["lucro_prejuizo"],
+        dados=dados_dashboard["dados"],
+        total_investido=dados_dashboard["total_investido"],
         # Dados para os gráficos
-        distribuicao_por_tipo=distribuicao_por_tipo,
-        distribuicao_por_segmento=distribuicao_por_segmento,
-        carteira_valor_atual=carteira_valor_atual,
+        distribuicao_por_tipo=dados_dashboard["distribuicao_por_tipo"],
+        distribuicao_por_segmento=dados_dashboard["distribuicao_por_segmento"],
+        carteira_valor_atual=0,
     )
 
 
@@ -102,6 +38,7 @@ def dashboard():
 
 
 @bp_inicio.route("/carteiras")
+@somente_leitura
 def listar_carteiras():
     carteiras = Carteira.query.all()
     return jsonify(
@@ -110,3 +47,135 @@ def listar_carteiras():
             for c in carteiras
         ]
     )
+
+
+@bp_inicio.route("/api/valor_diario")
+@somente_leitura
+def valor_diario():
+    """Série diária de valores (de uma carteira ou de todas) para os gráficos."""
+
+    try:
+        inicio = request.args.get("inicio")
+        fim = request.args.get("fim")
+        inicio = date.fromisoformat(inicio) if inicio else None
+        fim = date.fromisoformat(fim) if fim else None
+    except ValueError:
+        return jsonify(erro="Datas devem estar no formato AAAA-MM-DD."), 400
+
+    serie = consultar_valor_diario(
+        request.args.get("carteira_id", type=int), inicio, fim
+    )
+    return jsonify(serie)
+
+
+@bp_inicio.route("/api/agendadas")
+@somente_leitura
+def agendadas():
+    """
+    Operações agendadas pendentes (vencidas e futuras) e os totais do executor
+    neste processo (quando ele roda embutido, AGENDADAS_EMBUTIDO=1).
+    """
+
+    return jsonify(
+        pendentes=contar_agendadas(),
+        executor=obter_metricas_agendamento().resumo(),
+    )
+
+
+@bp_inicio.route("/metrics")
+def exportar_metricas():
+    """Métricas deste processo no formato texto do Prometheus."""
+
+    executor = obter_metricas_agendamento().resumo()
+    linhas = [metricas.exportar()]
+    for nome, ajuda in (
+        ("execucoes", "Execuções do executor de operações agendadas."),
+        ("erros", "Execuções do executor de operações agendadas que falharam."),
+        ("operacoes_efetivadas", "Operações agendadas efetivadas."),
+        ("posicoes_recalculadas", "Posições recalculadas pelo executor."),
+    ):
+        linhas.append(
+            f"# HELP agendadas_{nome}_total {ajuda}\n"
+            f"# TYPE agendadas_{nome}_total counter\n"
+            f"agendadas_{nome}_total {executor[nome]}\n"
+        )
+
+    return current_app.response_class(
+        "".join(linhas), mimetype="text/plain; version=0.0.4"
+    )
+
+
+@bp_inicio.route("/api/dashboard")
+@bp_inicio.route("/api/dashboard/<int:carteira_id>")
+@somente_leitura
+def api_dashboard(carteira_id=None):
+    """
+    Posições, totais e distribuições do dashboard (de uma carteira ou de todas).
+
+    O ETag vem das versões das operações, das cotações e dos ativos: enquanto
+    nada disso muda, a resposta é 304 sem montar os dados de novo.
+    """
+
+    if carteira_id is not None and db.session.get(Carteira, carteira_id) is None:
+        abort(404)
+
+    versoes = obter_versoes()
+    etag = gerar_etag(
+        "dashboard",
+        carteira_id,
+        versoes.get("operacoes", 0),
+        versoes.get("cotacoes", 0),
+        versoes.get("ativos", 0),
+    )
+
+    if cliente_tem_versao(etag):
+        resposta = current_app.response_class(status=304)
+    else:
+        dados_dashboard = montar_dados_dashboard(carteira_id)
+        resposta = jsonify(
+            carteira_id=carteira_id,
+            posicoes=[
+                {campo: _para_json(valor) for campo, valor in posicao.items()}
+                for posicao in dados_dashboard["dados"]
+            ],
+            total_investido=float(dados_dashboard["total_investido"]),
+            total_valor_mercado=float(dados_dashboard["total_valor_mercado"]),
+            lucro_prejuizo=float(dados_dashboard["lucro_prejuizo"]),
+            distribuicao_por_tipo=dados_dashboard["distribuicao_por_tipo"],
+            distribuicao_por_segmento=dados_dashboard["distribuicao_por_segmento"],
+        )
+
+    # O navegador sempre revalida (If-None-Match) antes de usar a cópia local
+    resposta.set_etag(etag, weak=True)
+    resposta.cache_control.no_cache = True
+    return comprimir(resposta)
+
+
+@bp_inicio.route("/api/stream/cotacoes")
+def stream_cotacoes():
+    """
+    Server-sent events com as cotações e o resultado das posições: o estado
+    completo ao conectar e, depois, só o que mudar (opcionalmente de uma carteira).
+    """
+
+    transmissor = obter_transmissor()
+    assinante = transmissor.assinar(request.args.get("carteira_id", type=int))
+
+    resposta = current_app.response_class(
+        transmitir(
+            transmissor, assinante, current_app.config["COTACOES_STREAM_HEARTBEAT"]
+        ),
+        mimetype="text/event-stream",
+    )
+    resposta.cache_control.no_cache = True
+    # Impede que o nginx acumule o stream em buffer
+    resposta.headers["X-Accel-Buffering"] = "no"
+    return resposta
+
+
+def _para_json(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
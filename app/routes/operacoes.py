@@ -1,97 +1,247 @@
-from flask import Blueprint, render_template, url_for, redirect, flash, abort, request
-from models import db, Operacao, TipoOperacao, Carteira, Ativo, StatusOperacao
-from services.posicao_service import recalcular_posicao, recalcular_posicao_historico
-from forms import OperacaoForm
+from flask import (
+    Blueprint,
+    render_template,
+    url_for,
+    redirect,
+    flash,
+    abort,
+    request,
+    current_app,
+    stream_with_context,
+)
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from models import db, Operacao, Ativo, Carteira, StatusOperacao, TipoOperacao
+from services.operacao_service import (
+    registrar_operacao,
+    atualizar_operacao,
+    excluir_operacao,
+)
+from services.importacao_service import ler_linhas_csv, importar_operacoes
+from services.posicao_service import TIPOS_FATOR
+from forms import OperacaoForm, FormularioImportacao
+from services.referencia_service import obter_referencias, opcoes
+from utils.paginacao import paginar_keyset, contar_registros
+from utils.cache_paginas import cache_pagina
+from utils.replica import somente_leitura
 from datetime import date
-
+import csv
+import io
 
 bp_operacoes = Blueprint("operacoes", __name__, url_prefix="/operacao")
 
+# Cabeçalho do CSV exportado (reconhecido pela importação) e linhas lidas por lote
+COLUNAS_EXPORTACAO = (
+    "data",
+    "ticker",
+    "tipo",
+    "quantidade",
+    "preco_unitario",
+    "custos",
+    "valor_total",
+    "carteira",
+    "status",
+)
+LOTE_EXPORTACAO = 1000
+
 
 @bp_operacoes.route("/", methods=["GET", "POST"])
 @bp_operacoes.route("/<int:page>")
-def exibir_operacoes(page=1):
-    PER_PAGE = 10
-
-    # === AQUI ESTÁ A LÓGICA DE FILTRAGEM ===
-    # Lê os parâmetros de filtro da URL
-    filtro_ticker = request.args.get("ticker", "")
-    filtro_data_inicio = request.args.get("data_inicio", "")
-    filtro_data_fim = request.args.get("data_fim", "")
-    filtro_carteira_id = request.args.get("carteira_id", "")
-    filtro_tipo_operacao_id = request.args.get("tipo_operacao_id", "")
-
-    # Constrói a consulta base
-    query = db.select(Operacao)
-
-    # Filtro por Tipo de Operação
-    if filtro_tipo_operacao_id:
-        query = query.filter(Operacao.tipo_id == filtro_tipo_operacao_id)
-
-    # Adiciona os filtros à consulta se os valores existirem
-    if filtro_ticker:
-        query = query.join(Operacao.ativo).filter(
-            Ativo.ticker.ilike(f"%{filtro_ticker}%")
+@somente_leitura
+@cache_pagina("operacoes", "ativos", "carteiras", "tipos_operacao")
+def exibir_operacoes(page=None):
+    condicoes, filtros = _filtros_operacoes()
+
+    # Quantidade por página escolhida na URL, até o máximo configurado
+    padrao = current_app.config["OPERACOES_POR_PAGINA"]
+    maximo = current_app.config["OPERACOES_POR_PAGINA_MAXIMO"]
+    por_pagina = padrao
+    if "por_pagina" in request.args:
+        por_pagina = max(
+            1, min(request.args.get("por_pagina", padrao, type=int), maximo)
         )
+        filtros["por_pagina"] = por_pagina
+
+    # Só as colunas exibidas na tabela. Ativo, tipo e carteira vêm em uma consulta
+    # cada (WHERE id IN ...), em vez de uma por linha ao renderizar; com JOIN, o
+    # banco juntaria todas as linhas filtradas antes de ordenar e limitar a página
+    query = (
+        db.select(Operacao)
+        .where(*condicoes)
+        .options(
+            load_only(
+                Operacao.data,
+                Operacao.quantidade,
+                Operacao.preco_unitario,
+                Operacao.custos,
+                Operacao.valor_total,
+            ),
+            selectinload(Operacao.ativo).load_only(Ativo.ticker),
+            selectinload(Operacao.tipo).load_only(TipoOperacao.nome),
+            selectinload(Operacao.carteira).load_only(Carteira.nome),
+        )
+        .order_by(Operacao.data.desc())
+    )
 
-    if filtro_data_inicio:
-        # Filtra por data de início
-        query = query.filter(Operacao.data >= filtro_data_inicio)
-
-    if filtro_data_fim:
-        # Filtra por data de fim
-        query = query.filter(Operacao.data <= filtro_data_fim)
-
-    if filtro_carteira_id:
-        # Filtra por carteira
-        query = query.filter(Operacao.carteira_id == filtro_carteira_id)
-
-    # Adiciona a ordenação e a paginação à consulta final
-    query = query.order_by(Operacao.data.desc())
-    operacoes_paginadas = db.paginate(query, page=page, per_page=PER_PAGE)
+    # Com número de página na URL (ou no modo "offset"), mantém a paginação antiga.
+    # No modo por cursor, o custo de cada página não cresce com a distância do início.
+    if page is not None or current_app.config["PAGINACAO_MODO"] == "offset":
+        operacoes_paginadas = db.paginate(query, page=page or 1, per_page=por_pagina)
+    else:
+        operacoes_paginadas = paginar_keyset(
+            query,
+            [Operacao.data, Operacao.id],
+            cursor=request.args.get("cursor"),
+            direcao=request.args.get("direcao", "next"),
+            por_pagina=por_pagina,
+            descendente=True,
+            total=contar_registros(query, exato=request.args.get("contar") == "1"),
+        )
 
-    # Obtém todas as carteiras para popular o filtro do SelectField
-    carteiras = db.session.execute(db.select(Carteira)).scalars().all()
-    tipos_operacoes = db.session.execute(db.select(TipoOperacao)).scalars().all()
+    # Carteiras e tipos para popular os filtros, vindos do cache de referências
+    referencias = obter_referencias()
+    carteiras = referencias.listar("carteiras")
+    tipos_operacoes = referencias.listar("tipos_operacao")
 
     return render_template(
         "operacoes_listar.html",
         operacoes=operacoes_paginadas.items,
         paginacao=operacoes_paginadas,
         # Passa os valores dos filtros de volta para o template
-        filtro_ticker=filtro_ticker,
-        filtro_data_inicio=filtro_data_inicio,
-        filtro_data_fim=filtro_data_fim,
-        filtro_carteira_id=filtro_carteira_id,
+        filtro_ticker=filtros.get("ticker", ""),
+        filtro_data_inicio=filtros.get("data_inicio", ""),
+        filtro_data_fim=filtros.get("data_fim", ""),
+        filtro_carteira_id=filtros.get("carteira_id", ""),
         carteiras=carteiras,
-        filtro_tipo_operacao_id=filtro_tipo_operacao_id,
+        filtro_tipo_operacao_id=filtros.get("tipo_operacao_id", ""),
+        filtros=filtros,
+        por_pagina=por_pagina,
+        opcoes_por_pagina=sorted(
+            {padrao, por_pagina, *(n for n in (50, 100, 500) if n <= maximo)}
+        ),
         operacoes_por_tipo=tipos_operacoes,  # Passa a lista de operações de acordo com o tipo selecionado para o select
     )
 
 
+@bp_operacoes.route("/exportar", methods=["GET"])
+@somente_leitura
+def exportar_operacoes():
+    """
+    Exporta as operações filtradas em CSV, com as colunas aceitas pela
+    importação. O arquivo é gerado aos poucos: as linhas vêm do banco em lotes
+    e cada lote é enviado assim que fica pronto, sem montar o arquivo em memória.
+    """
+
+    condicoes, _ = _filtros_operacoes()
+
+    # Executada aqui (e não no gerador) para usar a réplica, se houver
+    linhas = db.session.execute(
+        db.select(
+            Operacao.data,
+            Ativo.ticker,
+            TipoOperacao.nome,
+            Operacao.quantidade,
+            Operacao.preco_unitario,
+            Operacao.custos,
+            Operacao.valor_total,
+            Carteira.nome,
+            StatusOperacao.nome,
+        )
+        .join(Operacao.ativo)
+        .join(Operacao.tipo)
+        .join(Operacao.carteira)
+        .join(Operacao.status_operacao)
+        .where(*condicoes)
+        .order_by(Operacao.data, Operacao.id)
+        .execution_options(yield_per=LOTE_EXPORTACAO)
+    )
+
+    def gerar():
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(COLUNAS_EXPORTACAO)
+        yield buffer.getvalue()
+
+        for lote in linhas.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            escritor.writerows(lote)
+            yield buffer.getvalue()
+
+    resposta = current_app.response_class(
+        stream_with_context(gerar()), mimetype="text/csv"
+    )
+    resposta.headers["Content-Disposition"] = (
+        f"attachment; filename=operacoes-{date.today():%Y%m%d}.csv"
+    )
+    return resposta
+
+
+def _filtros_operacoes() -> tuple[list, dict]:
+    """
+    Lê os filtros da URL (ticker, período, carteira e tipo) usados pela
+    listagem e pela exportação. Retorna as condições da consulta de operações
+    e os filtros preenchidos, que são repassados nos links.
+    """
+
+    filtros = {
+        nome: request.args.get(nome, "").strip()
+        for nome in (
+            "ticker",
+            "data_inicio",
+            "data_fim",
+            "carteira_id",
+            "tipo_operacao_id",
+        )
+    }
+    filtros = {nome: valor for nome, valor in filtros.items() if valor}
+
+    condicoes = []
+    if "tipo_operacao_id" in filtros:
+        condicoes.append(Operacao.tipo_id == filtros["tipo_operacao_id"])
+
+    if "ticker" in filtros:
+        # Busca por trecho do ticker, sem diferenciar maiúsculas. A subconsulta só
+        # percorre "ativos" (no PostgreSQL, pelo índice de trigramas); em
+        # "operacoes" o filtro é pelo ativo_id, que usa o índice da tabela
+        trecho = (
+            filtros["ticker"]
+            .replace("\\", "\\\\")
+            .replace("%", "\\%")
+            .replace("_", "\\_")
+        )
+        condicoes.append(
+            Operacao.ativo_id.in_(
+                db.select(Ativo.id).where(
+                    Ativo.ticker.ilike(f"%{trecho}%", escape="\\")
+                )
+                # Independente do JOIN com "ativos" da consulta externa
+                .correlate(None)
+            )
+        )
+
+    if "data_inicio" in filtros:
+        condicoes.append(Operacao.data >= filtros["data_inicio"])
+
+    if "data_fim" in filtros:
+        condicoes.append(Operacao.data <= filtros["data_fim"])
+
+    if "carteira_id" in filtros:
+        condicoes.append(Operacao.carteira_id == filtros["carteira_id"])
+
+    return condicoes, filtros
+
+
 @bp_operacoes.route("/adicionar", methods=["GET", "POST"])
 def adicionar_operacao():
     formulario = OperacaoForm()
 
-    # Populando os campos SelectField
-    tipos_operacao = db.session.execute(db.select(TipoOperacao)).scalars().all()
-    formulario.tipo.choices = [(tipo.id, tipo.nome) for tipo in tipos_operacao]
+    # Populando os campos SelectField (a partir do cache de referências); o
+    # ativo é escolhido pela busca, sem a lista de todos os ativos
+    formulario.tipo.choices = opcoes("tipos_operacao")
+    formulario.carteira.choices = opcoes("carteiras")
 
-    carteiras = db.session.execute(db.select(Carteira)).scalars().all()
-    formulario.carteira.choices = [
-        (carteira.id, carteira.nome) for carteira in carteiras
-    ]
-
-    ativos = db.session.execute(db.select(Ativo)).scalars().all()
-    formulario.ativo.choices = [(ativo.id, ativo.ticker) for ativo in ativos]
-
-    if formulario.validate_on_submit():
+    if formulario.validate_on_submit() and _tipo_permitido(formulario.tipo.data):
         try:
-            # Pega os objetos completos com base nos IDs do formulário
-            tipo_operacao_obj = db.session.get(TipoOperacao, formulario.tipo.data)
-            ativo_obj = db.session.get(Ativo, formulario.ativo.data)
-            carteira_obj = db.session.get(Carteira, formulario.carteira.data)
-
             # Pega a data do formulário
             if formulario.data_operacao.data is None:
                 # Você pode escolher como tratar: usar data atual ou retornar erro
@@ -104,16 +254,12 @@ def adicionar_operacao():
             # Cria a nova operação com os dados do formulário
 
             # Lógica para definir o status dinamicamente, sem usar IDs fixos
-            if data_operacao <= date.today():
-                status_obj = db.session.execute(
-                    db.select(StatusOperacao).filter_by(nome="Efetivada")
-                ).scalar_one_or_none()
-            else:
-                status_obj = db.session.execute(
-                    db.select(StatusOperacao).filter_by(nome="Agendada")
-                ).scalar_one_or_none()
+            status_id = obter_referencias().buscar_id(
+                "status_operacao",
+                "Efetivada" if data_operacao <= date.today() else "Agendada",
+            )
 
-            if not status_obj:
+            if status_id is None:
                 # Trata o caso de o status não existir no banco
                 flash("Erro: Status de operação não encontrado.", "danger")
                 return render_template(
@@ -123,19 +269,17 @@ def adicionar_operacao():
             # Cria a nova operação com os dados do formulário
             nova_operacao = Operacao(
                 data=data_operacao,
-                tipo=tipo_operacao_obj,
-                ativo=ativo_obj,
-                carteira=carteira_obj,
+                tipo_id=int(formulario.tipo.data),
+                ativo_id=int(formulario.ativo.data),
+                carteira_id=int(formulario.carteira.data),
                 quantidade=formulario.quantidade.data,
                 preco_unitario=formulario.preco_unitario.data,
                 custos=formulario.custos.data,
-                status_operacao=status_obj,
+                status_id=status_id,
             )
 
-            db.session.add(nova_operacao)
-            db.session.commit()
-
-            recalcular_posicao(nova_operacao)
+            # Grava a operação e atualiza a posição em uma só transação
+            registrar_operacao(nova_operacao)
 
             mensagem = f'Operação registrada com sucesso! <a href="{url_for('operacoes.exibir_operacoes')}">\
                 Voltar para listagem de ativos</a>'
@@ -144,7 +288,6 @@ def adicionar_operacao():
             return redirect(url_for("operacoes.adicionar_operacao"))
 
         except Exception as e:
-            db.session.rollback()
             flash(f"Erro ao salvar a operação: {e}", "danger")
 
     # Se o formulário não for válido ou se a requisição for GET,
@@ -152,9 +295,57 @@ def adicionar_operacao():
     return render_template("operacoes_adicionar.html", formulario=formulario)
 
 
+@bp_operacoes.route("/importar", methods=["GET", "POST"])
+def importar_operacoes_csv():
+    formulario = FormularioImportacao()
+    formulario.carteira.choices = opcoes("carteiras")
+
+    resultado = None
+    if formulario.validate_on_submit():
+        # Lê o arquivo enviado como texto, sem carregá-lo inteiro na memória
+        arquivo = io.TextIOWrapper(formulario.arquivo.data.stream, encoding="utf-8-sig")
+
+        try:
+            resultado = importar_operacoes(
+                ler_linhas_csv(arquivo),
+                carteira_id=int(formulario.carteira.data),
+                dry_run=formulario.dry_run.data,
+            )
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Erro ao importar as operações: {e}", "danger")
+        else:
+            acao = "validadas" if resultado["dry_run"] else "importadas"
+            flash(
+                f"{resultado['importadas']} de {resultado['linhas']} operações {acao} "
+                f"em {resultado['segundos']:.2f}s "
+                f"({resultado['linhas_por_segundo']:.0f} linhas/s); "
+                f"{len(resultado['duplicadas'])} já cadastradas, ignoradas.",
+                (
+                    "warning"
+                    if resultado["erros"] or resultado["duplicadas"]
+                    else "success"
+                ),
+            )
+
+    return render_template(
+        "operacoes_importar.html", formulario=formulario, resultado=resultado
+    )
+
+
 @bp_operacoes.route("/exibir/<int:operacao_id>", methods=["GET"])
+@somente_leitura
+@cache_pagina("operacoes", "ativos", "carteiras", "tipos_operacao")
 def mostrar_operacao(operacao_id):
-    operacao_especifica = db.session.get(Operacao, operacao_id)
+    operacao_especifica = db.session.get(
+        Operacao,
+        operacao_id,
+        options=[
+            joinedload(Operacao.ativo),
+            joinedload(Operacao.tipo),
+            joinedload(Operacao.carteira),
+        ],
+    )
 
     if not operacao_especifica:
         abort(404)
@@ -170,19 +361,10 @@ def editar_operacao(operacao_id):
         flash("Operação não encontrada.", "danger")
         return redirect(url_for("operacoes.listar_operacoes"))
 
-    ativo_id_original = operacao_para_editar.ativo_id
-    carteira_id_original = operacao_para_editar.carteira_id
-
-    # Primeiro, popula os SelectFields com os dados do banco
-    tipos_operacao = db.session.execute(db.select(TipoOperacao)).scalars().all()
-    carteiras = db.session.execute(db.select(Carteira)).scalars().all()
-    ativos = db.session.execute(db.select(Ativo)).scalars().all()
-
-    # Cria o formulário já com as choices
+    # Cria o formulário já com as choices (a partir do cache de referências)
     form = OperacaoForm()
-    form.tipo.choices = [(tipo.id, tipo.nome) for tipo in tipos_operacao]
-    form.carteira.choices = [(c.id, c.nome) for c in carteiras]
-    form.ativo.choices = [(a.id, a.ticker) for a in ativos]
+    form.tipo.choices = opcoes("tipos_operacao")
+    form.carteira.choices = opcoes("carteiras")
 
     # Agora sim, carrega os dados do objeto do banco
     if request.method == "GET":
@@ -191,37 +373,30 @@ def editar_operacao(operacao_id):
             operacao_para_editar.tipo_id
         )  # Converta para string se necessário
         form.ativo.data = str(operacao_para_editar.ativo_id)
+        form.ativo_busca.data = operacao_para_editar.ativo.ticker
         form.carteira.data = str(operacao_para_editar.carteira_id)
         form.quantidade.data = operacao_para_editar.quantidade
         form.preco_unitario.data = operacao_para_editar.preco_unitario
         form.custos.data = operacao_para_editar.custos
 
-    if form.validate_on_submit():
-        # Lógica para atualizar a operação
-        operacao_para_editar.data = form.data_operacao.data
-        operacao_para_editar.tipo_id = int(form.tipo.data)
-        operacao_para_editar.ativo_id = int(form.ativo.data)
-        operacao_para_editar.carteira_id = int(form.carteira.data)
-        operacao_para_editar.quantidade = form.quantidade.data
-        operacao_para_editar.preco_unitario = form.preco_unitario.data
-        operacao_para_editar.custos = form.custos.data
-        operacao_para_editar.calcular_valor_total()
-
-        db.session.commit()
-
-        # 1. Se os IDs mudaram (ativo ou carteira), recalcule a posição que foi 'abandonada'
-        if (
-            ativo_id_original != operacao_para_editar.ativo_id
-            or carteira_id_original != operacao_para_editar.carteira_id
-        ):
-
-            # Recalcula a posição original para remover o impacto da operação
-            recalcular_posicao_historico(ativo_id_original, carteira_id_original)
-
-        # 2. Recalcula a posição atual (ou a nova, se o ativo/carteira mudou)
-        recalcular_posicao_historico(
-            operacao_para_editar.ativo_id, operacao_para_editar.carteira_id
-        )
+    if form.validate_on_submit() and _tipo_permitido(form.tipo.data):
+        # Atualiza a operação e recalcula as posições afetadas em uma só transação
+        try:
+            atualizar_operacao(
+                operacao_para_editar,
+                data=form.data_operacao.data,
+                tipo_id=int(form.tipo.data),
+                ativo_id=int(form.ativo.data),
+                carteira_id=int(form.carteira.data),
+                quantidade=form.quantidade.data,
+                preco_unitario=form.preco_unitario.data,
+                custos=form.custos.data,
+            )
+        except Exception as e:
+            flash(f"Erro ao atualizar a operação: {e}", "danger")
+            return redirect(
+                url_for("operacoes.editar_operacao", operacao_id=operacao_id)
+            )
 
         mensagem = f"Operação atualizada com sucesso! <a href='{url_for("operacoes.exibir_operacoes")}'>\
             Voltar para listagem de ativos</a>"
@@ -233,6 +408,25 @@ def editar_operacao(operacao_id):
     )
 
 
+def _tipo_permitido(tipo_id) -> bool:
+    """
+    Desdobramento e Grupamento não são aceitos no formulário: a quantidade
+    seria lida como o fator do evento (e não como as ações recebidas) e
+    multiplicaria a custódia. Como na importação, vão pelo comando de eventos.
+    """
+
+    referencias = obter_referencias()
+    for nome in TIPOS_FATOR:
+        if str(referencias.buscar_id("tipos_operacao", nome)) == str(tipo_id):
+            flash(
+                f"{nome} deve ser registrado como evento corporativo, com o "
+                f"fator (ex.: 2 para 1:2): flask operacoes evento",
+                "danger",
+            )
+            return False
+    return True
+
+
 @bp_operacoes.route("/deletar/<int:operacao_id>", methods=["POST"])
 def deletar_operacao(operacao_id):
     operacao = db.session.get(Operacao, operacao_id)
@@ -241,11 +435,10 @@ def deletar_operacao(operacao_id):
         return redirect(url_for("operacoes.exibir_operacoes"))
 
     try:
-        db.session.delete(operacao)
-        db.session.commit()
+        # Exclui e recalcula a posição afetada em uma só transação
+        excluir_operacao(operacao)
         flash("Operação excluída com sucesso.", "success")
         return redirect(url_for("operacoes.exibir_operacoes"))
     except Exception as e:
-        db.session.rollback()
         flash(f"Não foi possível remover a operação selecionada: {e}", "danger")
         return redirect(url_for("operacoes.exibir_operacoes"))
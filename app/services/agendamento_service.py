@@ -0,0 +1,261 @@
+"""
+Efetivação das operações agendadas: operações com data futura são gravadas
+com o status "Agendada" e não alteram a posição; quando a data chega, o
+executor troca o status para "Efetivada" e recalcula as posições afetadas.
+
+As operações vencidas são processadas em lotes, cada um em uma transação: o
+lote é lido sem travas, as posições das suas operações são travadas (na
+mesma ordem das gravações em operacao_service, posição antes da operação,
+para não haver deadlock com elas), o lote é reservado com SELECT ... FOR
+UPDATE SKIP LOCKED (no PostgreSQL, outro processo pula as linhas já
+reservadas em vez de esperar) e só então o status é trocado nas linhas que
+ainda estão agendadas (UPDATE ... RETURNING), o que mantém o resultado
+correto também em bancos sem SKIP LOCKED, como o SQLite. Assim, vários
+processos podem rodar o executor ao mesmo tempo.
+
+Cada posição é recalculada uma única vez por lote, a partir da operação
+efetivada mais antiga, junto com a troca de status.
+"""
+
+import logging
+import threading
+import time
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import func, tuple_
+from models import db, Operacao
+from services.posicao_service import (
+    AGENDADA,
+    EFETIVADA,
+    recalcular_posicao_historico,
+    travar_posicoes,
+)
+from services.referencia_service import obter_referencias
+from services.versao_service import incrementar_versao
+
+logger = logging.getLogger(__name__)
+
+
+class MetricasAgendamento:
+    """Totais das execuções do executor neste processo."""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.execucoes = 0
+        self.erros = 0
+        self.operacoes = 0
+        self.posicoes = 0
+        self.segundos = 0.0
+        self.ultima_execucao = None
+        self.ultimo_resultado = None
+
+    def registrar(self, resultado: dict):
+        with self._trava:
+            self.execucoes += 1
+            self.operacoes += resultado["operacoes"]
+            self.posicoes += resultado["posicoes"]
+            self.segundos += resultado["segundos"]
+            self.ultima_execucao = datetime.now()
+            self.ultimo_resultado = resultado
+
+    def registrar_erro(self):
+        with self._trava:
+            self.erros += 1
+
+    def resumo(self) -> dict:
+        with self._trava:
+            return {
+                "execucoes": self.execucoes,
+                "erros": self.erros,
+                "operacoes_efetivadas": self.operacoes,
+                "posicoes_recalculadas": self.posicoes,
+                "segundos": round(self.segundos, 3),
+                "ultima_execucao": (
+                    self.ultima_execucao.isoformat() if self.ultima_execucao else None
+                ),
+                "ultimo_resultado": self.ultimo_resultado,
+            }
+
+
+def obter_metricas_agendamento() -> MetricasAgendamento:
+    """Retorna as métricas do executor da aplicação, criando-as se preciso."""
+
+    metricas = current_app.extensions.get("agendamento")
+    if metricas is None:
+        metricas = MetricasAgendamento()
+        current_app.extensions["agendamento"] = metricas
+    return metricas
+
+
+def contar_agendadas(hoje: date | None = None) -> dict:
+    """Operações agendadas já vencidas (a efetivar) e ainda futuras."""
+
+    hoje = hoje or date.today()
+    agendada = obter_referencias().buscar_id("status_operacao", AGENDADA)
+    vencidas, futuras = db.session.execute(
+        db.select(
+            func.count().filter(Operacao.data <= hoje),
+            func.count().filter(Operacao.data > hoje),
+        ).where(Operacao.status_id == agendada)
+    ).one()
+    return {"vencidas": vencidas, "futuras": futuras}
+
+
+def efetivar_agendadas(
+    hoje: date | None = None, tamanho_lote: int | None = None
+) -> dict:
+    """
+    Efetiva as operações agendadas com data até `hoje`, lote a lote, e
+    recalcula as posições afetadas. Retorna as quantidades de operações,
+    posições e lotes processados e a duração.
+    """
+
+    inicio = time.perf_counter()
+    hoje = hoje or date.today()
+    tamanho_lote = tamanho_lote or current_app.config["AGENDADAS_LOTE"]
+
+    referencias = obter_referencias()
+    agendada = referencias.buscar_id("status_operacao", AGENDADA)
+    efetivada = referencias.buscar_id("status_operacao", EFETIVADA)
+    if agendada is None or efetivada is None:
+        raise ValueError("Status 'Agendada' ou 'Efetivada' não cadastrado.")
+
+    operacoes = posicoes = lotes = 0
+    while True:
+        lidas, efetivadas, recalculadas = _efetivar_lote(
+            hoje, tamanho_lote, agendada, efetivada
+        )
+        if not lidas:
+            break
+        operacoes += efetivadas
+        posicoes += recalculadas
+        lotes += 1
+
+    resultado = {
+        "operacoes": operacoes,
+        "posicoes": posicoes,
+        "lotes": lotes,
+        "segundos": time.perf_counter() - inicio,
+    }
+    obter_metricas_agendamento().registrar(resultado)
+    return resultado
+
+
+def _efetivar_lote(
+    hoje: date, tamanho_lote: int, agendada: int, efetivada: int
+) -> tuple[int, int, int]:
+    """
+    Lê, reserva e efetiva um lote, em uma transação. Retorna (operações lidas,
+    operações efetivadas, posições recalculadas); as lidas podem ser mais que
+    as efetivadas se outro processo efetivou parte delas.
+    """
+
+    try:
+        # 1. Lê o lote, sem travar, junto com a posição de cada operação
+        lidas = db.session.execute(
+            db.select(Operacao.id, Operacao.ativo_id, Operacao.carteira_id)
+            .where(Operacao.status_id == agendada, Operacao.data <= hoje)
+            .order_by(Operacao.data, Operacao.id)
+            .limit(tamanho_lote)
+        ).all()
+        if not lidas:
+            db.session.rollback()
+            return 0, 0, 0
+
+        # 2. Trava as posições antes das operações, na mesma ordem usada pelas
+        # gravações (operacao_service), para não haver deadlock com elas
+        posicoes_lidas = sorted(
+            {(ativo_id, carteira_id) for _, ativo_id, carteira_id in lidas}
+        )
+        travar_posicoes(posicoes_lidas)
+
+        # 3. Reserva as que ainda estão agendadas (e na posição travada, caso
+        # tenham sido editadas depois da leitura) e efetiva só essas
+        reservadas = (
+            db.session.execute(
+                db.select(Operacao.id)
+                .where(
+                    Operacao.id.in_([linha.id for linha in lidas]),
+                    Operacao.status_id == agendada,
+                    tuple_(Operacao.ativo_id, Operacao.carteira_id).in_(posicoes_lidas),
+                )
+                .with_for_update(skip_locked=True)
+            )
+            .scalars()
+            .all()
+        )
+        if not reservadas:
+            db.session.rollback()
+            return len(lidas), 0, 0
+
+        efetivadas = db.session.execute(
+            db.update(Operacao)
+            .where(Operacao.id.in_(reservadas), Operacao.status_id == agendada)
+            .values(status_id=efetivada)
+            .returning(Operacao.ativo_id, Operacao.carteira_id, Operacao.data)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        # 4. Recalcula uma vez por posição, a partir da operação efetivada mais antiga
+        posicoes = {}
+        for ativo_id, carteira_id, data in efetivadas:
+            chave = (ativo_id, carteira_id)
+            if chave not in posicoes or data < posicoes[chave]:
+                posicoes[chave] = data
+
+        for (ativo_id, carteira_id), data in posicoes.items():
+            recalcular_posicao_historico(ativo_id, carteira_id, a_partir_de=data)
+
+        if efetivadas:
+            incrementar_versao("operacoes")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(lidas), len(efetivadas), len(posicoes)
+
+
+def executar_agendador(
+    intervalo: int | None = None,
+    tamanho_lote: int | None = None,
+    parar: threading.Event | None = None,
+):
+    """
+    Efetiva as operações vencidas a cada `intervalo` segundos até `parar` ser
+    sinalizado. Deve ser chamado dentro do contexto da aplicação.
+    """
+
+    intervalo = intervalo or current_app.config["AGENDADAS_INTERVALO"]
+    parar = parar or threading.Event()
+
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        try:
+            resultado = efetivar_agendadas(tamanho_lote=tamanho_lote)
+            if resultado["operacoes"]:
+                logger.info("Operações agendadas efetivadas", extra=resultado)
+        except Exception:
+            # Uma falha isolada não pode derrubar o executor
+            obter_metricas_agendamento().registrar_erro()
+            logger.exception("Erro ao efetivar operações agendadas")
+        finally:
+            db.session.remove()
+
+        parar.wait(max(0, intervalo - (time.perf_counter() - inicio)))
+
+
+def iniciar_agendador_em_segundo_plano(app) -> threading.Event:
+    """
+    Inicia o executor em uma thread do próprio processo. Retorna o evento que
+    encerra o laço quando sinalizado.
+    """
+
+    parar = threading.Event()
+
+    def rodar():
+        with app.app_context():
+            executar_agendador(parar=parar)
+
+    threading.Thread(target=rodar, name="agendador-operacoes", daemon=True).start()
+    return parar
@@ -0,0 +1,621 @@
+"""
+Análises da carteira calculadas de forma vetorizada (NumPy) sobre o histórico
+de operações: custódia e preço médio após cada operação, resultado realizado
+nas vendas e rentabilidade (TWR e TIR/XIRR).
+
+Os cálculos usam ponto flutuante e servem para gráficos e relatórios. Os
+valores gravados (posicao_ativos) continuam vindo do cálculo em Decimal de
+services/posicao_service.py, que segue a mesma regra de _aplicar_operacao().
+"""
+
+import time
+from datetime import date
+from sqlalchemy import BigInteger, Float, cast, func
+from models import db, Ativo, Cotacao, Operacao
+
+# As quantidades (Numeric(15, 5)) são tratadas como inteiros nesta escala, para
+# que a custódia seja somada sem erro de arredondamento e o zeramento da
+# posição seja detectado exatamente como no cálculo em Decimal
+ESCALA_QUANTIDADE = 100_000
+
+# Faixa das taxas anuais procuradas pela bisseção do XIRR (-99,99% a +1.000%)
+TAXA_MINIMA = -0.9999
+TAXA_MAXIMA = 10.0
+
+
+def carregar_operacoes(carteira_ids: list[int] | None = None) -> dict:
+    """
+    Carrega as operações efetivadas das carteiras (todas, se não informadas) em
+    uma única consulta, como colunas NumPy, ordenadas por carteira, ativo, data,
+    registro e id (a mesma ordem do recálculo da posição).
+    """
+
+    import numpy as np
+    from services.posicao_service import condicao_efetivada
+
+    query = (
+        db.select(
+            Operacao.carteira_id,
+            Operacao.ativo_id,
+            Operacao.tipo_id,
+            Operacao.data,
+            cast(func.round(Operacao.quantidade * ESCALA_QUANTIDADE), BigInteger),
+            cast(Operacao.preco_unitario, Float),
+            cast(func.coalesce(Operacao.custos, 0), Float),
+            cast(Operacao.valor_total, Float),
+        )
+        .where(condicao_efetivada())
+        .order_by(
+            Operacao.carteira_id,
+            Operacao.ativo_id,
+            Operacao.data,
+            Operacao.registro,
+            Operacao.id,
+        )
+        .execution_options(yield_per=100_000)
+    )
+    if carteira_ids is not None:
+        query = query.where(Operacao.carteira_id.in_(carteira_ids))
+
+    nomes = (
+        "carteira_id",
+        "ativo_id",
+        "tipo_id",
+        "data",
+        "quantidade",
+        "preco_unitario",
+        "custos",
+        "valor_total",
+    )
+    tipos = ("i8", "i8", "i8", "datetime64[D]", "i8", "f8", "f8", "f8")
+
+    # Converte cada lote de linhas em colunas, sem criar objetos do ORM
+    partes = {nome: [] for nome in nomes}
+    for lote in db.session.execute(query).partitions():
+        for nome, tipo, valores in zip(nomes, tipos, zip(*lote)):
+            partes[nome].append(np.array(valores, dtype=tipo))
+
+    return {
+        nome: (
+            np.concatenate(partes[nome]) if partes[nome] else np.array([], dtype=tipo)
+        )
+        for nome, tipo in zip(nomes, tipos)
+    }
+
+
+def _varrer_afim(a, b):
+    """
+    Aplica em sequência as funções x -> a[i] * x + b[i], partindo de x = 0, e
+    retorna o valor após cada uma. É uma varredura paralela (prefix scan) em
+    log2(n) passos vetorizados, no lugar de um laço sobre as operações.
+    """
+
+    a = a.copy()
+    b = b.copy()
+    passo = 1
+    while passo < len(a):
+        novo_b = b[passo:] + a[passo:] * b[:-passo]
+        a[passo:] = a[passo:] * a[:-passo]
+        b[passo:] = novo_b
+        passo *= 2
+    return b
+
+
+def _varrer_custodia(m, p, q):
+    """
+    Aplica em sequência as funções x -> max(m[i] * x + p[i], q[i]) (m >= 0),
+    partindo de x = 0, e retorna o valor após cada uma. Cobre a compra e a
+    venda (m = 1, com piso zero: a custódia nunca fica negativa, como em
+    _aplicar_operacao()), o desdobramento e o grupamento (m = fator) e o
+    recomeço de cada posição (m = 0). As funções são compostas por varredura
+    paralela, como em _varrer_afim().
+    """
+
+    import numpy as np
+
+    m = m.astype(float)
+    p = p.astype(float)
+    q = q.astype(float)
+    passo = 1
+    while passo < len(m):
+        # Compor f (anterior) com g: max(mg*mf*x + mg*pf + pg, mg*qf + pg, qg)
+        novo_q = np.maximum(m[passo:] * q[:-passo] + p[passo:], q[passo:])
+        novo_p = m[passo:] * p[:-passo] + p[passo:]
+        m[passo:] = m[passo:] * m[:-passo]
+        p[passo:] = novo_p
+        q[passo:] = novo_q
+        passo *= 2
+    return np.maximum(p, q)
+
+
+def calcular_posicoes(operacoes: dict, tipos: dict[int, str] | None = None) -> dict:
+    """
+    Acrescenta às colunas de `carregar_operacoes` a custódia, o custo, o preço
+    médio, o resultado realizado e os proventos após cada operação. `tipos`
+    é o {id: nome} dos tipos de operação (padrão: os cadastrados).
+
+    Segue a regra de _aplicar_operacao(): compra e bonificação somam custódia e
+    custo; a venda reduz a custódia mantendo o preço médio, e a posição zerada
+    zera também o preço médio; desdobramento e grupamento multiplicam (ou
+    dividem) a custódia pelo fator mantendo o custo; proventos não alteram a
+    posição. O custo (custódia x preço médio) é a recorrência linear
+    custo[i] = a[i] * custo[i-1] + b[i], resolvida por varredura.
+    """
+
+    import numpy as np
+    from services.posicao_service import (
+        COMPRA,
+        VENDA,
+        DESDOBRAMENTO,
+        GRUPAMENTO,
+        TIPOS_AQUISICAO,
+        TIPOS_PROVENTO,
+        nomes_tipos_operacao,
+    )
+
+    tipos = nomes_tipos_operacao() if tipos is None else tipos
+
+    def do_tipo(*nomes):
+        ids = [tipo_id for tipo_id, nome in tipos.items() if nome in nomes]
+        return np.isin(operacoes["tipo_id"], ids)
+
+    n = len(operacoes["quantidade"])
+    inicio = np.ones(n, dtype=bool)
+    if n:
+        inicio[1:] = (np.diff(operacoes["carteira_id"]) != 0) | (
+            np.diff(operacoes["ativo_id"]) != 0
+        )
+
+    compra = do_tipo(COMPRA)
+    aquisicao = do_tipo(*TIPOS_AQUISICAO)
+    venda = do_tipo(VENDA)
+    provento = do_tipo(*TIPOS_PROVENTO)
+    quantidade = operacoes["quantidade"]
+
+    # Fator do desdobramento/grupamento (a quantidade traz o fator); 1 nos demais
+    fator = np.ones(n)
+    with np.errstate(divide="ignore"):
+        fator_informado = quantidade / ESCALA_QUANTIDADE
+        fator = np.where(
+            do_tipo(DESDOBRAMENTO) & (quantidade > 0), fator_informado, fator
+        )
+        fator = np.where(
+            do_tipo(GRUPAMENTO) & (quantidade > 0), 1 / fator_informado, fator
+        )
+
+    # Custódia na escala inteira; o arredondamento final elimina os resíduos
+    # de ponto flutuante do fator
+    variacao = np.where(aquisicao, quantidade, np.where(venda, -quantidade, 0))
+    custodia = _varrer_custodia(np.where(inicio, 0.0, fator), variacao, np.zeros(n))
+    custodia = np.rint(custodia).astype(np.int64)
+    custodia_anterior = np.zeros(n, dtype=np.int64)
+    custodia_anterior[1:] = custodia[:-1]
+    custodia_anterior[inicio] = 0
+
+    # Coeficientes da recorrência do custo: a aquisição soma o valor total; a
+    # venda mantém o preço médio, ou seja, reduz o custo na proporção da
+    # custódia; os demais tipos mantêm o custo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proporcao = np.where(
+            custodia_anterior > 0, custodia / custodia_anterior.astype(float), 0.0
+        )
+    a = np.where(venda, proporcao, 1.0)
+    b = np.where(aquisicao & (custodia > 0), operacoes["valor_total"], 0.0)
+    a[inicio] = 0.0
+
+    custo = _varrer_afim(a, b)
+    custo[custodia == 0] = 0.0
+
+    custodia_real = custodia / ESCALA_QUANTIDADE
+    with np.errstate(divide="ignore", invalid="ignore"):
+        preco_medio = np.where(custodia > 0, custo / custodia_real, 0.0)
+
+    preco_medio_anterior = np.zeros(n)
+    preco_medio_anterior[1:] = preco_medio[:-1]
+    preco_medio_anterior[inicio] = 0.0
+
+    # Resultado realizado: valor líquido da venda menos o custo médio vendido.
+    # Só conta a quantidade que havia em custódia (a venda acima dela é ignorada)
+    vendida = np.where(venda, custodia_anterior - custodia, 0) / ESCALA_QUANTIDADE
+    valor_vendido = vendida * operacoes["preco_unitario"] - np.where(
+        venda, operacoes["custos"], 0.0
+    )
+    resultado = np.where(venda, valor_vendido - vendida * preco_medio_anterior, 0.0)
+
+    # Proventos: valor por ação x quantidade, líquido dos custos (IR retido)
+    proventos = np.where(
+        provento,
+        quantidade / ESCALA_QUANTIDADE * operacoes["preco_unitario"]
+        - operacoes["custos"],
+        0.0,
+    )
+
+    return {
+        **operacoes,
+        "inicio_posicao": inicio,
+        "compra": compra,
+        "negociada": compra | venda,
+        "fator": fator,
+        "custodia": custodia_real,
+        "custo": custo,
+        "preco_medio": preco_medio,
+        "valor_vendido": valor_vendido,
+        "resultado_realizado": resultado,
+        "proventos": proventos,
+    }
+
+
+def calcular_xirr(datas, fluxos, chute: float = 0.1) -> float | None:
+    """
+    Taxa interna de retorno anual para fluxos em datas irregulares (XIRR).
+    Aportes são negativos e resgates (e o valor final) positivos. Retorna None
+    se não houver solução (por exemplo, todos os fluxos com o mesmo sinal).
+    """
+
+    import numpy as np
+
+    datas = np.asarray(datas, dtype="datetime64[D]")
+    fluxos = np.asarray(fluxos, dtype=float)
+
+    # Agrupa os fluxos do mesmo dia antes de iterar
+    dias, posicoes = np.unique(datas, return_inverse=True)
+    fluxos = np.bincount(posicoes, weights=fluxos)
+    if not (fluxos > 0).any() or not (fluxos < 0).any():
+        return None
+
+    anos = (dias - dias[0]).astype(float) / 365.0
+
+    def vpl(taxa):
+        return (fluxos / (1 + taxa) ** anos).sum()
+
+    # Quando o Newton diverge, (1 + taxa) ** anos estoura (ou zera) o float: os
+    # avisos do NumPy ficam desligados e o cálculo passa para a bisseção assim
+    # que a taxa sai da faixa em que os fatores são finitos
+    minimo, maximo = TAXA_MINIMA, TAXA_MAXIMA
+    with np.errstate(over="ignore", under="ignore", invalid="ignore", divide="ignore"):
+        # Newton-Raphson, com bisseção como alternativa se não convergir
+        taxa = chute
+        for _ in range(50):
+            fator = (1 + taxa) ** anos
+            if not (np.isfinite(fator) & (fator > 0)).all():
+                break
+            valor = (fluxos / fator).sum()
+            derivada = (-anos * fluxos / (fator * (1 + taxa))).sum()
+            if derivada == 0 or not np.isfinite(derivada):
+                break
+            nova_taxa = taxa - valor / derivada
+            if nova_taxa <= -1 or not np.isfinite(nova_taxa):
+                break
+            if abs(nova_taxa - taxa) < 1e-10:
+                return float(nova_taxa)
+            taxa = nova_taxa
+
+        if not vpl(minimo) * vpl(maximo) <= 0:
+            return None
+        for _ in range(200):
+            meio = (minimo + maximo) / 2
+            if vpl(minimo) * vpl(meio) <= 0:
+                maximo = meio
+            else:
+                minimo = meio
+        return float((minimo + maximo) / 2)
+
+
+def calcular_twr(valores, fluxos) -> float:
+    """
+    Rentabilidade ponderada pelo tempo (TWR) de uma série de valores da
+    carteira ao fim de cada período, com os aportes (+) e resgates (-) feitos
+    no período. Períodos que começam com a carteira vazia não contam.
+    """
+
+    import numpy as np
+
+    valores = np.asarray(valores, dtype=float)
+    fluxos = np.asarray(fluxos, dtype=float)
+
+    anteriores = valores[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        retornos = np.where(
+            anteriores > 0, (valores[1:] - fluxos[1:]) / anteriores, 1.0
+        )
+    return float(np.prod(retornos) - 1)
+
+
+def _custodia_por_ativo(posicoes: dict) -> dict:
+    """
+    Reordena as operações por data e calcula, após cada uma, a custódia total
+    do ativo (somando as carteiras) e o último preço negociado dele. As séries
+    por ativo ficam em "ordem_ativo" (ativo, data), apontando para a ordem por data.
+    """
+
+    import numpy as np
+
+    ordem = np.lexsort((np.arange(len(posicoes["data"])), posicoes["data"]))
+    ativos = posicoes["ativo_id"][ordem]
+
+    # Variação da custódia da posição em cada operação (já limitada pelo piso zero)
+    custodia = posicoes["custodia"]
+    variacao = custodia.copy()
+    variacao[1:] -= custodia[:-1]
+    variacao[posicoes["inicio_posicao"]] = custodia[posicoes["inicio_posicao"]]
+    variacao = variacao[ordem]
+
+    # Custódia total e último preço do ativo após cada operação (somando carteiras)
+    ordem_ativo = np.lexsort((np.arange(len(ativos)), ativos))
+    ativos_ordenados = ativos[ordem_ativo]
+    primeiro_do_ativo = np.ones(len(ativos), dtype=bool)
+    primeiro_do_ativo[1:] = ativos_ordenados[1:] != ativos_ordenados[:-1]
+
+    acumulado = np.cumsum(variacao[ordem_ativo])
+    base = np.maximum.accumulate(np.where(primeiro_do_ativo, np.arange(len(ativos)), 0))
+    anterior_ao_ativo = np.where(base > 0, acumulado[base - 1], 0.0)
+    custodia_ativo = acumulado - anterior_ao_ativo
+
+    # Custo (custódia x preço médio) total do ativo, acumulado da mesma forma
+    custo = posicoes["custo"]
+    variacao_custo = custo.copy()
+    variacao_custo[1:] -= custo[:-1]
+    variacao_custo[posicoes["inicio_posicao"]] = custo[posicoes["inicio_posicao"]]
+    custo_acumulado = np.cumsum(variacao_custo[ordem][ordem_ativo])
+    custo_ativo = custo_acumulado - np.where(base > 0, custo_acumulado[base - 1], 0.0)
+
+    # Preço: o da última compra/venda do ativo (proventos não são preço de
+    # mercado), ajustado pelos desdobramentos e grupamentos posteriores a ela
+    preco = posicoes["preco_unitario"][ordem][ordem_ativo]
+    negociada = posicoes["negociada"][ordem][ordem_ativo] & (preco > 0)
+    ultima = np.maximum.accumulate(
+        np.where(negociada | primeiro_do_ativo, np.arange(len(ativos)), 0)
+    )
+
+    # O evento tem uma operação por carteira: o fator conta uma vez por ativo e dia
+    fator = posicoes["fator"][ordem][ordem_ativo]
+    datas = posicoes["data"][ordem][ordem_ativo]
+    repetido = np.zeros(len(ativos), dtype=bool)
+    repetido[1:] = (
+        (fator[1:] != 1)
+        & (fator[1:] == fator[:-1])
+        & (datas[1:] == datas[:-1])
+        & ~primeiro_do_ativo[1:]
+    )
+    log_fator = np.cumsum(np.where(repetido, 0.0, np.log(fator)))
+    preco_ajustado = preco[ultima] * np.exp(log_fator[ultima] - log_fator)
+
+    return {
+        "ordem": ordem,
+        "ordem_ativo": ordem_ativo,
+        "ativos": ativos_ordenados,
+        "datas": datas,
+        "primeiro_do_ativo": primeiro_do_ativo,
+        "custodia": custodia_ativo,
+        "custo": custo_ativo,
+        "preco": preco_ajustado,
+    }
+
+
+def _fluxos(posicoes: dict):
+    """
+    Fluxo de caixa de cada operação: aporte na compra; resgate no valor líquido
+    das vendas e nos proventos recebidos. Bonificações e desdobramentos não
+    movimentam dinheiro.
+    """
+
+    import numpy as np
+
+    return (
+        np.where(posicoes["compra"], posicoes["valor_total"], 0.0)
+        - posicoes["valor_vendido"]
+        - posicoes["proventos"]
+    )
+
+
+def _serie_valores(posicoes: dict, precos_finais: dict, hoje: date) -> dict:
+    """
+    Monta, em ordem de data, o valor da carteira e o fluxo de caixa de cada dia
+    com operações (e de hoje), marcando cada ativo pelo último preço negociado
+    nas operações e, no fim, pela cotação atual.
+    """
+
+    import numpy as np
+
+    por_ativo = _custodia_por_ativo(posicoes)
+    ordem = por_ativo["ordem"]
+    ordem_ativo = por_ativo["ordem_ativo"]
+    ativos_ordenados = por_ativo["ativos"]
+    primeiro_do_ativo = por_ativo["primeiro_do_ativo"]
+    custodia_ativo = por_ativo["custodia"]
+    preco_ativo = por_ativo["preco"]
+    datas = posicoes["data"][ordem]
+
+    valor_ativo = custodia_ativo * preco_ativo
+    variacao_valor = valor_ativo.copy()
+    variacao_valor[1:] -= valor_ativo[:-1]
+    variacao_valor[primeiro_do_ativo] = valor_ativo[primeiro_do_ativo]
+
+    # Volta para a ordem de data e acumula o valor da carteira
+    variacao_carteira = np.empty_like(variacao_valor)
+    variacao_carteira[ordem_ativo] = variacao_valor
+    valor_carteira = np.cumsum(variacao_carteira)
+
+    fluxo = _fluxos(posicoes)[ordem]
+
+    # Um ponto por dia: o valor ao fim do dia e a soma dos fluxos do dia
+    dias, posicao_dia = np.unique(datas, return_inverse=True)
+    fim_do_dia = np.zeros(len(dias), dtype=np.int64)
+    np.maximum.at(fim_do_dia, posicao_dia, np.arange(len(datas)))
+    valores = valor_carteira[fim_do_dia]
+    fluxos = np.bincount(posicao_dia, weights=fluxo, minlength=len(dias))
+
+    # Ponto final: custódia atual de cada ativo marcada pela cotação atual
+    ultimo_do_ativo = np.ones(len(ativos_ordenados), dtype=bool)
+    ultimo_do_ativo[:-1] = ativos_ordenados[1:] != ativos_ordenados[:-1]
+    valor_final = 0.0
+    for ativo_id, quantidade, ultimo_preco in zip(
+        ativos_ordenados[ultimo_do_ativo],
+        custodia_ativo[ultimo_do_ativo],
+        preco_ativo[ultimo_do_ativo],
+    ):
+        valor_final += quantidade * precos_finais.get(int(ativo_id), ultimo_preco)
+
+    dia_final = np.datetime64(hoje, "D")
+    if len(dias) and dias[-1] >= dia_final:
+        valores[-1] = valor_final
+    else:
+        dias = np.append(dias, dia_final)
+        valores = np.append(valores, valor_final)
+        fluxos = np.append(fluxos, 0.0)
+
+    return {"datas": dias, "valores": valores, "fluxos": fluxos}
+
+
+def analisar_carteiras(carteira_ids: list[int] | None = None) -> dict:
+    """
+    Calcula, para as carteiras informadas (todas, se None), as posições atuais,
+    o resultado realizado e a rentabilidade (TWR e TIR), além da série diária
+    de valor da carteira para gráficos. Todos os valores são float.
+    """
+
+    import numpy as np
+
+    inicio = time.perf_counter()
+    posicoes = calcular_posicoes(carregar_operacoes(carteira_ids))
+    n = len(posicoes["data"])
+
+    precos_finais = {
+        ativo_id: float(preco)
+        for ativo_id, preco in db.session.execute(
+            db.select(Cotacao.ativo_id, Cotacao.preco).where(Cotacao.preco > 0)
+        )
+    }
+    tickers = dict(db.session.execute(db.select(Ativo.id, Ativo.ticker)).all())
+
+    # Situação final de cada posição (última operação de cada carteira/ativo)
+    ultima = np.ones(n, dtype=bool)
+    ultima[:-1] = posicoes["inicio_posicao"][1:]
+    grupo = np.cumsum(posicoes["inicio_posicao"]) - 1
+    resultado_por_posicao = np.bincount(
+        grupo, weights=posicoes["resultado_realizado"], minlength=int(ultima.sum())
+    )
+    proventos_por_posicao = np.bincount(
+        grupo, weights=posicoes["proventos"], minlength=int(ultima.sum())
+    )
+
+    resumo_posicoes = [
+        {
+            "carteira_id": int(carteira_id),
+            "ativo_id": int(ativo_id),
+            "ticker": tickers.get(int(ativo_id)),
+            "custodia": float(custodia),
+            "preco_medio": float(preco_medio),
+            "custo": float(custo),
+            "resultado_realizado": float(resultado),
+            "proventos": float(proventos),
+        }
+        for carteira_id, ativo_id, custodia, preco_medio, custo, resultado, proventos in zip(
+            posicoes["carteira_id"][ultima],
+            posicoes["ativo_id"][ultima],
+            posicoes["custodia"][ultima],
+            posicoes["preco_medio"][ultima],
+            posicoes["custo"][ultima],
+            resultado_por_posicao,
+            proventos_por_posicao,
+        )
+    ]
+
+    twr = xirr = None
+    serie = {"datas": [], "valores": [], "fluxos": []}
+    if n:
+        serie = _serie_valores(posicoes, precos_finais, date.today())
+        twr = calcular_twr(serie["valores"], serie["fluxos"])
+        # Na TIR, os aportes saem do investidor (negativos) e o valor final volta
+        fluxos_investidor = -serie["fluxos"]
+        fluxos_investidor[-1] += serie["valores"][-1]
+        xirr = calcular_xirr(serie["datas"], fluxos_investidor)
+
+    return {
+        "operacoes": n,
+        "posicoes": resumo_posicoes,
+        "resultado_realizado": float(posicoes["resultado_realizado"].sum()),
+        "proventos": float(posicoes["proventos"].sum()),
+        "twr": twr,
+        "xirr": xirr,
+        "serie": {
+            "datas": [str(dia) for dia in serie["datas"]],
+            "valores": [float(valor) for valor in serie["valores"]],
+            "fluxos": [float(fluxo) for fluxo in serie["fluxos"]],
+        },
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+def calcular_curva_patrimonio(
+    carteira_ids: list[int] | None = None,
+    inicio: date | None = None,
+    fim: date | None = None,
+) -> dict:
+    """
+    Valor da carteira em cada dia útil do período, marcado pelo fechamento do
+    histórico local de preços (services/historico_service.py), com o valor
+    investido (custo das posições), os aportes e resgates de cada dia e o TWR
+    do período. Sem histórico de um ativo no dia, vale o último preço
+    negociado nas operações.
+    """
+
+    import numpy as np
+    from services.historico_service import fechamentos
+
+    posicoes = calcular_posicoes(carregar_operacoes(carteira_ids))
+    if not len(posicoes["data"]):
+        return {"datas": [], "valores": [], "investido": [], "fluxos": [], "twr": None}
+
+    inicio = np.datetime64(inicio or posicoes["data"].min(), "D")
+    fim = np.datetime64(fim or date.today(), "D")
+    dias = np.arange(inicio, fim + np.timedelta64(1, "D"))
+    dias = dias[np.is_busday(dias)]
+
+    por_ativo = _custodia_por_ativo(posicoes)
+    inicios = np.flatnonzero(por_ativo["primeiro_do_ativo"])
+    finais = np.append(inicios[1:], len(por_ativo["ativos"]))
+    ativo_ids = [int(ativo_id) for ativo_id in por_ativo["ativos"][inicios]]
+
+    tickers = dict(
+        db.session.execute(
+            db.select(Ativo.id, Ativo.ticker).where(Ativo.id.in_(ativo_ids))
+        ).all()
+    )
+    historico = fechamentos([tickers[ativo_id] for ativo_id in ativo_ids], dias)
+
+    # Custódia e preço de cada ativo em cada dia: busca binária nas operações dele
+    valores = np.zeros(len(dias))
+    investido = np.zeros(len(dias))
+    for ativo_id, primeiro, ultimo in zip(ativo_ids, inicios, finais):
+        indices = np.searchsorted(por_ativo["datas"][primeiro:ultimo], dias, "right")
+        indices -= 1
+        operou = indices >= 0
+        indices = np.maximum(indices, 0) + primeiro
+
+        custodia = np.where(operou, por_ativo["custodia"][indices], 0.0)
+        preco = historico[tickers[ativo_id]]
+        preco = np.where(np.isnan(preco), por_ativo["preco"][indices], preco)
+        valores += custodia * preco
+        investido += np.where(operou, por_ativo["custo"][indices], 0.0)
+
+    # Aportes e resgates, somados no primeiro dia útil a partir da operação
+    ordem = por_ativo["ordem"]
+    datas = posicoes["data"][ordem]
+    fluxo = _fluxos(posicoes)[ordem]
+    no_periodo = (datas >= inicio) & (datas <= fim)
+    dia_da_operacao = np.searchsorted(dias, datas[no_periodo], "left")
+    dentro = dia_da_operacao < len(dias)
+    fluxos = np.bincount(
+        dia_da_operacao[dentro],
+        weights=fluxo[no_periodo][dentro],
+        minlength=len(dias),
+    )
+
+    return {
+        "datas": [str(dia) for dia in dias],
+        "valores": valores.tolist(),
+        "investido": investido.tolist(),
+        "fluxos": fluxos.tolist(),
+        "twr": calcular_twr(valores, fluxos) if len(dias) else None,
+    }
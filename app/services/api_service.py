@@ -1,39 +1,417 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
 import requests
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from flask import current_app  # Para acessar a API_KEY da configuração
 from decimal import Decimal
+from utils.instrumentacao import (
+    EstatisticasRequisicao,
+    chamada_externa,
+    estatisticas_requisicao,
+)
+
+logger = logging.getLogger(__name__)
+
+FUSO_B3 = ZoneInfo("America/Sao_Paulo")
+ABERTURA_PREGAO = 10  # hora de abertura do pregão regular da B3
+FECHAMENTO_PREGAO = 18  # hora de fechamento (inclui o call de fechamento)
+
+# Respostas da brapi para um lote com ticker inexistente
+STATUS_TICKER_INVALIDO = (400, 404)
 
 
 def buscar_cotacao_atual(ticker: str) -> Decimal:
     """Busca a cotação atual de um ativo usando a API brapi."""
 
-    # URL da API. Use o .format para inserir o Ticker
-    url = f"{current_app.config['BRAPI_API_BASE_URL']}{ticker}"
+    cotacoes = buscar_cotacoes([ticker])
+
+    # Se não encontrar dados (ex: ticker inválido)
+    return cotacoes.get(ticker.strip().upper(), Decimal("0"))
+
+
+def buscar_cotacoes(
+    tickers: list[str], usar_cache: bool = True, max_requisicoes: int | None = None
+) -> dict[str, Decimal]:
+    """
+    Busca as cotações atuais de vários ativos na API brapi.
+
+    A lista é dividida em lotes do tamanho aceito pelo provedor e os lotes são
+    consultados em paralelo. Tickers que falharem ficam de fora do dicionário
+    retornado, sem invalidar o restante do resultado.
+
+    Com `usar_cache`, as cotações ainda válidas são servidas do cache e só os
+    tickers ausentes (ou expirados) são consultados na API. `max_requisicoes`
+    limita quantos lotes são consultados ao mesmo tempo.
+    """
+
+    # Remove duplicados mantendo a ordem original
+    tickers_unicos = list(dict.fromkeys(t.strip().upper() for t in tickers if t))
+    if not tickers_unicos:
+        return {}
+
+    if not usar_cache:
+        return _buscar_cotacoes_provedor(tickers_unicos, max_requisicoes)
+
+    cache = obter_cache_cotacoes()
+    agora = time.time()
+    stale_while_revalidate = current_app.config["COTACAO_CACHE_STALE_WHILE_REVALIDATE"]
+    defasagem_maxima = current_app.config["COTACAO_CACHE_DEFASAGEM_MAXIMA"]
+
+    cotacoes = {}
+    ausentes = []
+    expirados = []
+    for ticker in tickers_unicos:
+        entrada = cache.obter(ticker)
+        if entrada is None:
+            ausentes.append(ticker)
+            continue
+
+        preco, expira_em = entrada
+        if expira_em > agora:
+            cotacoes[ticker] = preco
+        elif stale_while_revalidate and agora - expira_em <= defasagem_maxima:
+            # Serve a cotação vencida e atualiza em segundo plano
+            cotacoes[ticker] = preco
+            expirados.append(ticker)
+        else:
+            ausentes.append(ticker)
+
+    if ausentes:
+        novas_cotacoes = _buscar_cotacoes_provedor(ausentes, max_requisicoes)
+        _gravar_no_cache(cache, novas_cotacoes)
+        cotacoes.update(novas_cotacoes)
+
+    if expirados:
+        _revalidar_em_segundo_plano(cache, expirados)
+
+    return cotacoes
+
+
+def _buscar_cotacoes_provedor(
+    tickers_unicos: list[str], max_requisicoes: int | None = None
+) -> dict[str, Decimal]:
+    """Consulta o provedor configurado em lotes paralelos, sem passar pelo cache."""
+
+    if current_app.config["COTACOES_PROVEDOR"] == "fake":
+        return buscar_cotacoes_fake(tickers_unicos)
+
+    # A configuração (e as estatísticas da requisição, se houver) é lida aqui,
+    # pois as threads não têm o contexto da aplicação
+    estatisticas = estatisticas_requisicao()
+    url_base = current_app.config["BRAPI_API_BASE_URL"]
+    token = current_app.config["BRAPI_API_KEY"]
+    tamanho_lote = current_app.config["BRAPI_TICKERS_POR_REQUISICAO"]
+    max_requisicoes = (
+        max_requisicoes or current_app.config["BRAPI_MAX_REQUISICOES_SIMULTANEAS"]
+    )
+
+    lotes = [
+        tickers_unicos[i : i + tamanho_lote]
+        for i in range(0, len(tickers_unicos), tamanho_lote)
+    ]
+
+    cotacoes = {}
+    with ThreadPoolExecutor(max_workers=min(max_requisicoes, len(lotes))) as executor:
+        resultados = executor.map(
+            lambda lote: _buscar_lote_cotacoes(url_base, token, lote, estatisticas),
+            lotes,
+        )
+        for resultado in resultados:
+            cotacoes.update(resultado)
+
+    return cotacoes
+
+
+def _buscar_lote_cotacoes(
+    url_base: str,
+    token: str,
+    tickers: list[str],
+    estatisticas: EstatisticasRequisicao | None = None,
+) -> dict[str, Decimal]:
+    """
+    Consulta um lote de tickers em uma única requisição à brapi. O tempo da
+    chamada entra nas `estatisticas` da requisição que pediu as cotações.
+    """
+
+    # A brapi aceita vários tickers separados por vírgula na mesma URL
+    url = f"{url_base}{','.join(tickers)}"
 
     # Parâmetros de requisição (incluindo a API Key)
-    params = {"token": current_app.config["BRAPI_API_KEY"]}
+    params = {"token": token}
 
     try:
-        response = requests.get(url, params=params, timeout=5)
-        response.raise_for_status()  # Lança exceção para erros HTTP
+        with chamada_externa("brapi", estatisticas):
+            response = requests.get(url, params=params, timeout=5)
+            response.raise_for_status()  # Lança exceção para erros HTTP
         data = response.json()
 
+        cotacoes = {}
         # Estrutura da brapi (pode variar, cheque a documentação)
-        if data and "results" in data and len(data["results"]) > 0:
+        for resultado in data.get("results", []) if data else []:
+            simbolo = resultado.get("symbol")
             # O preço atual é o campo 'regularMarketPrice'
-            preco_float = data["results"][0].get("regularMarketPrice", 0)
+            preco_float = resultado.get("regularMarketPrice")
+
+            if simbolo and preco_float is not None:
+                # Converte para Decimal para precisão financeira
+                cotacoes[simbolo.upper()] = Decimal(str(preco_float))
+
+        return cotacoes
 
-            return Decimal(
-                str(preco_float)
-            )  # Converte para Decimal para precisão financeira
+    except requests.exceptions.HTTPError as e:
+        # Um ticker inválido faz a brapi recusar o lote inteiro (400/404). Divide o
+        # lote ao meio para recuperar as cotações dos tickers válidos. Limite de
+        # requisições (429) e falhas do servidor (5xx) não dependem dos tickers:
+        # dividir só multiplicaria as requisições, então o lote fica para a próxima.
+        status = e.response.status_code if e.response is not None else None
+        if status not in STATUS_TICKER_INVALIDO:
+            logger.warning("Erro ao buscar cotações para %s: %s", ", ".join(tickers), e)
+            return {}
 
-        # Se não encontrar dados (ex: ticker inválido)
-        return Decimal("0")
+        if len(tickers) > 1:
+            meio = len(tickers) // 2
+            cotacoes = _buscar_lote_cotacoes(
+                url_base, token, tickers[:meio], estatisticas
+            )
+            cotacoes.update(
+                _buscar_lote_cotacoes(url_base, token, tickers[meio:], estatisticas)
+            )
+            return cotacoes
 
+        logger.warning("Erro ao buscar cotação para %s: %s", tickers[0], e)
+        return {}
     except requests.exceptions.RequestException as e:
         # Trata erros de conexão ou Timeout
-        print(f"Erro ao buscar cotação para {ticker}: {e}")
-        return Decimal("0")
-    except Exception as e:
+        logger.warning("Erro ao buscar cotações para %s: %s", ", ".join(tickers), e)
+        return {}
+    except Exception:
         # Outros erros (JSON, etc)
-        print(f"Erro inesperado na API para {ticker}: {e}")
-        return Decimal("0")
+        logger.exception("Erro inesperado na API para %s", ", ".join(tickers))
+        return {}
+
+
+# Último preço gerado para cada ticker pelo provedor fake
+_precos_fake = {}
+_trava_precos_fake = threading.Lock()
+
+
+def buscar_cotacoes_fake(tickers: list[str]) -> dict[str, Decimal]:
+    """
+    Provedor de cotações para uso offline (desenvolvimento e testes).
+
+    O preço inicial de cada ticker é derivado do próprio ticker, e cada nova
+    consulta aplica uma variação aleatória de até 1%, imitando o pregão.
+    """
+
+    cotacoes = {}
+    with _trava_precos_fake:
+        for ticker in tickers:
+            preco = _precos_fake.get(ticker)
+            if preco is None:
+                preco = Decimal(5 + zlib.crc32(ticker.encode()) % 9500) / 100
+            else:
+                preco *= Decimal(str(round(1 + random.uniform(-0.01, 0.01), 4)))
+
+            preco = preco.quantize(Decimal("0.01"))
+            _precos_fake[ticker] = preco
+            cotacoes[ticker] = preco
+
+    return cotacoes
+
+
+# -----------------------------------------------------
+# CACHE DE COTAÇÕES
+# -----------------------------------------------------
+
+
+class CacheCotacoesMemoria:
+    """
+    Cache de cotações no próprio processo, limitado a `max_itens` entradas.
+    Quando o limite é atingido, descarta o ticker usado há mais tempo (LRU).
+    """
+
+    def __init__(self, max_itens: int):
+        self.max_itens = max_itens
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, ticker: str) -> tuple[Decimal, float] | None:
+        with self._trava:
+            entrada = self._entradas.get(ticker)
+            if entrada is not None:
+                self._entradas.move_to_end(ticker)
+            return entrada
+
+    def gravar(self, ticker: str, preco: Decimal, expira_em: float):
+        with self._trava:
+            self._entradas[ticker] = (preco, expira_em)
+            self._entradas.move_to_end(ticker)
+            while len(self._entradas) > self.max_itens:
+                self._entradas.popitem(last=False)
+
+
+class CacheCotacoesSQLite:
+    """
+    Cache de cotações em um arquivo SQLite, compartilhado entre os processos
+    (workers do gunicorn) da mesma máquina. Também é limitado a `max_itens`
+    entradas, descartando as acessadas há mais tempo.
+    """
+
+    def __init__(self, caminho: str, max_itens: int):
+        self.caminho = caminho
+        self.max_itens = max_itens
+
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS cotacoes_cache (
+                    ticker TEXT PRIMARY KEY,
+                    preco TEXT NOT NULL,
+                    expira_em REAL NOT NULL,
+                    acessado_em REAL NOT NULL
+                )
+                """)
+            conexao.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cotacoes_cache_acessado_em "
+                "ON cotacoes_cache (acessado_em)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        # Uma conexão por operação: o sqlite3 não compartilha conexões entre threads
+        conexao = sqlite3.connect(self.caminho, timeout=5)
+        try:
+            with conexao:  # Faz o commit (ou rollback) ao final do bloco
+                yield conexao
+        finally:
+            conexao.close()
+
+    def obter(self, ticker: str) -> tuple[Decimal, float] | None:
+        with self._conectar() as conexao:
+            linha = conexao.execute(
+                "SELECT preco, expira_em FROM cotacoes_cache WHERE ticker = ?",
+                (ticker,),
+            ).fetchone()
+            if linha is None:
+                return None
+
+            conexao.execute(
+                "UPDATE cotacoes_cache SET acessado_em = ? WHERE ticker = ?",
+                (time.time(), ticker),
+            )
+            # O preço é guardado como texto para não perder a precisão do Decimal
+            return Decimal(linha[0]), linha[1]
+
+    def gravar(self, ticker: str, preco: Decimal, expira_em: float):
+        with self._conectar() as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO cotacoes_cache "
+                "(ticker, preco, expira_em, acessado_em) VALUES (?, ?, ?, ?)",
+                (ticker, str(preco), expira_em, time.time()),
+            )
+            conexao.execute(
+                """
+                DELETE FROM cotacoes_cache WHERE ticker IN (
+                    SELECT ticker FROM cotacoes_cache
+                    ORDER BY acessado_em DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_itens,),
+            )
+
+
+def obter_cache_cotacoes():
+    """Retorna o cache de cotações da aplicação, criando-o no primeiro uso."""
+
+    cache = current_app.extensions.get("cache_cotacoes")
+    if cache is not None:
+        return cache
+
+    backend = current_app.config["COTACAO_CACHE_BACKEND"]
+    max_itens = current_app.config["COTACAO_CACHE_MAX_ITENS"]
+
+    if backend == "memoria":
+        cache = CacheCotacoesMemoria(max_itens)
+    elif backend == "sqlite":
+        caminho = current_app.config["COTACAO_CACHE_SQLITE_PATH"] or os.path.join(
+            current_app.instance_path, "cotacoes_cache.sqlite3"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        cache = CacheCotacoesSQLite(caminho, max_itens)
+    else:
+        raise ValueError(f"Backend de cache de cotações desconhecido: {backend}")
+
+    current_app.extensions["cache_cotacoes"] = cache
+    return cache
+
+
+def calcular_ttl_cotacao(agora: datetime | None = None) -> float:
+    """
+    Retorna por quantos segundos uma cotação pode ser reaproveitada.
+
+    Durante o pregão a cotação muda a todo instante, então o TTL é curto. Fora
+    do pregão ela fica parada, e o TTL é longo, mas nunca ultrapassa a próxima
+    abertura do mercado.
+    """
+
+    agora = agora or datetime.now(FUSO_B3)
+    ttl_pregao = current_app.config["COTACAO_CACHE_TTL_PREGAO"]
+    ttl_fora_pregao = current_app.config["COTACAO_CACHE_TTL_FORA_PREGAO"]
+
+    dia_util = agora.weekday() < 5
+    if dia_util and ABERTURA_PREGAO <= agora.hour < FECHAMENTO_PREGAO:
+        return ttl_pregao
+
+    # Calcula a próxima abertura (pula o fim de semana)
+    proxima_abertura = agora.replace(
+        hour=ABERTURA_PREGAO, minute=0, second=0, microsecond=0
+    )
+    if agora >= proxima_abertura:
+        proxima_abertura += timedelta(days=1)
+    while proxima_abertura.weekday() >= 5:
+        proxima_abertura += timedelta(days=1)
+
+    ate_abertura = (proxima_abertura - agora).total_seconds()
+    return max(ttl_pregao, min(ttl_fora_pregao, ate_abertura))
+
+
+def _gravar_no_cache(cache, cotacoes: dict[str, Decimal]):
+    expira_em = time.time() + calcular_ttl_cotacao()
+    for ticker, preco in cotacoes.items():
+        cache.gravar(ticker, preco, expira_em)
+
+
+# Tickers com atualização em andamento, para não disparar a mesma consulta duas vezes
+_revalidando = set()
+_trava_revalidacao = threading.Lock()
+_executor_revalidacao = ThreadPoolExecutor(max_workers=2)
+
+
+def _revalidar_em_segundo_plano(cache, tickers: list[str]):
+    with _trava_revalidacao:
+        pendentes = [t for t in tickers if t not in _revalidando]
+        _revalidando.update(pendentes)
+
+    if not pendentes:
+        return
+
+    app = current_app._get_current_object()
+
+    def revalidar():
+        try:
+            with app.app_context():
+                _gravar_no_cache(cache, _buscar_cotacoes_provedor(pendentes))
+        finally:
+            with _trava_revalidacao:
+                _revalidando.difference_update(pendentes)
+
+    _executor_revalidacao.submit(revalidar)
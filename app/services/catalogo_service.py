@@ -0,0 +1,306 @@
+"""
+Catálogo local dos instrumentos listados na B3 (ticker, nome, tipo e segmento)
+para o autocompletar dos formulários, sem consultas externas.
+
+O catálogo vem do arquivo distribuído com a aplicação (dados/catalogo_b3.csv)
+ou, se existir, da cópia atualizada pela brapi (flask ativos catalogo). A busca
+usa um índice em memória: termos (ticker e palavras do nome) em uma lista
+ordenada, percorrida por busca binária a partir do prefixo digitado, e um
+índice de deleções (um caractere removido de cada prefixo) que encontra termos
+a uma edição de distância, para tolerar erros de digitação.
+"""
+
+import bisect
+import csv
+import logging
+import os
+import threading
+import unicodedata
+import requests
+from flask import current_app
+from services.referencia_service import obter_referencias
+from utils.instrumentacao import chamada_externa
+
+logger = logging.getLogger(__name__)
+
+CATALOGO_DISTRIBUIDO = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "dados", "catalogo_b3.csv"
+)
+COLUNAS = ("ticker", "nome", "tipo", "segmento")
+
+# Tipos da brapi -> tipos de ativo da aplicação
+TIPOS_BRAPI = {"stock": "Ações", "fund": "FII", "bdr": "BDR"}
+
+# Prefixos considerados na tolerância a erros de digitação
+TAMANHO_MINIMO_APROXIMADO = 3
+TAMANHO_MAXIMO_APROXIMADO = 6
+
+# Termos percorridos, no máximo, por busca de prefixo
+MAXIMO_VARRIDOS = 300
+
+
+def normalizar(texto: str) -> str:
+    """Maiúsculas, sem acentos e só com letras, dígitos e espaços."""
+
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(
+        caractere if caractere.isalnum() else " "
+        for caractere in texto.upper()
+        if not unicodedata.combining(caractere)
+    ).strip()
+
+
+def _delecoes(termo: str) -> set[str]:
+    return {termo[:i] + termo[i + 1 :] for i in range(len(termo))}
+
+
+def _uma_edicao(a: str, b: str) -> bool:
+    """Indica se `b` difere de `a` em no máximo uma edição (inserção, remoção,
+    troca de um caractere ou inversão de dois vizinhos)."""
+
+    if abs(len(a) - len(b)) > 1:
+        return False
+
+    inicio = 0
+    while inicio < min(len(a), len(b)) and a[inicio] == b[inicio]:
+        inicio += 1
+    if inicio == len(a) == len(b):
+        return True
+
+    return (
+        a[inicio + 1 :] == b[inicio + 1 :]
+        or a[inicio:] == b[inicio + 1 :]
+        or a[inicio + 1 :] == b[inicio:]
+        or (
+            len(a) == len(b)
+            and a[inicio : inicio + 2] == b[inicio : inicio + 2][::-1]
+            and a[inicio + 2 :] == b[inicio + 2 :]
+        )
+    )
+
+
+class IndiceBusca:
+    """Índice de busca por prefixo e aproximada sobre uma lista de itens (dicts)."""
+
+    def __init__(self, itens: list[dict]):
+        self.itens = itens
+
+        # (termo, 0 = ticker / 1 = palavra do nome, posição do item)
+        termos = []
+        self._palavras = []
+        aproximados = {}
+        for posicao, item in enumerate(itens):
+            ticker = normalizar(item["ticker"]).replace(" ", "")
+            palavras = [p for p in normalizar(item["nome"]).split() if len(p) > 1]
+            self._palavras.append([ticker] + palavras)
+
+            termos.append((ticker, 0, posicao))
+            termos.extend((palavra, 1, posicao) for palavra in palavras)
+
+            for termo in [ticker] + palavras:
+                fim = min(len(termo), TAMANHO_MAXIMO_APROXIMADO)
+                for tamanho in range(TAMANHO_MINIMO_APROXIMADO, fim + 1):
+                    prefixo = termo[:tamanho]
+                    for chave in _delecoes(prefixo) | {prefixo}:
+                        aproximados.setdefault(chave, set()).add(posicao)
+
+        termos.sort()
+        self._termos = [termo for termo, _, _ in termos]
+        self._origens = [(origem, posicao) for _, origem, posicao in termos]
+        self._aproximados = {
+            chave: tuple(posicoes) for chave, posicoes in aproximados.items()
+        }
+
+    def buscar(self, consulta: str, limite: int = 10) -> list[dict]:
+        """
+        Até `limite` itens para a consulta, nesta ordem: ticker exato, tickers
+        que começam com o texto, nomes com palavras que começam com o texto e,
+        se faltarem resultados, termos a uma edição de distância.
+        """
+
+        palavras = normalizar(consulta).split()
+        if not palavras or limite <= 0:
+            return []
+
+        # A primeira palavra usa o índice; as demais filtram os candidatos
+        principal, demais = palavras[0], palavras[1:]
+        pontuacao = {}
+
+        inicio = bisect.bisect_left(self._termos, principal)
+        fim = min(len(self._termos), inicio + MAXIMO_VARRIDOS)
+        for indice in range(inicio, fim):
+            termo = self._termos[indice]
+            if not termo.startswith(principal):
+                break
+            origem, posicao = self._origens[indice]
+            nota = (0 if termo == principal else 1) if origem == 0 else 2
+            nota = (nota, len(termo))
+            if nota < pontuacao.get(posicao, (9,)):
+                pontuacao[posicao] = nota
+
+        if len(pontuacao) < limite and len(principal) >= TAMANHO_MINIMO_APROXIMADO:
+            prefixo = principal[:TAMANHO_MAXIMO_APROXIMADO]
+            candidatos = set()
+            for chave in _delecoes(prefixo) | {prefixo}:
+                candidatos.update(self._aproximados.get(chave, ()))
+
+            tamanhos = (len(prefixo) - 1, len(prefixo), len(prefixo) + 1)
+            for posicao in candidatos - pontuacao.keys():
+                # O ticker é o primeiro termo do item: aproximações dele vêm antes
+                for ordem, termo in enumerate(self._palavras[posicao]):
+                    if any(_uma_edicao(prefixo, termo[:t]) for t in tamanhos):
+                        pontuacao[posicao] = (3, min(ordem, 1))
+                        break
+
+        resultados = sorted(
+            (
+                (nota, self.itens[posicao]["ticker"], posicao)
+                for posicao, nota in pontuacao.items()
+                if all(
+                    any(p.startswith(palavra) for p in self._palavras[posicao])
+                    for palavra in demais
+                )
+            )
+        )
+        return [self.itens[posicao] for _, _, posicao in resultados[:limite]]
+
+
+# -----------------------------------------------------
+# CATÁLOGO
+# -----------------------------------------------------
+
+
+def caminho_catalogo_atualizado() -> str:
+    return current_app.config["CATALOGO_ARQUIVO"] or os.path.join(
+        current_app.instance_path, "catalogo_b3.csv"
+    )
+
+
+def ler_catalogo(caminho: str) -> list[dict]:
+    with open(caminho, encoding="utf-8", newline="") as arquivo:
+        return [
+            {coluna: (linha.get(coluna) or "").strip() for coluna in COLUNAS}
+            for linha in csv.DictReader(arquivo, delimiter=";")
+            if linha.get("ticker")
+        ]
+
+
+class Catalogo:
+    """Índice do catálogo, refeito quando o arquivo em uso muda."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arquivo = None
+        self._indice = None
+        # Índice dos ativos cadastrados, refeito quando o cache de referência recarrega
+        self._ativos = None
+        self._indice_ativos = None
+
+    def indice(self) -> IndiceBusca:
+        caminho = caminho_catalogo_atualizado()
+        if not os.path.exists(caminho):
+            caminho = CATALOGO_DISTRIBUIDO
+        arquivo = (caminho, os.stat(caminho).st_mtime_ns)
+
+        with self._lock:
+            if arquivo != self._arquivo:
+                self._indice = IndiceBusca(ler_catalogo(caminho))
+                self._arquivo = arquivo
+            return self._indice
+
+    def indice_ativos(self) -> IndiceBusca:
+        ativos = obter_referencias().listar("ativos")
+        with self._lock:
+            if ativos is not self._ativos:
+                self._indice_ativos = IndiceBusca(
+                    [
+                        {
+                            "ativo_id": ativo.id,
+                            "ticker": ativo.ticker,
+                            "nome": ativo.nome,
+                        }
+                        for ativo in ativos
+                    ]
+                )
+                self._ativos = ativos
+            return self._indice_ativos
+
+
+def obter_catalogo() -> Catalogo:
+    """Retorna o catálogo da aplicação, criando-o se preciso."""
+
+    catalogo = current_app.extensions.get("catalogo")
+    if catalogo is None:
+        catalogo = Catalogo()
+        current_app.extensions["catalogo"] = catalogo
+    return catalogo
+
+
+def buscar_no_catalogo(consulta: str, limite: int = 10) -> list[dict]:
+    """Instrumentos da B3 para a consulta (ticker, nome, tipo, segmento)."""
+    return obter_catalogo().indice().buscar(consulta, limite)
+
+
+def buscar_ativos_cadastrados(consulta: str, limite: int = 10) -> list[dict]:
+    """Ativos já cadastrados para a consulta (ativo_id, ticker, nome)."""
+    return obter_catalogo().indice_ativos().buscar(consulta, limite)
+
+
+def atualizar_catalogo_brapi(itens_por_pagina: int = 1000) -> int:
+    """
+    Baixa a lista de instrumentos da brapi e grava a cópia atualizada do
+    catálogo (trocada de forma atômica). Retorna a quantidade de instrumentos.
+    """
+
+    url = f"{current_app.config['BRAPI_API_BASE_URL']}list"
+    itens = {}
+    pagina = 1
+    while True:
+        with chamada_externa("brapi"):
+            response = requests.get(
+                url,
+                params={
+                    "token": current_app.config["BRAPI_API_KEY"],
+                    "limit": itens_por_pagina,
+                    "page": pagina,
+                },
+                timeout=30,
+            )
+            response.raise_for_status()
+        dados = response.json()
+
+        for instrumento in dados.get("stocks") or []:
+            ticker = (instrumento.get("stock") or "").strip().upper()
+            if not ticker:
+                continue
+            # FIIs e ETFs chegam como "fund"; os ETFs são reconhecidos pelo nome
+            tipo = TIPOS_BRAPI.get(instrumento.get("type"), "Ações")
+            nome = (instrumento.get("name") or ticker).strip()
+            if tipo == "FII" and (
+                "ETF" in nome.upper() or "INDICE" in normalizar(nome)
+            ):
+                tipo = "ETF"
+            itens[ticker] = {
+                "ticker": ticker,
+                "nome": nome,
+                "tipo": tipo,
+                "segmento": (instrumento.get("sector") or "").strip(),
+            }
+
+        if not dados.get("hasNextPage"):
+            break
+        pagina += 1
+
+    if not itens:
+        raise ValueError("A brapi não retornou nenhum instrumento.")
+
+    caminho = caminho_catalogo_atualizado()
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8", newline="") as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=COLUNAS, delimiter=";")
+        escritor.writeheader()
+        escritor.writerows(itens[ticker] for ticker in sorted(itens))
+    os.replace(temporario, caminho)
+
+    return len(itens)
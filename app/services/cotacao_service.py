@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from flask import current_app
+from models import db, Ativo, Cotacao, PosicaoAtivo
+from services.api_service import buscar_cotacoes
+from services.versao_service import incrementar_versao
+
+logger = logging.getLogger(__name__)
+
+# Casas decimais do preço gravado (Cotacao.preco, Numeric(15, 5))
+CINCO_CASAS = Decimal("0.00001")
+
+
+def listar_ativos_em_custodia() -> dict[str, int]:
+    """Retorna {ticker: ativo_id} dos ativos com custódia em alguma carteira."""
+
+    linhas = db.session.execute(
+        db.select(Ativo.ticker, Ativo.id)
+        .join(PosicaoAtivo, PosicaoAtivo.ativo_id == Ativo.id)
+        .where(PosicaoAtivo.custodia > 0)
+        .distinct()
+    ).all()
+
+    return {ticker.strip().upper(): ativo_id for ticker, ativo_id in linhas}
+
+
+def atualizar_cotacoes(max_requisicoes: int | None = None) -> int:
+    """
+    Busca no provedor as cotações dos ativos em custódia e grava na tabela
+    "cotacoes" as que mudaram de preço (ou ainda não existiam). Retorna
+    quantas cotações foram recebidas do provedor.
+
+    Só há gravação, e nova versão de "cotacoes", se algum preço mudou: fora do
+    pregão, o ETag do dashboard, os caches de páginas e a transmissão (SSE)
+    continuam válidos.
+    """
+
+    ativos = listar_ativos_em_custodia()
+    if not ativos:
+        return 0
+
+    max_requisicoes = (
+        max_requisicoes or current_app.config["COTACOES_ATUALIZADOR_CONCORRENCIA"]
+    )
+    # O atualizador é a fonte das cotações gravadas, então não usa o cache
+    cotacoes = buscar_cotacoes(
+        list(ativos), usar_cache=False, max_requisicoes=max_requisicoes
+    )
+    if not cotacoes:
+        return 0
+
+    agora = datetime.now()
+    existentes = {
+        cotacao.ativo_id: cotacao
+        for cotacao in db.session.execute(
+            db.select(Cotacao).where(
+                Cotacao.ativo_id.in_([ativos[t] for t in cotacoes])
+            )
+        ).scalars()
+    }
+
+    alteradas = 0
+    for ticker, preco in cotacoes.items():
+        ativo_id = ativos[ticker]
+        preco = Decimal(preco).quantize(CINCO_CASAS)
+        cotacao = existentes.get(ativo_id)
+        if cotacao is None:
+            db.session.add(Cotacao(ativo_id=ativo_id, preco=preco, atualizado_em=agora))
+        elif cotacao.preco != preco:
+            cotacao.preco = preco
+            cotacao.atualizado_em = agora
+        else:
+            continue
+        alteradas += 1
+
+    if not alteradas:
+        db.session.rollback()
+        return len(cotacoes)
+
+    # Avisa quem depende das cotações (ETag do dashboard, caches) da mudança
+    incrementar_versao("cotacoes")
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Erro ao gravar as cotações no DB: %s", e)
+        raise
+
+    return len(cotacoes)
+
+
+def executar_atualizador(
+    intervalo: int | None = None,
+    max_requisicoes: int | None = None,
+    parar: threading.Event | None = None,
+):
+    """
+    Atualiza as cotações a cada `intervalo` segundos até `parar` ser sinalizado.
+    Deve ser chamado dentro do contexto da aplicação.
+    """
+
+    intervalo = intervalo or current_app.config["COTACOES_ATUALIZADOR_INTERVALO"]
+    parar = parar or threading.Event()
+
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        try:
+            quantidade = atualizar_cotacoes(max_requisicoes)
+            duracao = time.perf_counter() - inicio
+            logger.info(
+                "Cotações atualizadas",
+                extra={"cotacoes": quantidade, "duracao_ms": round(duracao * 1000, 2)},
+            )
+        except Exception:
+            # Uma falha isolada não pode derrubar o atualizador
+            logger.exception("Erro ao atualizar cotações")
+        finally:
+            db.session.remove()
+
+        parar.wait(max(0, intervalo - (time.perf_counter() - inicio)))
+
+
+def iniciar_atualizador_em_segundo_plano(app) -> threading.Event:
+    """
+    Inicia o atualizador em uma thread do próprio processo. Retorna o evento
+    que encerra o laço quando sinalizado.
+    """
+
+    parar = threading.Event()
+
+    def rodar():
+        with app.app_context():
+            executar_atualizador(parar=parar)
+
+    threading.Thread(target=rodar, name="atualizador-cotacoes", daemon=True).start()
+    return parar
@@ -0,0 +1,116 @@
+from decimal import Decimal
+from sqlalchemy import func
+from models import db, PosicaoAtivo, Ativo, TipoAtivo, Cotacao
+
+
+def consultar_posicoes_dashboard(carteira_id: int | None = None):
+    """
+    Busca, em uma única consulta, as posições em aberto com os dados do ativo,
+    do tipo de ativo e a última cotação gravada pelo atualizador.
+
+    Os valores investido e de mercado e os totais por tipo, por segmento e
+    geral são calculados pelo banco (funções de janela), evitando carregar
+    ativo, tipo e cotação de cada posição separadamente.
+    """
+
+    preco_atual = func.coalesce(Cotacao.preco, 0)
+    valor_investido = PosicaoAtivo.custodia * PosicaoAtivo.preco_medio
+    valor_mercado = PosicaoAtivo.custodia * preco_atual
+
+    query = (
+        db.select(
+            Ativo.ticker,
+            Ativo.nome,
+            Ativo.segmento,
+            TipoAtivo.nome.label("tipo"),
+            PosicaoAtivo.custodia,
+            PosicaoAtivo.preco_medio,
+            preco_atual.label("preco_atual"),
+            Cotacao.atualizado_em.label("cotacao_atualizada_em"),
+            valor_investido.label("valor_investido"),
+            valor_mercado.label("valor_mercado"),
+            func.sum(valor_mercado)
+            .over(partition_by=TipoAtivo.id)
+            .label("mercado_tipo"),
+            func.sum(valor_investido)
+            .over(partition_by=Ativo.segmento)
+            .label("investido_segmento"),
+            func.sum(valor_investido).over().label("total_investido"),
+            func.sum(valor_mercado).over().label("total_valor_mercado"),
+        )
+        .join(Ativo, PosicaoAtivo.ativo_id == Ativo.id)
+        .join(TipoAtivo, Ativo.tipo_id == TipoAtivo.id)
+        .outerjoin(Cotacao, Cotacao.ativo_id == Ativo.id)
+        .where(PosicaoAtivo.custodia > 0)
+        .order_by(Ativo.ticker)
+    )
+
+    if carteira_id is not None:
+        query = query.where(PosicaoAtivo.carteira_id == carteira_id)
+
+    return db.session.execute(query).all()
+
+
+def montar_dados_dashboard(carteira_id: int | None = None) -> dict:
+    """
+    Monta os totais, as posições e as distribuições exibidas no dashboard.
+    As cotações vêm da tabela "cotacoes"; nenhuma API externa é consultada.
+    """
+
+    posicoes = consultar_posicoes_dashboard(carteira_id)
+
+    dados_dashboard = []
+    for posicao in posicoes:
+        # Cotação ausente é tratada como zero, como na consulta direta à API
+        preco_atual = Decimal(posicao.preco_atual)
+        valor_mercado_posicao = Decimal(posicao.valor_mercado)
+
+        lucro_prejuizo_posicao = valor_mercado_posicao - posicao.valor_investido
+
+        # Evita divisão por zero se o valor investido for 0
+        if posicao.valor_investido == 0:
+            percentual_valorizacao = Decimal("0")
+        else:
+            percentual_valorizacao = (
+                lucro_prejuizo_posicao / posicao.valor_investido
+            ) * Decimal("100")
+
+        dados_dashboard.append(
+            {
+                "ticker": posicao.ticker,
+                "nome": posicao.nome,
+                "custodia": posicao.custodia,
+                "preco_medio": posicao.preco_medio,
+                "preco_atual": preco_atual,
+                "cotacao_atualizada_em": posicao.cotacao_atualizada_em,
+                "valor_investido": posicao.valor_investido,
+                "valor_mercado": valor_mercado_posicao,
+                "lucro_prejuizo": lucro_prejuizo_posicao,
+                "percentual_valorizacao": percentual_valorizacao,
+                "tipo": posicao.tipo,
+            }
+        )
+
+    if posicoes:
+        total_investido = posicoes[0].total_investido
+        total_valor_mercado = Decimal(posicoes[0].total_valor_mercado)
+    else:
+        total_investido = Decimal("0")
+        total_valor_mercado = Decimal("0")
+
+    # AGRUPAMENTO PARA GRÁFICOS (já somado pelo banco em cada linha)
+    distribuicao_por_tipo = {
+        posicao.tipo: float(posicao.mercado_tipo) for posicao in posicoes
+    }
+    distribuicao_por_segmento = {
+        posicao.segmento: float(posicao.investido_segmento) for posicao in posicoes
+    }
+
+    return {
+        "dados": dados_dashboard,
+        "total_investido": total_investido,
+        "total_valor_mercado": total_valor_mercado,
+        "lucro_prejuizo": total_valor_mercado - total_investido,
+        "distribuicao_por_tipo": distribuicao_por_tipo,
+        "distribuicao_por_segmento": distribuicao_por_segmento,
+    }
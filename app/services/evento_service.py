@@ -0,0 +1,208 @@
+"""
+Eventos corporativos (desdobramento, grupamento, bonificação e proventos)
+aplicados de uma vez a todas as carteiras que têm o ativo.
+
+Cada evento grava uma operação por carteira (para que o recálculo pelo
+histórico chegue ao mesmo resultado) e atualiza as posições com um único
+UPDATE sobre posicao_ativos, sem reaplicar o histórico de cada uma. Só as
+posições com operações posteriores à data do evento (evento retroativo) são
+recalculadas pelo histórico.
+"""
+
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import case, func
+from models import db, Operacao, PosicaoAtivo
+from services.posicao_service import (
+    BONIFICACAO,
+    DESDOBRAMENTO,
+    GRUPAMENTO,
+    EFETIVADA,
+    TIPOS_PROVENTO,
+    _aplicar_operacao,
+    condicao_efetivada,
+    nomes_tipos_operacao,
+    recalcular_posicao_historico,
+    travar_posicoes,
+)
+from services.referencia_service import obter_referencias
+from services.valor_diario_service import invalidar_valor_diario
+from services.versao_service import incrementar_versao
+
+TIPOS_EVENTO = (DESDOBRAMENTO, GRUPAMENTO, BONIFICACAO) + TIPOS_PROVENTO
+
+
+def aplicar_evento_corporativo(
+    ativo_id: int,
+    tipo: str,
+    data: date,
+    fator: Decimal,
+    custo_unitario: Decimal = Decimal("0"),
+) -> dict[int, Operacao]:
+    """
+    Aplica o evento a todas as carteiras com o ativo em custódia na data.
+
+    `fator` depende do tipo: novas ações por ação no desdobramento (2 em um
+    desdobramento de 1 para 2); ações antigas por nova no grupamento (10 em um
+    grupamento de 10 para 1); ações recebidas por ação na bonificação (0.1 para
+    10%), com o custo atribuído em `custo_unitario`; e o valor por ação nos
+    proventos (Dividendo e JCP).
+
+    Tudo acontece em uma única transação. Retorna a operação gravada em cada
+    carteira ({carteira_id: operação}).
+    """
+
+    if tipo not in TIPOS_EVENTO:
+        raise ValueError(f"Tipo de evento inválido: {tipo}.")
+    if fator <= 0:
+        raise ValueError("O fator do evento deve ser maior que zero.")
+    if data > date.today():
+        raise ValueError("Registre o evento a partir da data em que ele ocorre.")
+
+    tipo_id = next(
+        (id_tipo for id_tipo, nome in nomes_tipos_operacao().items() if nome == tipo),
+        None,
+    )
+    status_id = obter_referencias().buscar_id("status_operacao", EFETIVADA)
+    if tipo_id is None or status_id is None:
+        raise ValueError(f"Tipo de operação '{tipo}' ou status não cadastrado.")
+
+    try:
+        # Carteiras que operaram o ativo até a data e, entre elas, as que têm
+        # operações depois (o evento é retroativo para essas)
+        carteiras = dict(
+            db.session.execute(
+                db.select(
+                    Operacao.carteira_id,
+                    func.max(case((Operacao.data > data, 1), else_=0)),
+                )
+                .where(Operacao.ativo_id == ativo_id, condicao_efetivada())
+                .group_by(Operacao.carteira_id)
+                .having(func.min(Operacao.data) <= data)
+            ).all()
+        )
+        travar_posicoes([(ativo_id, carteira_id) for carteira_id in carteiras])
+
+        atuais = [c for c, retroativo in carteiras.items() if not retroativo]
+        retroativas = [c for c, retroativo in carteiras.items() if retroativo]
+
+        # Custódia na data: a atual, se não houve operação depois; senão, a do histórico
+        custodias = dict(
+            db.session.execute(
+                db.select(PosicaoAtivo.carteira_id, PosicaoAtivo.custodia).where(
+                    PosicaoAtivo.ativo_id == ativo_id,
+                    PosicaoAtivo.carteira_id.in_(atuais),
+                )
+            ).all()
+        )
+        for carteira_id in retroativas:
+            custodias[carteira_id] = _custodia_na_data(ativo_id, carteira_id, data)
+
+        operacoes = {}
+        for carteira_id, custodia in custodias.items():
+            if not custodia or custodia <= 0:
+                continue
+            operacao = _montar_operacao(
+                tipo, fator, custo_unitario, custodia, data, tipo_id, status_id
+            )
+            operacao.ativo_id = ativo_id
+            operacao.carteira_id = carteira_id
+            operacao.calcular_valor_total()
+            operacoes[carteira_id] = operacao
+
+        if not operacoes:
+            db.session.rollback()
+            return {}
+
+        db.session.add_all(operacoes.values())
+        db.session.flush()
+
+        # Posições sem operações posteriores: um único UPDATE para todas
+        atualizar = [c for c in atuais if c in operacoes]
+        if atualizar and tipo not in TIPOS_PROVENTO:
+            db.session.execute(
+                db.update(PosicaoAtivo)
+                .where(
+                    PosicaoAtivo.ativo_id == ativo_id,
+                    PosicaoAtivo.carteira_id.in_(atualizar),
+                    PosicaoAtivo.custodia > 0,
+                )
+                .values(_novos_valores(tipo, fator, custo_unitario))
+                .execution_options(synchronize_session="fetch")
+            )
+
+        # Posições com operações posteriores: o evento entra no meio do histórico
+        for carteira_id in retroativas:
+            if carteira_id in operacoes:
+                recalcular_posicao_historico(ativo_id, carteira_id, a_partir_de=data)
+
+        for carteira_id in operacoes:
+            invalidar_valor_diario(carteira_id, data)
+        incrementar_versao("operacoes")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return operacoes
+
+
+def _montar_operacao(
+    tipo, fator, custo_unitario, custodia, data, tipo_id, status_id
+) -> Operacao:
+    """A operação do evento em uma carteira, no formato lido por _aplicar_operacao()."""
+
+    if tipo in (DESDOBRAMENTO, GRUPAMENTO):
+        quantidade, preco = fator, Decimal("0")
+    elif tipo == BONIFICACAO:
+        quantidade, preco = custodia * fator, custo_unitario
+    else:
+        quantidade, preco = custodia, fator
+
+    return Operacao(
+        data=data,
+        tipo_id=tipo_id,
+        quantidade=quantidade,
+        preco_unitario=preco,
+        custos=Decimal("0"),
+        status_id=status_id,
+    )
+
+
+def _novos_valores(tipo: str, fator: Decimal, custo_unitario: Decimal) -> dict:
+    """
+    Custódia e preço médio após o evento, como expressões SQL sobre os valores
+    atuais (o banco calcula todas as posições no mesmo UPDATE).
+    """
+
+    custodia = PosicaoAtivo.custodia
+    preco_medio = PosicaoAtivo.preco_medio
+
+    if tipo == DESDOBRAMENTO:
+        return {"custodia": custodia * fator, "preco_medio": preco_medio / fator}
+    if tipo == GRUPAMENTO:
+        return {"custodia": custodia / fator, "preco_medio": preco_medio * fator}
+
+    # Bonificação: as ações recebidas entram pelo custo atribuído
+    return {
+        "custodia": custodia * (1 + fator),
+        "preco_medio": (preco_medio + fator * custo_unitario) / (1 + fator),
+    }
+
+
+def _custodia_na_data(ativo_id: int, carteira_id: int, data: date) -> Decimal:
+    """Custódia da posição ao fim da data, reaplicando o histórico até ela."""
+
+    tipos = nomes_tipos_operacao()
+    custodia = preco_medio = Decimal("0")
+    for operacao in db.session.execute(
+        db.select(Operacao)
+        .filter_by(ativo_id=ativo_id, carteira_id=carteira_id)
+        .where(Operacao.data <= data, condicao_efetivada())
+        .order_by(Operacao.data, Operacao.registro, Operacao.id)
+        .execution_options(yield_per=1000)
+    ).scalars():
+        custodia, preco_medio = _aplicar_operacao(
+            custodia, preco_medio, operacao, tipos.get(operacao.tipo_id)
+        )
+    return custodia
@@ -0,0 +1,378 @@
+"""
+Histórico local de preços diários (OHLC) por ticker.
+
+Cada ticker fica em um arquivo .npy com uma matriz float64 de 6 linhas (dia,
+abertura, máxima, mínima, fechamento, volume) e uma coluna por pregão, em
+ordem de data. Cada campo é contíguo no arquivo (formato colunar), e o arquivo
+é aberto com memory-map: uma leitura por período só carrega o trecho pedido,
+localizado por busca binária nas datas.
+"""
+
+import csv
+import io
+import itertools
+import logging
+import os
+import random
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+import requests
+from flask import current_app
+from services.api_service import FUSO_B3
+from utils.conversao import converter_data, converter_decimal
+from utils.instrumentacao import (
+    EstatisticasRequisicao,
+    chamada_externa,
+    estatisticas_requisicao,
+)
+
+logger = logging.getLogger(__name__)
+
+# Linhas da matriz de cada ticker
+CAMPOS = ("dia", "abertura", "maxima", "minima", "fechamento", "volume")
+
+# Tickers aceitos (viram o nome do arquivo): só letras e números
+TICKER_VALIDO = re.compile(r"[A-Z0-9]{4,7}")
+
+# Nomes de coluna aceitos na importação de CSV (já em minúsculas)
+COLUNAS_CSV = {
+    "ticker": ("ticker", "codigo", "symbol"),
+    "data": ("data", "date"),
+    "abertura": ("abertura", "open"),
+    "maxima": ("maxima", "máxima", "high"),
+    "minima": ("minima", "mínima", "low"),
+    "fechamento": ("fechamento", "close", "adj close"),
+    "volume": ("volume",),
+}
+
+
+def _diretorio() -> str:
+    diretorio = current_app.config["HISTORICO_DIR"] or os.path.join(
+        current_app.instance_path, "historico"
+    )
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+
+def _caminho(ticker: str) -> str:
+    # Recusa antes de montar o caminho: "../x", "a/b" etc. sairiam do diretório
+    ticker = ticker.strip().upper()
+    if not TICKER_VALIDO.fullmatch(ticker):
+        raise ValueError(f"Ticker inválido: '{ticker}'.")
+    return os.path.join(_diretorio(), f"{ticker}.npy")
+
+
+def _abrir(ticker: str):
+    """Abre a matriz do ticker em memory-map, ou None se não houver histórico."""
+
+    import numpy as np
+
+    try:
+        caminho = _caminho(ticker)
+    except ValueError:
+        # Nenhum histórico é gravado para um ticker inválido
+        return None
+    if not os.path.exists(caminho):
+        return None
+    return np.load(caminho, mmap_mode="r")
+
+
+def ler_historico(
+    ticker: str, inicio: date | None = None, fim: date | None = None
+) -> dict:
+    """
+    Retorna as barras diárias do ticker entre `inicio` e `fim` (inclusive),
+    como arrays NumPy: "datas" (datetime64[D]) e os demais campos (float).
+    """
+
+    import numpy as np
+
+    matriz = _abrir(ticker)
+    if matriz is None:
+        vazio = np.array([], dtype=float)
+        return {
+            "datas": vazio.astype("datetime64[D]"),
+            **{c: vazio for c in CAMPOS[1:]},
+        }
+
+    dias = matriz[0]
+    primeiro = 0 if inicio is None else np.searchsorted(dias, _dia(inicio), "left")
+    ultimo = len(dias) if fim is None else np.searchsorted(dias, _dia(fim), "right")
+
+    # Copia apenas o trecho pedido para fora do memory-map
+    trecho = np.array(matriz[:, primeiro:ultimo])
+    return {
+        "datas": trecho[0].astype("int64").astype("datetime64[D]"),
+        **{campo: trecho[indice] for indice, campo in enumerate(CAMPOS) if indice},
+    }
+
+
+def fechamentos(tickers: list[str], datas) -> dict:
+    """
+    Preço de fechamento de cada ticker em cada data de `datas`, usando o último
+    pregão até a data (NaN antes do primeiro pregão ou sem histórico). Uma
+    busca binária por ticker, sem consultar o banco dia a dia.
+    """
+
+    import numpy as np
+
+    dias = np.asarray(datas, dtype="datetime64[D]").astype("int64").astype(float)
+    resultado = {}
+    for ticker in tickers:
+        matriz = _abrir(ticker)
+        precos = np.full(len(dias), np.nan)
+        if matriz is not None and matriz.shape[1]:
+            indices = np.searchsorted(matriz[0], dias, "right") - 1
+            validos = indices >= 0
+            precos[validos] = matriz[4][indices[validos]]
+        resultado[ticker] = precos
+    return resultado
+
+
+def gravar_historico(ticker: str, barras: dict) -> int:
+    """
+    Mescla as barras (mesmo formato de `ler_historico`) no histórico do ticker:
+    datas novas são acrescentadas e datas já existentes, substituídas. O
+    arquivo é reescrito por inteiro e trocado de forma atômica.
+    Retorna o total de pregões do ticker.
+    """
+
+    import numpy as np
+
+    novas = np.vstack(
+        [np.asarray(barras["datas"], dtype="datetime64[D]").astype("int64")]
+        + [np.asarray(barras[campo], dtype=float) for campo in CAMPOS[1:]]
+    ).astype(float)
+
+    existente = _abrir(ticker)
+    if existente is not None:
+        novas = np.hstack([np.array(existente), novas])
+
+    # Ordena por data mantendo a última ocorrência de cada dia (a mais nova)
+    invertida = novas[:, ::-1]
+    _, posicoes = np.unique(invertida[0], return_index=True)
+    matriz = np.ascontiguousarray(invertida[:, posicoes])
+
+    caminho = _caminho(ticker)
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "wb") as arquivo:
+        np.save(arquivo, matriz)
+    os.replace(temporario, caminho)
+
+    return matriz.shape[1]
+
+
+def listar_tickers_com_historico() -> list[str]:
+    return sorted(
+        nome[:-4] for nome in os.listdir(_diretorio()) if nome.endswith(".npy")
+    )
+
+
+def _dia(valor) -> float:
+    import numpy as np
+
+    return float(np.datetime64(valor, "D").astype("int64"))
+
+
+# -----------------------------------------------------
+# CARGA DO HISTÓRICO (PROVEDOR OU CSV)
+# -----------------------------------------------------
+
+
+def _buscar_historico_brapi(
+    ticker: str, periodo: str, estatisticas: EstatisticasRequisicao | None = None
+) -> dict | None:
+    """
+    Busca o histórico diário de um ticker na brapi (range/interval). O tempo
+    da chamada entra nas `estatisticas` da requisição que pediu a carga.
+    """
+
+    url = f"{current_app.config['BRAPI_API_BASE_URL']}{ticker}"
+    params = {
+        "token": current_app.config["BRAPI_API_KEY"],
+        "range": periodo,
+        "interval": "1d",
+    }
+
+    try:
+        with chamada_externa("brapi", estatisticas):
+            response = requests.get(url, params=params, timeout=30)
+            response.raise_for_status()
+        resultados = response.json().get("results") or []
+        barras = resultados[0].get("historicalDataPrice") or [] if resultados else []
+    except requests.exceptions.RequestException as e:
+        logger.warning("Erro ao buscar o histórico de %s: %s", ticker, e)
+        return None
+    except Exception:
+        logger.exception("Erro inesperado no histórico de %s", ticker)
+        return None
+
+    # "date" vem em segundos desde 1970 (UTC): o dia do pregão é o de Brasília,
+    # não o do fuso do servidor
+    barras = [barra for barra in barras if barra.get("close") is not None]
+    return {
+        "datas": [
+            datetime.fromtimestamp(barra["date"], FUSO_B3).date() for barra in barras
+        ],
+        "abertura": [barra.get("open") or barra["close"] for barra in barras],
+        "maxima": [barra.get("high") or barra["close"] for barra in barras],
+        "minima": [barra.get("low") or barra["close"] for barra in barras],
+        "fechamento": [barra["close"] for barra in barras],
+        "volume": [barra.get("volume") or 0 for barra in barras],
+    }
+
+
+def gerar_historico_fake(ticker: str, inicio: date, fim: date) -> dict:
+    """
+    Histórico simulado (uso offline), determinístico por ticker: passeio
+    aleatório diário a partir do mesmo preço base do provedor fake de cotações.
+    """
+
+    import numpy as np
+
+    dias = np.arange(
+        np.datetime64(inicio, "D"), np.datetime64(fim, "D") + np.timedelta64(1, "D")
+    )
+    dias = dias[np.is_busday(dias)]
+
+    gerador = random.Random(zlib.crc32(ticker.encode()))
+    preco = (5 + zlib.crc32(ticker.encode()) % 9500) / 100
+    fechamento = []
+    for _ in range(len(dias)):
+        preco = max(0.01, preco * (1 + gerador.gauss(0.0003, 0.015)))
+        fechamento.append(round(preco, 2))
+
+    fechamento = np.array(fechamento)
+    abertura = np.concatenate([fechamento[:1], fechamento[:-1]])
+    return {
+        "datas": dias,
+        "abertura": abertura,
+        "maxima": np.maximum(abertura, fechamento) * 1.005,
+        "minima": np.minimum(abertura, fechamento) * 0.995,
+        "fechamento": fechamento,
+        "volume": np.full(len(dias), 1_000_000.0),
+    }
+
+
+def _anos_antes(dia: date, anos: int) -> date:
+    """A mesma data `anos` antes; 29 de fevereiro vira 28 em ano não bissexto."""
+
+    try:
+        return dia.replace(year=dia.year - anos)
+    except ValueError:
+        return dia.replace(year=dia.year - anos, day=28)
+
+
+def carregar_historico_provedor(
+    tickers: list[str], periodo: str = "5y", max_requisicoes: int | None = None
+) -> dict[str, int]:
+    """
+    Busca no provedor configurado (COTACOES_PROVEDOR) o histórico diário dos
+    tickers e grava no histórico local. Retorna pregões gravados por ticker.
+    """
+
+    tickers = sorted({ticker.strip().upper() for ticker in tickers if ticker})
+    invalidos = [ticker for ticker in tickers if not TICKER_VALIDO.fullmatch(ticker)]
+    if invalidos:
+        logger.warning("Tickers inválidos ignorados: %s", ", ".join(invalidos))
+        tickers = [ticker for ticker in tickers if ticker not in invalidos]
+    resultado = {}
+
+    if current_app.config["COTACOES_PROVEDOR"] == "fake":
+        anos = int(periodo[:-1]) if periodo.endswith("y") else 5
+        fim = date.today()
+        inicio = _anos_antes(fim, anos)
+        for ticker in tickers:
+            resultado[ticker] = gravar_historico(
+                ticker, gerar_historico_fake(ticker, inicio, fim)
+            )
+        return resultado
+
+    # Uma requisição por ticker (o histórico não é aceito em lote), em paralelo
+    app = current_app._get_current_object()
+    estatisticas = estatisticas_requisicao()
+    max_requisicoes = (
+        max_requisicoes or current_app.config["BRAPI_MAX_REQUISICOES_SIMULTANEAS"]
+    )
+
+    def buscar(ticker):
+        with app.app_context():
+            return ticker, _buscar_historico_brapi(ticker, periodo, estatisticas)
+
+    with ThreadPoolExecutor(max_workers=max_requisicoes) as executor:
+        for ticker, barras in executor.map(buscar, tickers):
+            if barras and barras["datas"]:
+                resultado[ticker] = gravar_historico(ticker, barras)
+
+    return resultado
+
+
+def importar_historico_csv(arquivo, ticker: str | None = None) -> dict[str, int]:
+    """
+    Importa barras diárias de um CSV (uso offline). Colunas: data, abertura,
+    máxima, mínima, fechamento e volume (ou open/high/low/close/volume), além
+    de "ticker" quando o arquivo tem mais de um ativo. Datas em dd/mm/aaaa ou
+    aaaa-mm-dd; números com vírgula ou ponto decimal.
+    """
+
+    amostra = arquivo.read(4096)
+    amostra += arquivo.readline()
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+    except csv.Error:
+        dialeto = csv.excel
+
+    leitor = csv.reader(itertools.chain(io.StringIO(amostra), arquivo), dialeto)
+    cabecalho = [coluna.strip().lower() for coluna in next(leitor, [])]
+
+    indices = {}
+    for campo, apelidos in COLUNAS_CSV.items():
+        for apelido in apelidos:
+            if apelido in cabecalho:
+                indices[campo] = cabecalho.index(apelido)
+                break
+
+    if "data" not in indices or "fechamento" not in indices:
+        raise ValueError("O CSV precisa das colunas de data e de fechamento.")
+    if "ticker" not in indices and not ticker:
+        raise ValueError("Informe o ticker ou inclua a coluna 'ticker' no CSV.")
+
+    # Agrupa as barras por ticker antes de gravar (um arquivo por ticker)
+    barras = {}
+    for valores in leitor:
+        if not any(valor.strip() for valor in valores):
+            continue
+
+        def valor(campo, padrao=None):
+            if campo not in indices or not valores[indices[campo]].strip():
+                return padrao
+            return float(converter_decimal(valores[indices[campo]]))
+
+        codigo = (
+            (valores[indices["ticker"]] if "ticker" in indices else ticker)
+            .strip()
+            .upper()
+        )
+        fechamento = valor("fechamento")
+        colunas = barras.setdefault(
+            codigo, {campo: [] for campo in ("datas",) + CAMPOS[1:]}
+        )
+        colunas["datas"].append(converter_data(valores[indices["data"]]))
+        colunas["abertura"].append(valor("abertura", fechamento))
+        colunas["maxima"].append(valor("maxima", fechamento))
+        colunas["minima"].append(valor("minima", fechamento))
+        colunas["fechamento"].append(fechamento)
+        colunas["volume"].append(valor("volume", 0.0))
+
+    # Valida todos antes de gravar, para não importar o arquivo pela metade
+    invalidos = sorted(
+        codigo for codigo in barras if not TICKER_VALIDO.fullmatch(codigo)
+    )
+    if invalidos:
+        raise ValueError(f"Ticker inválido no CSV: {', '.join(invalidos)}.")
+
+    return {
+        codigo: gravar_historico(codigo, colunas) for codigo, colunas in barras.items()
+    }
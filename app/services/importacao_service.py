@@ -0,0 +1,322 @@
+import csv
+import io
+import itertools
+import time
+import unicodedata
+from collections import Counter
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from models import db, Ativo, Carteira, Operacao, StatusOperacao, TipoOperacao
+from services.posicao_service import (
+    TIPOS_FATOR,
+    recalcular_posicao_historico,
+    travar_posicoes,
+)
+from services.versao_service import incrementar_versao
+from utils.conversao import converter_data, converter_decimal
+
+# Nomes de coluna aceitos para cada campo (já normalizados: minúsculas, sem acento).
+# Cobrem o extrato de negociação da Área do Investidor da B3 e um CSV simples.
+COLUNAS = {
+    "data": ("data", "data do negocio", "data da operacao", "data do pregao"),
+    "ticker": ("ticker", "codigo de negociacao", "codigo", "ativo", "produto"),
+    "tipo": ("tipo", "tipo de movimentacao", "movimentacao", "operacao", "c/v"),
+    "quantidade": ("quantidade", "qtd", "qtde"),
+    "preco_unitario": ("preco", "preco unitario", "preco_unitario", "preco medio"),
+    "custos": ("custos", "taxas", "custo", "emolumentos"),
+    "carteira": ("carteira",),
+}
+
+# Termos usados pelos extratos para cada tipo de operação cadastrado
+SINONIMOS_TIPO = {
+    "c": "compra",
+    "v": "venda",
+    "juros sobre capital proprio": "jcp",
+    "rendimento": "dividendo",
+    "bonificacao em ativos": "bonificacao",
+    "desdobro": "desdobramento",
+}
+
+# Casas decimais da quantidade e do preço no banco (Numeric(15, 5))
+CINCO_CASAS = Decimal("0.00001")
+
+
+def _normalizar(texto: str) -> str:
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore")
+    return " ".join(sem_acento.decode().strip().lower().split())
+
+
+def ler_linhas_csv(arquivo):
+    """
+    Lê um CSV de extrato linha a linha (sem carregar o arquivo inteiro) e gera
+    tuplas (número da linha, dicionário campo -> texto).
+    """
+
+    # Completa a última linha da amostra para que ela termine em uma quebra de linha
+    amostra = arquivo.read(4096)
+    amostra += arquivo.readline()
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+    except csv.Error:
+        dialeto = csv.excel
+
+    # Devolve a amostra lida para a detecção antes do restante do arquivo
+    linhas = itertools.chain(io.StringIO(amostra), arquivo)
+
+    leitor = csv.reader(linhas, dialeto)
+    cabecalho = next(leitor, None)
+    if cabecalho is None:
+        return
+
+    # Mapeia cada campo conhecido para o índice da coluna correspondente
+    normalizados = [_normalizar(coluna) for coluna in cabecalho]
+    indices = {}
+    for campo, apelidos in COLUNAS.items():
+        for apelido in apelidos:
+            if apelido in normalizados:
+                indices[campo] = normalizados.index(apelido)
+                break
+
+    faltando = {"data", "ticker", "tipo", "quantidade", "preco_unitario"} - set(indices)
+    if faltando:
+        raise ValueError(
+            f"Colunas obrigatórias ausentes: {', '.join(sorted(faltando))}"
+        )
+
+    for numero, valores in enumerate(leitor, start=2):
+        if not any(valor.strip() for valor in valores):
+            continue
+        yield numero, {
+            campo: valores[indice] if indice < len(valores) else ""
+            for campo, indice in indices.items()
+        }
+
+
+def _chave_duplicidade(
+    data_operacao, ativo_id, tipo_id, quantidade, preco_unitario, carteira_id
+) -> tuple:
+    """Campos que identificam a mesma operação no arquivo e no banco."""
+
+    return (
+        data_operacao,
+        ativo_id,
+        tipo_id,
+        Decimal(quantidade).quantize(CINCO_CASAS),
+        Decimal(preco_unitario).quantize(CINCO_CASAS),
+        carteira_id,
+    )
+
+
+def importar_operacoes(
+    linhas,
+    carteira_id: int | None = None,
+    dry_run: bool = False,
+    tamanho_lote: int = 1000,
+) -> dict:
+    """
+    Importa operações a partir das linhas geradas por `ler_linhas_csv`.
+
+    Tickers, tipos, carteiras e status são resolvidos por mapas carregados uma
+    única vez. As operações são inseridas em lotes (executemany) e cada posição
+    (ativo, carteira) afetada é recalculada uma só vez, ao final. Com `dry_run`,
+    as linhas são apenas validadas, sem gravar nada.
+
+    Linhas iguais (data, ativo, tipo, quantidade, preço e carteira) a operações
+    já cadastradas são ignoradas e listadas em "duplicadas", para que importar
+    o mesmo extrato de novo não duplique as operações. Cada ocorrência no banco
+    cobre uma linha do arquivo: negócios repetidos no mesmo dia continuam sendo
+    importados. Cada linha recebe seu próprio "registro", em ordem crescente,
+    para que o recálculo das posições siga a ordem do arquivo.
+    """
+
+    inicio = time.perf_counter()
+
+    ativos = {
+        ticker.strip().upper(): ativo_id
+        for ativo_id, ticker in db.session.execute(db.select(Ativo.id, Ativo.ticker))
+    }
+    tipos = {
+        _normalizar(nome): tipo_id
+        for tipo_id, nome in db.session.execute(
+            db.select(TipoOperacao.id, TipoOperacao.nome)
+        )
+    }
+    tipos_fator = {tipos.get(_normalizar(nome)) for nome in TIPOS_FATOR} - {None}
+    carteiras = {
+        _normalizar(nome): id_carteira
+        for id_carteira, nome in db.session.execute(
+            db.select(Carteira.id, Carteira.nome)
+        )
+    }
+    status = {
+        nome: status_id
+        for status_id, nome in db.session.execute(
+            db.select(StatusOperacao.id, StatusOperacao.nome)
+        )
+    }
+    if "Efetivada" not in status or "Agendada" not in status:
+        raise ValueError("Status de operação não encontrado.")
+
+    hoje = date.today()
+    registro = datetime.now()
+    total_linhas = 0
+    importadas = 0
+    erros = []
+    duplicadas = []
+    # (número da linha, valores da operação) validadas e ainda não gravadas
+    lote = []
+    # Data mais antiga importada para cada posição (ativo, carteira)
+    posicoes_afetadas = {}
+
+    # Operações cadastradas antes da importação (id até `ultimo_id`) por chave de
+    # duplicidade, carregadas por dia de cada posição à medida que aparecem
+    ultimo_id = db.session.scalar(db.select(db.func.max(Operacao.id))) or 0
+    existentes = Counter()
+    dias_carregados = set()
+    vistas = Counter()
+
+    def carregar_existentes():
+        dias = {
+            (valores["ativo_id"], valores["carteira_id"], valores["data"])
+            for _, valores in lote
+        } - dias_carregados
+        if not dias:
+            return
+
+        datas = [data_operacao for _, _, data_operacao in dias]
+        consulta = db.select(
+            Operacao.data,
+            Operacao.ativo_id,
+            Operacao.tipo_id,
+            Operacao.quantidade,
+            Operacao.preco_unitario,
+            Operacao.carteira_id,
+        ).where(
+            Operacao.id <= ultimo_id,
+            Operacao.ativo_id.in_({ativo_id for ativo_id, _, _ in dias}),
+            Operacao.data.between(min(datas), max(datas)),
+        )
+        for operacao in db.session.execute(consulta):
+            if (operacao.ativo_id, operacao.carteira_id, operacao.data) in dias:
+                existentes[_chave_duplicidade(*operacao)] += 1
+        dias_carregados.update(dias)
+
+    def gravar_lote():
+        nonlocal importadas
+
+        carregar_existentes()
+        novas = []
+        for numero, valores in lote:
+            chave = _chave_duplicidade(
+                valores["data"],
+                valores["ativo_id"],
+                valores["tipo_id"],
+                valores["quantidade"],
+                valores["preco_unitario"],
+                valores["carteira_id"],
+            )
+            vistas[chave] += 1
+            if vistas[chave] <= existentes[chave]:
+                duplicadas.append(numero)
+                continue
+
+            novas.append(valores)
+            posicao = (valores["ativo_id"], valores["carteira_id"])
+            if (
+                posicao not in posicoes_afetadas
+                or valores["data"] < posicoes_afetadas[posicao]
+            ):
+                posicoes_afetadas[posicao] = valores["data"]
+
+        importadas += len(novas)
+        if novas and not dry_run:
+            db.session.execute(db.insert(Operacao), novas)
+        lote.clear()
+
+    for numero, campos in linhas:
+        total_linhas += 1
+        try:
+            # "PETR4 - PETROLEO BRASILEIRO" -> "PETR4"; "PETR4F" (fracionário) -> "PETR4"
+            ticker = campos["ticker"].split(" - ")[0].strip().upper()
+            if ticker not in ativos and ticker.endswith("F"):
+                ticker = ticker[:-1]
+            ativo_id = ativos.get(ticker)
+            if ativo_id is None:
+                raise ValueError(f"ativo '{ticker}' não cadastrado")
+
+            tipo_texto = _normalizar(campos["tipo"])
+            tipo_id = tipos.get(SINONIMOS_TIPO.get(tipo_texto, tipo_texto))
+            if tipo_id is None:
+                raise ValueError(f"tipo de operação '{campos['tipo']}' desconhecido")
+            if tipo_id in tipos_fator:
+                # O extrato traz as ações recebidas; a operação guarda o fator
+                raise ValueError(
+                    f"{campos['tipo']}: registre o evento com 'flask operacoes evento'"
+                )
+
+            if campos.get("carteira"):
+                id_carteira = carteiras.get(_normalizar(campos["carteira"]))
+                if id_carteira is None:
+                    raise ValueError(f"carteira '{campos['carteira']}' não cadastrada")
+            elif carteira_id is not None:
+                id_carteira = carteira_id
+            else:
+                raise ValueError("carteira não informada")
+
+            data_operacao = converter_data(campos["data"])
+            quantidade = abs(converter_decimal(campos["quantidade"]))
+            preco_unitario = abs(converter_decimal(campos["preco_unitario"]))
+            custos = abs(converter_decimal(campos.get("custos", "")))
+        except (ValueError, InvalidOperation) as e:
+            erros.append((numero, str(e)))
+            continue
+
+        lote.append(
+            (
+                numero,
+                {
+                    "data": data_operacao,
+                    "tipo_id": tipo_id,
+                    "ativo_id": ativo_id,
+                    "carteira_id": id_carteira,
+                    "quantidade": quantidade,
+                    "preco_unitario": preco_unitario,
+                    "custos": custos,
+                    # Mesmo cálculo de Operacao.calcular_valor_total()
+                    "valor_total": quantidade * preco_unitario + custos,
+                    "status_id": status[
+                        "Efetivada" if data_operacao <= hoje else "Agendada"
+                    ],
+                    # Um instante por linha: o recálculo ordena por (data, registro)
+                    "registro": registro + timedelta(microseconds=numero),
+                },
+            )
+        )
+
+        if len(lote) >= tamanho_lote:
+            gravar_lote()
+
+    gravar_lote()
+
+    if not dry_run:
+        # Um único recálculo por posição, a partir da operação mais antiga
+        # importada, gravado junto com as operações em um só commit
+        travar_posicoes(posicoes_afetadas)
+        for (ativo_id, id_carteira), data_inicial in posicoes_afetadas.items():
+            recalcular_posicao_historico(
+                ativo_id, id_carteira, a_partir_de=data_inicial
+            )
+        incrementar_versao("operacoes")
+        db.session.commit()
+
+    duracao = time.perf_counter() - inicio
+    return {
+        "linhas": total_linhas,
+        "importadas": importadas,
+        "erros": erros,
+        "duplicadas": duplicadas,
+        "posicoes_recalculadas": 0 if dry_run else len(posicoes_afetadas),
+        "dry_run": dry_run,
+        "segundos": duracao,
+        "linhas_por_segundo": total_linhas / duracao if duracao else 0,
+    }
@@ -0,0 +1,203 @@
+"""
+Apuração mensal do imposto de renda sobre o resultado das vendas (renda
+variável), a partir do livro de ganhos_realizados gravado pelo recálculo das
+posições, sem reaplicar as operações.
+
+Regras aplicadas:
+  - ações em operações comuns: isentas no mês em que as vendas comuns de ações
+    somam até R$ 20.000,00 (o prejuízo do mês isento continua compensável);
+  - operações comuns (ações, ETFs, BDRs) pagam 15%, day trade 20% e fundos
+    imobiliários 20%, cada grupo compensando apenas os próprios prejuízos,
+    acumulados de um mês para o outro;
+  - imposto abaixo de R$ 10,00 não gera DARF e passa para o mês seguinte.
+O imposto retido na fonte ("dedo-duro") não é descontado.
+"""
+
+import time
+from datetime import date
+from decimal import Decimal
+from itertools import groupby
+from sqlalchemy import extract, func
+from models import db, Ativo, GanhoRealizado
+from services.referencia_service import obter_referencias
+
+CENTAVO = Decimal("0.01")
+
+ISENCAO_ACOES = Decimal("20000")
+DARF_MINIMO = Decimal("10")
+
+# Grupos de apuração: cada um tem sua alíquota e seu prejuízo acumulado
+COMUM = "comum"
+DAY_TRADE = "day_trade"
+FII = "fii"
+ALIQUOTAS = {COMUM: Decimal("0.15"), DAY_TRADE: Decimal("0.20"), FII: Decimal("0.20")}
+
+# Tipos de ativo com regra própria (os demais seguem ações, sem a isenção),
+# pelo nome cadastrado em tipos_ativos (utils/database.carregar_dados_iniciais)
+TIPO_ACOES = "Ações"
+TIPO_FII = "FII"
+
+
+def carregar_resultados_mensais(
+    carteira_ids: list[int] | None = None, ate: date | None = None
+) -> list:
+    """
+    Vendas e resultado por mês e tipo de ativo, somados pelo banco em uma única
+    consulta agrupada. Linhas (ano, mes, tipo_id, valor_venda, resultado,
+    valor_venda_day_trade, resultado_day_trade), em ordem cronológica.
+    """
+
+    ano = extract("year", GanhoRealizado.data).label("ano")
+    mes = extract("month", GanhoRealizado.data).label("mes")
+    query = (
+        db.select(
+            ano,
+            mes,
+            Ativo.tipo_id,
+            func.sum(GanhoRealizado.valor_venda).label("valor_venda"),
+            func.sum(GanhoRealizado.resultado).label("resultado"),
+            func.sum(GanhoRealizado.valor_venda_day_trade).label(
+                "valor_venda_day_trade"
+            ),
+            func.sum(GanhoRealizado.resultado_day_trade).label("resultado_day_trade"),
+        )
+        .join(Ativo, Ativo.id == GanhoRealizado.ativo_id)
+        .group_by(ano, mes, Ativo.tipo_id)
+        .order_by(ano, mes, Ativo.tipo_id)
+    )
+    if carteira_ids:
+        query = query.where(GanhoRealizado.carteira_id.in_(carteira_ids))
+    if ate is not None:
+        query = query.where(GanhoRealizado.data <= ate)
+
+    return db.session.execute(query).all()
+
+
+def _decimal(valor) -> Decimal:
+    # O SQLite devolve as somas como float
+    return Decimal(str(valor or 0)).quantize(CENTAVO)
+
+
+def apurar_imposto(
+    carteira_ids: list[int] | None = None, ano: int | None = None
+) -> dict:
+    """
+    Apuração mês a mês das carteiras informadas (todas, se None). Os prejuízos
+    são acumulados desde a primeira venda; com `ano`, só os meses dele são
+    retornados.
+
+    Retorna {"meses": [...], "prejuizos": {grupo: valor a compensar},
+    "imposto_pendente": valor abaixo do mínimo do DARF, "segundos": duração}.
+    """
+
+    inicio = time.perf_counter()
+    nomes_tipos = {
+        linha.id: linha.nome for linha in obter_referencias().listar("tipos_ativo")
+    }
+    # Sem eles, as vendas de ações e de FIIs cairiam na regra geral sem aviso
+    faltando = [
+        nome for nome in (TIPO_ACOES, TIPO_FII) if nome not in nomes_tipos.values()
+    ]
+    if faltando:
+        raise ValueError(
+            f"Tipo de ativo não cadastrado: {', '.join(faltando)} "
+            "(veja utils/database.carregar_dados_iniciais)."
+        )
+    linhas = carregar_resultados_mensais(
+        carteira_ids, date(ano, 12, 31) if ano else None
+    )
+
+    meses = []
+    prejuizos = {grupo: Decimal("0") for grupo in ALIQUOTAS}
+    pendente = Decimal("0")
+
+    for ano_mes, linhas_mes in groupby(
+        linhas, key=lambda linha: (int(linha.ano), int(linha.mes))
+    ):
+        tipos = [
+            {
+                "tipo": nomes_tipos.get(linha.tipo_id, str(linha.tipo_id)),
+                "valor_venda": _decimal(linha.valor_venda),
+                "resultado": _decimal(linha.resultado),
+                "valor_venda_day_trade": _decimal(linha.valor_venda_day_trade),
+                "resultado_day_trade": _decimal(linha.resultado_day_trade),
+            }
+            for linha in linhas_mes
+        ]
+        mes = _apurar_mes(ano_mes, tipos, prejuizos, pendente)
+        pendente = mes["imposto_pendente"]
+        meses.append(mes)
+
+    if ano:
+        meses = [mes for mes in meses if mes["mes"].year == ano]
+
+    return {
+        "meses": meses,
+        "prejuizos": prejuizos,
+        "imposto_pendente": pendente,
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+def _apurar_mes(
+    ano_mes: tuple[int, int], tipos: list[dict], prejuizos: dict, pendente: Decimal
+) -> dict:
+    """Apura um mês, atualizando `prejuizos` (acumulado por grupo) no lugar."""
+
+    vendas_acoes = sum(
+        (tipo["valor_venda"] for tipo in tipos if tipo["tipo"] == TIPO_ACOES),
+        Decimal("0"),
+    )
+    isento = vendas_acoes <= ISENCAO_ACOES
+
+    resultados = {grupo: Decimal("0") for grupo in ALIQUOTAS}
+    ganho_isento = Decimal("0")
+    for tipo in tipos:
+        if tipo["tipo"] == TIPO_FII:
+            resultados[FII] += tipo["resultado"] + tipo["resultado_day_trade"]
+            continue
+
+        resultados[DAY_TRADE] += tipo["resultado_day_trade"]
+        if tipo["tipo"] == TIPO_ACOES and isento and tipo["resultado"] > 0:
+            ganho_isento += tipo["resultado"]
+        else:
+            resultados[COMUM] += tipo["resultado"]
+
+    grupos = {}
+    imposto = Decimal("0")
+    for grupo, resultado in resultados.items():
+        compensado = Decimal("0")
+        base = Decimal("0")
+        if resultado < 0:
+            prejuizos[grupo] += -resultado
+        else:
+            compensado = min(resultado, prejuizos[grupo])
+            prejuizos[grupo] -= compensado
+            base = resultado - compensado
+
+        imposto_grupo = (base * ALIQUOTAS[grupo]).quantize(CENTAVO)
+        imposto += imposto_grupo
+        grupos[grupo] = {
+            "resultado": resultado,
+            "prejuizo_compensado": compensado,
+            "base_calculo": base,
+            "aliquota": ALIQUOTAS[grupo],
+            "imposto": imposto_grupo,
+            "prejuizo_acumulado": prejuizos[grupo],
+        }
+
+    # Abaixo do mínimo, o imposto é somado ao do mês seguinte
+    devido = imposto + pendente
+    darf = devido if devido >= DARF_MINIMO else Decimal("0")
+
+    return {
+        "mes": date(ano_mes[0], ano_mes[1], 1),
+        "tipos": tipos,
+        "vendas_acoes": vendas_acoes,
+        "isento": isento,
+        "ganho_isento": ganho_isento,
+        "grupos": grupos,
+        "imposto": imposto,
+        "darf": darf,
+        "imposto_pendente": devido - darf,
+    }
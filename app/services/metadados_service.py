@@ -0,0 +1,262 @@
+"""
+Consulta do nome e do segmento de um ticker, com cache persistente.
+
+O resultado fica na tabela "ticker_metadados", inclusive quando o ticker não é
+encontrado (por menos tempo), para não gastar consultas ao provedor com os
+mesmos códigos. Consultas simultâneas do mesmo ticker no processo são
+agrupadas em uma só, e as chamadas ao provedor passam por um limite de taxa.
+
+Provedores são funções ticker -> {"nome", "segmento"} ou None (não
+encontrado); erros de comunicação devem ser levantados como exceção.
+"""
+
+import logging
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from models import db, TickerMetadados
+from utils.instrumentacao import chamada_externa
+
+logger = logging.getLogger(__name__)
+
+# Sufixos de bolsa aceitos no código digitado (PETR4.SA, PETR4:BVMF, ...)
+SUFIXOS = re.compile(r"(\.SAO|\.SA|\.BVMF|:BVMF)$")
+
+
+class ConsultaIndisponivel(Exception):
+    """O provedor falhou ou o limite de consultas foi atingido."""
+
+
+# -----------------------------------------------------
+# PROVEDORES
+# -----------------------------------------------------
+
+
+def buscar_metadados_serpapi(ticker: str) -> dict | None:
+    """Busca o ticker no Google Finance (SerpApi)."""
+
+    from serpapi import GoogleSearch
+
+    params = {
+        "api_key": current_app.config["SERPAPI_API_KEY"],
+        "engine": "google_finance",
+        "q": f"{ticker}:BVMF",
+        "hl": "pt-br",
+    }
+
+    with chamada_externa("serpapi"):
+        resultados = GoogleSearch(params).get_dict()
+    if "error" in resultados and "summary" not in resultados:
+        # A SerpApi informa "ticker não encontrado" também como erro
+        if "results" in resultados["error"].lower():
+            return None
+        raise ConsultaIndisponivel(resultados["error"])
+
+    summary = resultados.get("summary")
+    if not summary or not summary.get("title"):
+        return None
+
+    # O Google Finance não informa o segmento
+    return {"nome": summary["title"], "segmento": ""}
+
+
+def buscar_metadados_fake(ticker: str) -> dict | None:
+    """
+    Provedor para uso offline (desenvolvimento e testes): encontra qualquer
+    código no formato da B3 (4 letras e 1 ou 2 dígitos).
+    """
+
+    if not re.fullmatch(r"[A-Z]{4}\d{1,2}", ticker):
+        return None
+
+    segmentos = ("Financeiro", "Energia", "Varejo", "Imobiliário", "Saúde")
+    return {
+        "nome": f"{ticker[:4]} S.A. (simulado)",
+        "segmento": segmentos[zlib.crc32(ticker.encode()) % len(segmentos)],
+    }
+
+
+PROVEDORES = {
+    "serpapi": buscar_metadados_serpapi,
+    "fake": buscar_metadados_fake,
+}
+
+
+# -----------------------------------------------------
+# LIMITE DE TAXA E CONSULTAS AGRUPADAS
+# -----------------------------------------------------
+
+
+class BaldeTokens:
+    """Limite de taxa: `taxa` consultas por segundo, com rajadas de até `capacidade`."""
+
+    def __init__(self, taxa: float, capacidade: int):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = float(capacidade)
+        self._atualizado_em = time.monotonic()
+        self._trava = threading.Lock()
+
+    def consumir(self, espera_maxima: float = 0.0) -> bool:
+        """Retira um token, esperando até `espera_maxima` segundos. False se não conseguir."""
+
+        limite = time.monotonic() + espera_maxima
+        while True:
+            with self._trava:
+                agora = time.monotonic()
+                self._tokens = min(
+                    self.capacidade,
+                    self._tokens + (agora - self._atualizado_em) * self.taxa,
+                )
+                self._atualizado_em = agora
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                espera = (1 - self._tokens) / self.taxa
+
+            if agora + espera > limite:
+                return False
+            time.sleep(espera)
+
+
+class _Chamada:
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class ChamadaUnica:
+    """
+    Agrupa chamadas simultâneas com a mesma chave: só a primeira executa a
+    função; as demais esperam e recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._em_andamento = {}
+
+    def executar(self, chave, funcao):
+        with self._trava:
+            chamada = self._em_andamento.get(chave)
+            primeira = chamada is None
+            if primeira:
+                chamada = self._em_andamento[chave] = _Chamada()
+
+        if not primeira:
+            chamada.concluida.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = funcao()
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._trava:
+                del self._em_andamento[chave]
+            chamada.concluida.set()
+
+        return chamada.resultado
+
+
+class ConsultorMetadados:
+    def __init__(self, taxa: float, rajada: int):
+        self.balde = BaldeTokens(taxa, rajada)
+        self.chamadas = ChamadaUnica()
+
+
+def obter_consultor() -> ConsultorMetadados:
+    """Retorna o limitador e o agrupador de consultas da aplicação, criando-os se preciso."""
+
+    consultor = current_app.extensions.get("metadados")
+    if consultor is None:
+        consultor = ConsultorMetadados(
+            current_app.config["METADADOS_TAXA"], current_app.config["METADADOS_RAJADA"]
+        )
+        current_app.extensions["metadados"] = consultor
+    return consultor
+
+
+# -----------------------------------------------------
+# CONSULTA
+# -----------------------------------------------------
+
+
+def normalizar_ticker(ticker: str) -> str:
+    return SUFIXOS.sub("", ticker.strip().upper())
+
+
+def consultar_metadados(ticker: str) -> dict | None:
+    """
+    Retorna {"nome", "segmento"} do ticker, ou None se o provedor não o
+    conhece. Usa o cache enquanto válido; caso contrário consulta o provedor
+    configurado (METADADOS_PROVEDOR) e grava o resultado.
+    Levanta ConsultaIndisponivel se o provedor falhar ou o limite for atingido.
+    """
+
+    ticker = normalizar_ticker(ticker)
+    if not ticker or len(ticker) > 20:
+        return None
+
+    metadados = db.session.get(TickerMetadados, ticker)
+    if metadados is not None and not _expirado(metadados):
+        return _resultado(metadados)
+
+    consultor = obter_consultor()
+    app = current_app._get_current_object()
+
+    def buscar():
+        if not consultor.balde.consumir(app.config["METADADOS_ESPERA_MAXIMA"]):
+            raise ConsultaIndisponivel("Limite de consultas ao provedor atingido.")
+
+        provedor = PROVEDORES[app.config["METADADOS_PROVEDOR"]]
+        try:
+            return provedor(ticker)
+        except ConsultaIndisponivel:
+            raise
+        except Exception as e:
+            raise ConsultaIndisponivel(f"Erro ao consultar {ticker}: {e}") from e
+
+    encontrado = consultor.chamadas.executar(ticker, buscar)
+    _gravar(ticker, encontrado)
+    return encontrado
+
+
+def _expirado(metadados: TickerMetadados) -> bool:
+    horas = current_app.config[
+        "METADADOS_TTL" if metadados.encontrado else "METADADOS_TTL_NAO_ENCONTRADO"
+    ]
+    return metadados.consultado_em < datetime.now() - timedelta(hours=horas)
+
+
+def _resultado(metadados: TickerMetadados) -> dict | None:
+    if not metadados.encontrado:
+        return None
+    return {"nome": metadados.nome, "segmento": metadados.segmento or ""}
+
+
+def _gravar(ticker: str, encontrado: dict | None):
+    """Grava o resultado da consulta (mesmo quando o ticker não existe)."""
+
+    try:
+        db.session.merge(
+            TickerMetadados(
+                ticker=ticker,
+                nome=encontrado["nome"][:100] if encontrado else None,
+                segmento=encontrado["segmento"][:100] if encontrado else None,
+                encontrado=encontrado is not None,
+                consultado_em=datetime.now(),
+            )
+        )
+        db.session.commit()
+    except IntegrityError:
+        # Outro processo gravou o mesmo ticker ao mesmo tempo: vale o dele
+        db.session.rollback()
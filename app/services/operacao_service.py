@@ -0,0 +1,103 @@
+from models import db, Operacao
+from services.posicao_service import (
+    recalcular_posicao,
+    recalcular_posicao_historico,
+    travar_posicoes,
+)
+from services.versao_service import incrementar_versao
+
+
+def registrar_operacao(operacao: Operacao) -> Operacao:
+    """
+    Grava uma nova operação e atualiza a posição correspondente em uma única
+    transação (um só commit). Em caso de erro, nada é gravado.
+    """
+
+    try:
+        travar_posicoes([(operacao.ativo_id, operacao.carteira_id)])
+
+        db.session.add(operacao)
+        db.session.flush()
+
+        recalcular_posicao(operacao)
+        incrementar_versao("operacoes")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return operacao
+
+
+def atualizar_operacao(operacao: Operacao, **campos) -> Operacao:
+    """
+    Altera os campos informados da operação e recalcula, na mesma transação,
+    a posição atual e a posição que deixou de ser afetada (se o ativo ou a
+    carteira mudaram).
+    """
+
+    ativo_id_original = operacao.ativo_id
+    carteira_id_original = operacao.carteira_id
+    data_original = operacao.data
+
+    try:
+        travar_posicoes(
+            [
+                (ativo_id_original, carteira_id_original),
+                (
+                    campos.get("ativo_id", ativo_id_original),
+                    campos.get("carteira_id", carteira_id_original),
+                ),
+            ]
+        )
+
+        for campo, valor in campos.items():
+            setattr(operacao, campo, valor)
+        operacao.calcular_valor_total()
+        db.session.flush()
+
+        # 1. Se os IDs mudaram (ativo ou carteira), recalcula a posição que foi 'abandonada'
+        if (
+            ativo_id_original != operacao.ativo_id
+            or carteira_id_original != operacao.carteira_id
+        ):
+            recalcular_posicao_historico(
+                ativo_id_original, carteira_id_original, a_partir_de=data_original
+            )
+            a_partir_de = operacao.data
+        else:
+            # A operação pode ter mudado de data: vale a mais antiga das duas
+            a_partir_de = min(data_original, operacao.data)
+
+        # 2. Recalcula a posição atual (ou a nova, se o ativo/carteira mudou)
+        recalcular_posicao_historico(
+            operacao.ativo_id, operacao.carteira_id, a_partir_de=a_partir_de
+        )
+        incrementar_versao("operacoes")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return operacao
+
+
+def excluir_operacao(operacao: Operacao):
+    """Exclui a operação e recalcula a posição afetada, na mesma transação."""
+
+    ativo_id = operacao.ativo_id
+    carteira_id = operacao.carteira_id
+    data = operacao.data
+
+    try:
+        travar_posicoes([(ativo_id, carteira_id)])
+
+        db.session.delete(operacao)
+        db.session.flush()
+
+        recalcular_posicao_historico(ativo_id, carteira_id, a_partir_de=data)
+        incrementar_versao("operacoes")
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
@@ -1,28 +1,150 @@
+from datetime import date, timedelta
 from decimal import Decimal
-from models import db, PosicaoAtivo, Operacao
+from itertools import groupby
+from operator import attrgetter
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import true, tuple_
+from sqlalchemy.exc import IntegrityError
+from models import (
+    db,
+    GanhoRealizado,
+    PosicaoAtivo,
+    PosicaoSnapshot,
+    Operacao,
+    VersaoDados,
+)
+from services.referencia_service import obter_referencias
+from services.valor_diario_service import invalidar_valor_diario
+from services.versao_service import incrementar_versao
+
+# Tipos de operação (cadastrados em utils/database.py) e o efeito de cada um:
+#  - Compra e Bonificação somam a quantidade à custódia e o valor total ao custo
+#    (na bonificação, o preço unitário é o custo atribuído às ações recebidas);
+#  - Venda reduz a custódia, mantendo o preço médio;
+#  - Desdobramento e Grupamento trazem o fator na quantidade (2 em um
+#    desdobramento de 1 para 2; 10 em um grupamento de 10 para 1): a custódia é
+#    multiplicada (ou dividida) por ele e o custo total não muda;
+#  - Dividendo e JCP são proventos: não alteram a posição.
+COMPRA = "Compra"
+VENDA = "Venda"
+DIVIDENDO = "Dividendo"
+JCP = "JCP"
+BONIFICACAO = "Bonificação"
+DESDOBRAMENTO = "Desdobramento"
+GRUPAMENTO = "Grupamento"
+
+TIPOS_AQUISICAO = (COMPRA, BONIFICACAO)
+TIPOS_FATOR = (DESDOBRAMENTO, GRUPAMENTO)
+TIPOS_PROVENTO = (DIVIDENDO, JCP)
+
+# Operações com data futura ficam agendadas e não alteram a posição
+EFETIVADA = "Efetivada"
+AGENDADA = "Agendada"
+
+CENTAVO = Decimal("0.01")
+
+# Versão das regras de cálculo da posição. Ao mudar uma regra (proventos
+# deixaram de reduzir a custódia na versão 1), as posições e os snapshots
+# gravados pelas regras anteriores são refeitos no deploy, com
+# "flask operacoes reprocessar --se-desatualizadas".
+VERSAO_REGRAS = 1
+
+
+def nomes_tipos_operacao() -> dict[int, str]:
+    """{id: nome} dos tipos de operação (do cache de dados de referência)."""
+    return {
+        linha.id: linha.nome for linha in obter_referencias().listar("tipos_operacao")
+    }
+
+
+def id_status_agendada() -> int | None:
+    return obter_referencias().buscar_id("status_operacao", AGENDADA)
+
+
+def condicao_efetivada():
+    """
+    Condição SQL das operações que entram na posição: todas, menos as
+    agendadas (que só contam depois de efetivadas, ver
+    services/agendamento_service.py).
+    """
+
+    agendada = id_status_agendada()
+    return true() if agendada is None else Operacao.status_id != agendada
 
 
 def recalcular_posicao(operacao: Operacao):
     """
     Recalcula a custódia e o preço médio de um ativo para uma carteira específica
-    após a realização de uma nova operação (que deve estar salva no DB).
+    após a realização de uma nova operação (que deve estar salva no DB). Se for
+    uma venda, grava também o seu resultado (ganhos_realizados).
+
+    Não faz commit: a transação é controlada por quem chama (ver
+    services/operacao_service.py), que também trava a posição antes.
     """
 
-    # Use 'with_for_update()' se você estiver em um ambiente concorrido para travar a linha
-    # Mas vamos manter o básico por enquanto para evitar Deadlocks.
-    posicao = PosicaoAtivo.query.filter_by(
-        ativo_id=operacao.ativo_id, carteira_id=operacao.carteira_id
+    # Operação agendada: só entra na posição quando for efetivada
+    if operacao.status_id == id_status_agendada():
+        return
+
+    # Os valores diários já gravados a partir da data da operação ficam desatualizados
+    invalidar_valor_diario(operacao.carteira_id, operacao.data)
+
+    # Operação retroativa: as posteriores precisam ser reaplicadas na ordem certa
+    existe_posterior = db.session.execute(
+        db.select(Operacao.id)
+        .filter_by(ativo_id=operacao.ativo_id, carteira_id=operacao.carteira_id)
+        .where(Operacao.data > operacao.data, condicao_efetivada())
+        .limit(1)
     ).first()
+    if existe_posterior:
+        recalcular_posicao_historico(
+            operacao.ativo_id, operacao.carteira_id, a_partir_de=operacao.data
+        )
+        return
+
+    # Compra e venda no mesmo dia formam day trade: o dia inteiro é reapurado
+    tipos = nomes_tipos_operacao()
+    tipo = tipos.get(operacao.tipo_id)
+    if tipo in (COMPRA, VENDA):
+        oposta = VENDA if tipo == COMPRA else COMPRA
+        existe_day_trade = db.session.execute(
+            db.select(Operacao.id)
+            .filter_by(
+                ativo_id=operacao.ativo_id,
+                carteira_id=operacao.carteira_id,
+                data=operacao.data,
+            )
+            .where(
+                Operacao.tipo_id.in_(
+                    [id_tipo for id_tipo, nome in tipos.items() if nome == oposta]
+                ),
+                condicao_efetivada(),
+            )
+            .limit(1)
+        ).first()
+        if existe_day_trade:
+            recalcular_posicao_historico(
+                operacao.ativo_id, operacao.carteira_id, a_partir_de=operacao.data
+            )
+            return
 
-    # -----------------------------------------------------
-    # GARANTINDO TIPOS DE DADOS
-    # -----------------------------------------------------
+    # O estado em precisão total é o do último snapshot, que o próprio caminho
+    # incremental mantém em dia. Sem ele (ou com operações ainda não aplicadas
+    # nele), a posição é refeita pelo histórico, que volta a gravá-lo
+    snapshots = _snapshots_recentes(operacao.ativo_id, operacao.carteira_id, 2)
+    if not snapshots or not _continua_snapshot(snapshots[0], operacao):
+        recalcular_posicao_historico(
+            operacao.ativo_id, operacao.carteira_id, a_partir_de=operacao.data
+        )
+        return
 
-    # É fundamental garantir que todos os cálculos usem o tipo Decimal
-    quantidade_operacao = operacao.quantidade
-    valor_operacao = operacao.valor_total
+    # A linha já foi criada, se preciso, e travada por travar_posicoes()
+    posicao = PosicaoAtivo.query.filter_by(
+        ativo_id=operacao.ativo_id, carteira_id=operacao.carteira_id
+    ).first()
 
-    # Se não houver posição, cria uma nova
+    # Sem a trava (chamada fora dos serviços), a posição pode não existir ainda
     if not posicao:
         posicao = PosicaoAtivo(
             ativo_id=operacao.ativo_id,
@@ -31,104 +153,416 @@ def recalcular_posicao(operacao: Operacao):
             preco_medio=Decimal("0"),
         )
         db.session.add(posicao)
-        # Não precisa de db.session.flush() aqui se você vai commitar no final.
 
-    custodia_antiga = posicao.custodia
-    preco_medio_antigo = posicao.preco_medio
+    ultimo = snapshots[0]
+    custodia, preco_medio = ultimo.custodia, ultimo.preco_medio
 
-    # Assumindo: 1 = Compra, 2 = Venda (Ajuste conforme seus IDs de TipoOperacao)
-    is_compra = operacao.tipo_id == 1
-    is_venda = operacao.tipo_id == 2
+    # Venda sem compras no mesmo dia: operação comum, pelo preço médio atual
+    if tipo == VENDA:
+        db.session.add(_apurar_venda(operacao, preco_medio))
 
-    # 1. CÁLCULO DA NOVA CUSTÓDIA (Quantidade)
-    if is_compra:
-        nova_custodia = custodia_antiga + quantidade_operacao
-    elif is_venda:
-        nova_custodia = custodia_antiga - quantidade_operacao
+    # Mesma regra do recálculo pelo histórico
+    custodia, preco_medio = _aplicar_operacao(custodia, preco_medio, operacao, tipo)
+    posicao.custodia, posicao.preco_medio = custodia, preco_medio
+
+    # Avança o último snapshot até a operação, a menos que ele seja o que marca
+    # as N operações (esse fica, e a operação ganha um snapshot novo)
+    intervalo_snapshot = current_app.config["POSICAO_SNAPSHOT_INTERVALO"]
+    anteriores = snapshots[1].num_operacoes if len(snapshots) > 1 else 0
+    if ultimo.num_operacoes // intervalo_snapshot > anteriores // intervalo_snapshot:
+        db.session.add(
+            _novo_snapshot(operacao, ultimo.num_operacoes + 1, custodia, preco_medio)
+        )
     else:
-        # Se não for compra nem venda, apenas retorna (ou trate outros tipos)
-        return
+        ultimo.data = operacao.data
+        ultimo.registro = operacao.registro
+        ultimo.operacao_id = operacao.id
+        ultimo.num_operacoes += 1
+        ultimo.custodia = custodia
+        ultimo.preco_medio = preco_medio
+
+
+def _snapshots_recentes(
+    ativo_id: int, carteira_id: int, limite: int = 1
+) -> list[PosicaoSnapshot]:
+    """Os últimos snapshots da posição, do mais recente para o mais antigo."""
+
+    return (
+        db.session.execute(
+            db.select(PosicaoSnapshot)
+            .filter_by(ativo_id=ativo_id, carteira_id=carteira_id)
+            .order_by(
+                PosicaoSnapshot.data.desc(),
+                PosicaoSnapshot.registro.desc(),
+                PosicaoSnapshot.operacao_id.desc(),
+            )
+            .limit(limite)
+        )
+        .scalars()
+        .all()
+    )
+
+
+def _continua_snapshot(snapshot: PosicaoSnapshot, operacao: Operacao) -> bool:
+    """
+    Se a operação vem depois do snapshot e é a única ainda não aplicada nele,
+    ou seja, se o estado do snapshot é o estado imediatamente anterior a ela.
+    """
+
+    chave = (snapshot.data, snapshot.registro, snapshot.operacao_id)
+    if (operacao.data, operacao.registro, operacao.id) <= chave:
+        return False
+
+    pendente = db.session.execute(
+        db.select(Operacao.id)
+        .filter_by(ativo_id=operacao.ativo_id, carteira_id=operacao.carteira_id)
+        .where(
+            condicao_efetivada(),
+            Operacao.id != operacao.id,
+            tuple_(Operacao.data, Operacao.registro, Operacao.id) > tuple_(*chave),
+        )
+        .limit(1)
+    ).first()
+    return pendente is None
+
+
+def _novo_snapshot(
+    ultima: Operacao, num_operacoes: int, custodia: Decimal, preco_medio: Decimal
+) -> PosicaoSnapshot:
+    """Snapshot do estado da posição logo após a operação `ultima`."""
+
+    return PosicaoSnapshot(
+        ativo_id=ultima.ativo_id,
+        carteira_id=ultima.carteira_id,
+        data=ultima.data,
+        registro=ultima.registro,
+        operacao_id=ultima.id,
+        num_operacoes=num_operacoes,
+        custodia=custodia,
+        preco_medio=preco_medio,
+    )
+
 
-    # 2. CÁLCULO DO NOVO PREÇO MÉDIO
-    if is_compra:
-        # Investimento total anterior: (Quantidade * Preço Médio)
-        valor_total_antigo = custodia_antiga * preco_medio_antigo
+def _aplicar_operacao(
+    custodia: Decimal, preco_medio: Decimal, op: Operacao, tipo: str | None
+) -> tuple[Decimal, Decimal]:
+    """
+    Aplica uma operação do tipo informado (nome) ao estado (custódia, preço
+    médio) e retorna o novo estado.
+    """
+
+    quantidade = op.quantidade
+
+    if tipo in TIPOS_AQUISICAO:
+        # Valor investido anteriormente
+        valor_total_antigo = custodia * preco_medio
+
+        nova_custodia = custodia + quantidade
 
-        # O novo preço médio é o total investido (antigo + novo) dividido pela nova custódia
         if nova_custodia > 0:
-            novo_preco_medio = (valor_total_antigo + valor_operacao) / nova_custodia
-            posicao.preco_medio = novo_preco_medio
+            # Novo Preço Médio = (Total investido antes + Valor da nova compra) / Nova Custódia
+            preco_medio = (valor_total_antigo + op.valor_total) / nova_custodia
+            custodia = nova_custodia
+
+    elif tipo == VENDA:
+        # A venda apenas diminui a custódia. O preço médio não muda.
+        nova_custodia = custodia - quantidade
+
+        if nova_custodia <= 0:
+            custodia = Decimal("0")
+            preco_medio = Decimal("0")
+        else:
+            custodia = nova_custodia
+
+    elif tipo in TIPOS_FATOR and quantidade and quantidade > 0 and custodia > 0:
+        fator = quantidade if tipo == DESDOBRAMENTO else 1 / quantidade
+        custodia = custodia * fator
+        preco_medio = preco_medio / fator
+
+    # Proventos (e tipos sem efeito na posição) mantêm o estado
+    return custodia, preco_medio
+
+
+def _aplicar_dia(
+    custodia: Decimal, preco_medio: Decimal, operacoes: list, tipos: dict[int, str]
+) -> tuple[Decimal, Decimal, list[GanhoRealizado]]:
+    """
+    Aplica as operações de um mesmo dia (na ordem) ao estado e retorna o novo
+    estado e o resultado das vendas do dia.
+
+    Compras e vendas no mesmo dia formam day trade na menor das duas
+    quantidades, rateada entre as vendas do dia e custeada pelo preço médio
+    das compras do dia. O restante de cada venda é operação comum, custeada
+    pelo preço médio da posição sem as compras usadas no day trade.
+    """
+
+    vendas = [op for op in operacoes if tipos.get(op.tipo_id) == VENDA]
+    if not vendas:
+        for op in operacoes:
+            custodia, preco_medio = _aplicar_operacao(
+                custodia, preco_medio, op, tipos.get(op.tipo_id)
+            )
+        return custodia, preco_medio, []
+
+    compras = [op for op in operacoes if tipos.get(op.tipo_id) == COMPRA]
+    quantidade_compras = sum((op.quantidade for op in compras), Decimal("0"))
+    quantidade_vendas = sum((op.quantidade for op in vendas), Decimal("0"))
+    day_trade = min(quantidade_compras, quantidade_vendas)
+
+    parte_compras = parte_vendas = preco_compras = Decimal("0")
+    if day_trade > 0:
+        parte_compras = day_trade / quantidade_compras
+        parte_vendas = day_trade / quantidade_vendas
+        preco_compras = sum(op.valor_total for op in compras) / quantidade_compras
+
+    # Estado das operações comuns: a posição sem a parte em day trade
+    comum = (custodia, preco_medio)
+    ganhos = []
+    for op in operacoes:
+        tipo = tipos.get(op.tipo_id)
+        if tipo == VENDA:
+            ganhos.append(_apurar_venda(op, comum[1], parte_vendas, preco_compras))
+            comum = _aplicar_operacao(*comum, _parcial(op, 1 - parte_vendas), tipo)
+        elif tipo == COMPRA:
+            comum = _aplicar_operacao(*comum, _parcial(op, 1 - parte_compras), tipo)
         else:
-            # Posição zerada, mesmo sendo compra (situação rara, mas seguro)
-            posicao.preco_medio = Decimal("0")
+            comum = _aplicar_operacao(*comum, op, tipo)
+
+        custodia, preco_medio = _aplicar_operacao(custodia, preco_medio, op, tipo)
+
+    return custodia, preco_medio, ganhos
+
+
+def _parcial(op: Operacao, parte: Decimal) -> SimpleNamespace:
+    """A fração `parte` de uma compra ou venda, no formato lido por _aplicar_operacao()."""
+    return SimpleNamespace(
+        quantidade=op.quantidade * parte, valor_total=op.valor_total * parte
+    )
+
+
+def _apurar_venda(
+    op: Operacao,
+    preco_medio: Decimal,
+    parte_day_trade: Decimal = Decimal("0"),
+    preco_compras_dia: Decimal = Decimal("0"),
+) -> GanhoRealizado:
+    """
+    Resultado de uma venda: a parte comum custeada pelo `preco_medio` e a parte
+    em day trade pelo preço médio das compras do dia. Os custos da venda são
+    rateados entre as duas pela quantidade.
+    """
+
+    quantidade_day_trade = op.quantidade * parte_day_trade
+    quantidade = op.quantidade - quantidade_day_trade
 
-    # 3. ATUALIZAÇÃO FINAL
+    valor_bruto = op.quantidade * op.preco_unitario
+    valor_day_trade = valor_bruto * parte_day_trade
+    custos_day_trade = (op.custos or 0) * parte_day_trade
+    custos = (op.custos or 0) - custos_day_trade
 
-    # Garante que a custódia nunca seja negativa (situação que deve ser tratada na validação,
-    # mas aqui é a última linha de defesa).
-    if nova_custodia <= 0:
-        posicao.custodia = Decimal("0")
-        posicao.preco_medio = Decimal("0")
+    return GanhoRealizado(
+        operacao_id=op.id,
+        carteira_id=op.carteira_id,
+        ativo_id=op.ativo_id,
+        data=op.data,
+        quantidade=quantidade,
+        valor_venda=(valor_bruto - valor_day_trade).quantize(CENTAVO),
+        resultado=(
+            valor_bruto - valor_day_trade - custos - quantidade * preco_medio
+        ).quantize(CENTAVO),
+        quantidade_day_trade=quantidade_day_trade,
+        valor_venda_day_trade=valor_day_trade.quantize(CENTAVO),
+        resultado_day_trade=(
+            valor_day_trade
+            - custos_day_trade
+            - quantidade_day_trade * preco_compras_dia
+        ).quantize(CENTAVO),
+    )
+
+
+def _inserir_posicoes_ausentes(chaves):
+    """
+    Cria, zeradas, as posições que ainda não existem (INSERT ... ON CONFLICT DO
+    NOTHING), para que o FOR UPDATE tenha uma linha a travar também na primeira
+    compra. Se outra transação já a criou, espera por ela e não faz nada.
+    """
+
+    dialeto = db.engine.dialect.name
+    if dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
     else:
-        posicao.custodia = nova_custodia
+        insert = None
 
-    # Salva as alterações na sessão
-    db.session.add(posicao)  # Adiciona ou atualiza a posição
+    valores = [
+        {
+            "ativo_id": ativo_id,
+            "carteira_id": carteira_id,
+            "custodia": Decimal("0"),
+            "preco_medio": Decimal("0"),
+        }
+        for ativo_id, carteira_id in chaves
+    ]
+    if insert is not None:
+        db.session.execute(
+            insert(PosicaoAtivo).values(valores).on_conflict_do_nothing()
+        )
+    else:
+        # MySQL e outros: INSERT IGNORE
+        db.session.execute(
+            db.insert(PosicaoAtivo).prefix_with("IGNORE").values(valores)
+        )
 
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Erro ao salvar a posição no DB: {e}")
-        raise  # Levanta a exceção para que a rota possa capturar
+
+def travar_posicoes(chaves):
+    """
+    Trava (SELECT ... FOR UPDATE) as posições (ativo_id, carteira_id) até o fim
+    da transação, para que gravações simultâneas na mesma posição sejam
+    aplicadas uma depois da outra. As linhas são travadas sempre na mesma
+    ordem, evitando deadlock entre transações que alteram mais de uma posição.
+    As posições que ainda não existem são criadas (zeradas) antes.
+    """
+
+    chaves = sorted(set(chaves))
+    # Em lotes, para não estourar o limite de parâmetros do banco
+    for inicio in range(0, len(chaves), 500):
+        lote = chaves[inicio : inicio + 500]
+        _inserir_posicoes_ausentes(lote)
+        db.session.execute(
+            db.select(PosicaoAtivo)
+            .where(tuple_(PosicaoAtivo.ativo_id, PosicaoAtivo.carteira_id).in_(lote))
+            .order_by(PosicaoAtivo.ativo_id, PosicaoAtivo.carteira_id)
+            .with_for_update()
+        ).scalars().all()
+
+
+def invalidar_snapshots(ativo_id: int, carteira_id: int, a_partir_de: date | None):
+    """
+    Remove os snapshots da posição que deixam de valer quando o histórico muda
+    a partir da data informada (todos, se a data for None).
+    """
+
+    query = db.delete(PosicaoSnapshot).where(
+        PosicaoSnapshot.ativo_id == ativo_id,
+        PosicaoSnapshot.carteira_id == carteira_id,
+    )
+    if a_partir_de is not None:
+        query = query.where(PosicaoSnapshot.data >= a_partir_de)
+
+    db.session.execute(query)
 
 
-def recalcular_posicao_historico(ativo_id: int, carteira_id: int):
+def recalcular_posicao_historico(
+    ativo_id: int, carteira_id: int, a_partir_de: date | None = None
+):
     """
-    Recalcula a posição de um ativo/carteira do zero, com base em todas as operações.
+    Recalcula a posição de um ativo/carteira com base no histórico de operações.
     É fundamental para garantir a correção após qualquer EDIÇÃO ou EXCLUSÃO de operação.
+
+    Se `a_partir_de` for informada (a data mais antiga afetada pela mudança), o
+    cálculo parte do último snapshot anterior a essa data e reaplica apenas as
+    operações seguintes. Sem ela, todo o histórico é reaplicado do zero. O
+    resultado das vendas reaplicadas (ganhos_realizados) é gravado de novo.
+
+    Assim como recalcular_posicao(), não faz commit.
     """
 
-    # 1. Busca TODAS as operações ordenadas por data para garantir o cálculo correto
-    operacoes = (
-        Operacao.query.filter_by(ativo_id=ativo_id, carteira_id=carteira_id)
-        .order_by(Operacao.data.asc(), Operacao.registro.asc())
-        .all()
+    # 1. Descarta os snapshots (e os valores diários) afetados e parte do último
+    # snapshot que continua válido
+    invalidar_snapshots(ativo_id, carteira_id, a_partir_de)
+    invalidar_valor_diario(carteira_id, a_partir_de)
+
+    snapshot = None
+    while a_partir_de is not None:
+        snapshots = _snapshots_recentes(ativo_id, carteira_id)
+        if not snapshots:
+            break
+        snapshot = snapshots[0]
+
+        # Snapshots antigos podem ter sido gravados no meio de um dia; o day trade
+        # exige o dia inteiro, então eles são descartados em favor de um anterior
+        dia_aberto = db.session.execute(
+            db.select(Operacao.id)
+            .filter_by(ativo_id=ativo_id, carteira_id=carteira_id, data=snapshot.data)
+            .where(
+                condicao_efetivada(),
+                tuple_(Operacao.registro, Operacao.id)
+                > tuple_(snapshot.registro, snapshot.operacao_id),
+            )
+            .limit(1)
+        ).first()
+        if dia_aberto is None:
+            break
+        invalidar_snapshots(ativo_id, carteira_id, snapshot.data)
+        snapshot = None
+
+    # O resultado das vendas posteriores ao snapshot (dias inteiros) será reapurado
+    ganhos = db.delete(GanhoRealizado).where(
+        GanhoRealizado.ativo_id == ativo_id, GanhoRealizado.carteira_id == carteira_id
     )
+    if snapshot:
+        ganhos = ganhos.where(GanhoRealizado.data > snapshot.data)
+    db.session.execute(ganhos)
 
     # Inicializa variáveis
-    custodia_atual = Decimal("0")
-    preco_medio_atual = Decimal("0")
+    if snapshot:
+        custodia_atual = snapshot.custodia
+        preco_medio_atual = snapshot.preco_medio
+        num_operacoes = snapshot.num_operacoes
+    else:
+        custodia_atual = Decimal("0")
+        preco_medio_atual = Decimal("0")
+        num_operacoes = 0
 
-    # 2. Looping para recalcular o histórico do zero
-    for op in operacoes:
-        quantidade = op.quantidade
-        valor_total = op.valor_total
-        is_compra = op.tipo_id == 1  # Assumindo 1 = Compra (Verifique seus IDs!)
+    # 2. Busca as operações posteriores ao snapshot, na ordem em que foram feitas
+    query = (
+        db.select(Operacao)
+        .filter_by(ativo_id=ativo_id, carteira_id=carteira_id)
+        .where(condicao_efetivada())
+        .order_by(Operacao.data.asc(), Operacao.registro.asc(), Operacao.id.asc())
+        .execution_options(yield_per=1000)
+    )
+    if snapshot:
+        query = query.where(
+            tuple_(Operacao.data, Operacao.registro, Operacao.id)
+            > tuple_(snapshot.data, snapshot.registro, snapshot.operacao_id)
+        )
 
-        if is_compra:
-            # Valor investido anteriormente
-            valor_total_antigo = custodia_atual * preco_medio_atual
+    intervalo_snapshot = current_app.config["POSICAO_SNAPSHOT_INTERVALO"]
+    tipos = nomes_tipos_operacao()
 
-            nova_custodia = custodia_atual + quantidade
+    # 3. Reaplica as operações dia a dia (compras e vendas no mesmo dia formam
+    # day trade), gravando o resultado das vendas e, ao fim do dia em que se
+    # completam N operações, um snapshot (o recálculo sempre recomeça em um
+    # dia inteiro). Ao fim, grava também um snapshot do estado final, que
+    # recalcular_posicao() avança a cada nova operação
+    ultima = None
+    for _, operacoes_dia in groupby(
+        db.session.execute(query).scalars(), key=attrgetter("data")
+    ):
+        operacoes_dia = list(operacoes_dia)
+        custodia_atual, preco_medio_atual, ganhos = _aplicar_dia(
+            custodia_atual, preco_medio_atual, operacoes_dia, tipos
+        )
+        db.session.add_all(ganhos)
 
-            if nova_custodia > 0:
-                # Novo Preço Médio = (Total investido antes + Valor da nova compra) / Nova Custódia
-                novo_preco_medio = (valor_total_antigo + valor_total) / nova_custodia
-                preco_medio_atual = novo_preco_medio
-                custodia_atual = nova_custodia
+        anteriores = num_operacoes
+        num_operacoes += len(operacoes_dia)
 
-        else:  # Venda ou Outro tipo
-            # A venda apenas diminui a custódia. O preço médio não muda.
-            nova_custodia = custodia_atual - quantidade
+        ultima = operacoes_dia[-1]
+        if num_operacoes // intervalo_snapshot > anteriores // intervalo_snapshot:
+            db.session.add(
+                _novo_snapshot(ultima, num_operacoes, custodia_atual, preco_medio_atual)
+            )
+            ultima = None
 
-            if nova_custodia <= 0:
-                custodia_atual = Decimal("0")
-                preco_medio_atual = Decimal("0")
-            else:
-                custodia_atual = nova_custodia
+    if ultima is not None:
+        db.session.add(
+            _novo_snapshot(ultima, num_operacoes, custodia_atual, preco_medio_atual)
+        )
 
-    # 3. SALVA OU CRIA A POSIÇÃO FINAL
+    # 4. SALVA OU CRIA A POSIÇÃO FINAL
 
     posicao = PosicaoAtivo.query.filter_by(
         ativo_id=ativo_id, carteira_id=carteira_id
@@ -141,4 +575,199 @@ def recalcular_posicao_historico(ativo_id: int, carteira_id: int):
     posicao.custodia = custodia_atual
     posicao.preco_medio = preco_medio_atual
 
-    db.session.commit()
+
+def _estado_anterior(ativo_id: int, carteira_id: int, dia: date | None) -> dict:
+    """
+    Estado da posição ao fim do `dia` (zerado, se None), a partir do último
+    snapshot até ele: custódia, preço médio, último preço negociado e a chave
+    (data, registro, id) da última operação já aplicada.
+    """
+
+    estado = {
+        "custodia": Decimal("0"),
+        "preco_medio": Decimal("0"),
+        "preco": None,
+        "chave": None,
+    }
+    if dia is None:
+        return estado
+
+    snapshot = db.session.execute(
+        db.select(PosicaoSnapshot)
+        .filter_by(ativo_id=ativo_id, carteira_id=carteira_id)
+        .where(PosicaoSnapshot.data <= dia)
+        .order_by(
+            PosicaoSnapshot.data.desc(),
+            PosicaoSnapshot.registro.desc(),
+            PosicaoSnapshot.operacao_id.desc(),
+        )
+        .limit(1)
+    ).scalar_one_or_none()
+    if snapshot is None:
+        return estado
+
+    estado["custodia"] = snapshot.custodia
+    estado["preco_medio"] = snapshot.preco_medio
+    estado["chave"] = (snapshot.data, snapshot.registro, snapshot.operacao_id)
+
+    # Último preço negociado até o snapshot, ajustado pelos desdobramentos e
+    # grupamentos posteriores a ele (a mesma regra da curva em analise_service)
+    tipos = nomes_tipos_operacao()
+    ids = [
+        tipo_id
+        for tipo_id, nome in tipos.items()
+        if nome in (COMPRA, VENDA, *TIPOS_FATOR)
+    ]
+    anteriores = db.session.execute(
+        db.select(Operacao)
+        .filter_by(ativo_id=ativo_id, carteira_id=carteira_id)
+        .where(
+            condicao_efetivada(),
+            Operacao.tipo_id.in_(ids),
+            tuple_(Operacao.data, Operacao.registro, Operacao.id)
+            <= tuple_(*estado["chave"]),
+        )
+        .order_by(Operacao.data.desc(), Operacao.registro.desc(), Operacao.id.desc())
+        .execution_options(yield_per=100)
+    ).scalars()
+    fator = Decimal("1")
+    for op in anteriores:
+        tipo = tipos[op.tipo_id]
+        if tipo in TIPOS_FATOR:
+            if op.quantidade and op.quantidade > 0:
+                fator *= op.quantidade if tipo == DESDOBRAMENTO else 1 / op.quantidade
+        elif op.preco_unitario and op.preco_unitario > 0:
+            estado["preco"] = op.preco_unitario / fator
+            break
+
+    return estado
+
+
+def posicao_por_dia(ativo_id: int, carteira_id: int, dias: list[date]):
+    """
+    Gera, para cada dia de `dias` (em ordem crescente), a custódia, o preço
+    médio e o último preço negociado da posição ao fim do dia, com a regra de
+    _aplicar_operacao(). Parte do último snapshot até o dia anterior ao
+    primeiro e lê só as operações seguintes, sem reaplicar todo o histórico.
+    """
+
+    if not dias:
+        return
+
+    estado = _estado_anterior(ativo_id, carteira_id, dias[0] - timedelta(days=1))
+    query = (
+        db.select(Operacao)
+        .filter_by(ativo_id=ativo_id, carteira_id=carteira_id)
+        .where(condicao_efetivada(), Operacao.data <= dias[-1])
+        .order_by(Operacao.data, Operacao.registro, Operacao.id)
+    )
+    if estado["chave"] is not None:
+        query = query.where(
+            tuple_(Operacao.data, Operacao.registro, Operacao.id)
+            > tuple_(*estado["chave"])
+        )
+    operacoes = iter(db.session.execute(query).scalars().all())
+    proxima = next(operacoes, None)
+
+    tipos = nomes_tipos_operacao()
+    custodia, preco_medio, preco = (
+        estado["custodia"],
+        estado["preco_medio"],
+        estado["preco"],
+    )
+    for dia in dias:
+        while proxima is not None and proxima.data <= dia:
+            tipo = tipos.get(proxima.tipo_id)
+            custodia, preco_medio = _aplicar_operacao(
+                custodia, preco_medio, proxima, tipo
+            )
+            if tipo in (COMPRA, VENDA) and proxima.preco_unitario > 0:
+                preco = proxima.preco_unitario
+            elif (
+                tipo in TIPOS_FATOR
+                and preco is not None
+                and proxima.quantidade
+                and proxima.quantidade > 0
+            ):
+                if tipo == DESDOBRAMENTO:
+                    preco /= proxima.quantidade
+                else:
+                    preco *= proxima.quantidade
+            proxima = next(operacoes, None)
+
+        yield custodia, preco_medio, preco
+
+
+def atualizar_regras_posicao() -> int | None:
+    """
+    Se as posições foram gravadas por uma versão anterior das regras, descarta
+    todos os snapshots e reaplica o histórico de todas as posições, em uma
+    única transação (uma falha não deixa o banco pela metade e a atualização
+    pode ser repetida). Retorna a quantidade de posições refeitas, ou None se
+    já estavam na versão atual.
+    """
+
+    versao = db.session.execute(
+        db.select(VersaoDados).filter_by(nome="regras_posicao")
+        # Outro processo rodando ao mesmo tempo espera e encontra a versão nova
+        .with_for_update()
+    ).scalar_one_or_none()
+    if versao is not None and versao.versao >= VERSAO_REGRAS:
+        db.session.rollback()
+        return None
+
+    try:
+        posicoes = sorted(
+            tuple(linha)
+            for linha in db.session.execute(
+                db.select(Operacao.ativo_id, Operacao.carteira_id).distinct()
+            )
+        )
+        db.session.execute(db.delete(PosicaoSnapshot))
+        travar_posicoes(posicoes)
+        for ativo_id, carteira_id in posicoes:
+            recalcular_posicao_historico(ativo_id, carteira_id)
+
+        if versao is None:
+            db.session.add(VersaoDados(nome="regras_posicao", versao=VERSAO_REGRAS))
+        else:
+            versao.versao = VERSAO_REGRAS
+        if posicoes:
+            incrementar_versao("operacoes")
+        db.session.commit()
+    except IntegrityError:
+        # Outro processo registrou a versão primeiro (e refez as posições)
+        db.session.rollback()
+        return None
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(posicoes)
+
+
+def reprocessar_posicoes(carteira_ids: list[int] | None = None, lote: int = 100) -> int:
+    """
+    Reaplica todo o histórico de cada posição (custódia, preço médio, snapshots
+    e resultado das vendas), com um commit a cada `lote` posições. Usado para
+    preencher ganhos_realizados em bancos que já tinham operações. Retorna a
+    quantidade de posições reprocessadas.
+    """
+
+    query = db.select(Operacao.ativo_id, Operacao.carteira_id).distinct()
+    if carteira_ids:
+        query = query.where(Operacao.carteira_id.in_(carteira_ids))
+    posicoes = sorted(tuple(linha) for linha in db.session.execute(query))
+
+    for inicio in range(0, len(posicoes), lote):
+        try:
+            travar_posicoes(posicoes[inicio : inicio + lote])
+            for ativo_id, carteira_id in posicoes[inicio : inicio + lote]:
+                recalcular_posicao_historico(ativo_id, carteira_id)
+            incrementar_versao("operacoes")
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return len(posicoes)
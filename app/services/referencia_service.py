@@ -0,0 +1,136 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, Ativo, Carteira, StatusOperacao, TipoAtivo, TipoOperacao
+from services.versao_service import incrementar_versao, obter_versoes
+
+# Consulta de cada conjunto de dados de referência. O nome também identifica
+# o conjunto na tabela "versao_dados".
+CONSULTAS = {
+    "tipos_operacao": lambda: db.select(TipoOperacao.id, TipoOperacao.nome).order_by(
+        TipoOperacao.id
+    ),
+    "status_operacao": lambda: db.select(
+        StatusOperacao.id, StatusOperacao.nome
+    ).order_by(StatusOperacao.id),
+    "carteiras": lambda: db.select(Carteira.id, Carteira.nome).order_by(Carteira.id),
+    "tipos_ativo": lambda: db.select(TipoAtivo.id, TipoAtivo.nome).order_by(
+        TipoAtivo.id
+    ),
+    "ativos": lambda: db.select(Ativo.id, Ativo.ticker, Ativo.nome).order_by(
+        Ativo.ticker
+    ),
+}
+
+
+class CacheReferencias:
+    """
+    Mantém em memória as tabelas pequenas usadas em formulários e filtros
+    (tipos, status, carteiras e ativos).
+
+    Cada conjunto é guardado junto com a versão lida de "versao_dados"; as
+    versões são consultadas no máximo a cada `intervalo_verificacao` segundos
+    (uma única consulta para todos os conjuntos) e um conjunto só é recarregado
+    quando a versão dele muda. As consultas ao banco rodam fora da trava, para
+    não enfileirar as requisições de todas as threads do processo.
+    """
+
+    def __init__(self, intervalo_verificacao: float = 5):
+        self.intervalo_verificacao = intervalo_verificacao
+        # nome -> (versão, linhas, {segunda coluna: id})
+        self._dados = {}
+        self._versoes = {}
+        self._verificado_em = None
+        # Incrementada a cada invalidação: o que foi lido antes dela é descartado
+        self._geracao = 0
+        self._lock = threading.Lock()
+
+    def _obter(self, nome: str):
+        with self._lock:
+            geracao = self._geracao
+            versoes = self._versoes
+            verificar = (
+                self._verificado_em is None
+                or time.monotonic() - self._verificado_em >= self.intervalo_verificacao
+            )
+
+        if verificar:
+            versoes = obter_versoes()
+            with self._lock:
+                if self._geracao == geracao:
+                    self._versoes = versoes
+                    self._verificado_em = time.monotonic()
+
+        versao = versoes.get(nome, 0)
+        with self._lock:
+            em_cache = self._dados.get(nome)
+        if em_cache is not None and em_cache[0] == versao:
+            return em_cache
+
+        linhas = tuple(db.session.execute(CONSULTAS[nome]()).all())
+        em_cache = (versao, linhas, {linha[1]: linha.id for linha in linhas})
+        with self._lock:
+            if self._geracao == geracao:
+                self._dados[nome] = em_cache
+
+        return em_cache
+
+    def listar(self, nome: str) -> tuple:
+        """Linhas (id, nome/ticker, ...) do conjunto, na ordem de exibição."""
+        return self._obter(nome)[1]
+
+    def buscar_id(self, nome: str, chave: str) -> int | None:
+        """Id do registro pelo nome (ou ticker, no caso dos ativos)."""
+        return self._obter(nome)[2].get(chave)
+
+    def invalidar(self, *nomes: str):
+        with self._lock:
+            for nome in nomes:
+                self._dados.pop(nome, None)
+            # Força a releitura das versões no próximo acesso
+            self._verificado_em = None
+            self._geracao += 1
+
+
+def obter_referencias() -> CacheReferencias:
+    """Retorna o cache de dados de referência da aplicação, criando-o se preciso."""
+
+    cache = current_app.extensions.get("referencias")
+    if cache is None:
+        cache = CacheReferencias(current_app.config["REFERENCIAS_VERIFICACAO"])
+        current_app.extensions["referencias"] = cache
+    return cache
+
+
+def opcoes(nome: str) -> list[tuple]:
+    """Choices (id, rótulo) de um SelectField a partir do cache."""
+    return [(linha.id, linha[1]) for linha in obter_referencias().listar(nome)]
+
+
+def registrar_alteracao(*nomes: str):
+    """
+    Marca os conjuntos como alterados: incrementa a versão no banco (na
+    transação atual, para os demais processos) e, depois do commit, descarta
+    a cópia local. Deve ser chamada pelas rotas que gravam ativos, carteiras
+    ou tipos.
+    """
+
+    incrementar_versao(*nomes)
+    db.session.info.setdefault("referencias_alteradas", set()).update(nomes)
+
+
+# Descartada antes do commit, a cópia local poderia ser recarregada por outra
+# requisição com as linhas ainda sem a alteração e mantida até a próxima
+# verificação das versões
+@event.listens_for(Session, "after_commit")
+def _invalidar_apos_commit(session):
+    nomes = session.info.pop("referencias_alteradas", None)
+    if nomes:
+        obter_referencias().invalidar(*nomes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_alteracoes(session):
+    session.info.pop("referencias_alteradas", None)
@@ -0,0 +1,315 @@
+"""
+Transmissão das cotações e do resultado das posições para os navegadores
+conectados (server-sent events).
+
+Uma única thread por processo acompanha as versões de "cotacoes" e
+"operacoes" (gravadas pelo atualizador de cotações e pelas operações) e, quando
+alguma muda, monta o estado atual com uma consulta e envia a cada assinante só
+o que mudou desde o envio anterior. Assim, N dashboards abertos custam uma
+consulta por intervalo, e não N páginas completas.
+
+Cada assinante tem uma fila limitada: quem não consome a tempo é desconectado
+(o EventSource do navegador reconecta sozinho e recebe o estado completo).
+
+Para testar localmente, rode o atualizador com cotações simuladas:
+    flask cotacoes refresh --loop --fake --intervalo 2
+"""
+
+import json
+import logging
+import queue
+import threading
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import func
+from models import db, Ativo, Cotacao, PosicaoAtivo
+from services.versao_service import obter_versoes
+
+logger = logging.getLogger(__name__)
+
+# Aviso ao navegador: em quanto tempo (ms) reconectar se a conexão cair
+RECONECTAR_EM = 3000
+
+
+class Assinante:
+    def __init__(self, carteira_id: int | None, tamanho_fila: int):
+        self.carteira_id = carteira_id
+        self.fila = queue.Queue(maxsize=tamanho_fila)
+        self.desconectado = False
+
+
+class TransmissorCotacoes:
+    def __init__(self, app, intervalo_verificacao: float, tamanho_fila: int):
+        self.app = app
+        self.intervalo_verificacao = intervalo_verificacao
+        self.tamanho_fila = tamanho_fila
+        self._assinantes = set()
+        self._trava = threading.Lock()
+        self._thread = None
+        self._parar = threading.Event()
+        self._versoes = None
+        # Último estado: {"cotacoes": {ticker: ...}, "posicoes": {(carteira, ticker): ...}}
+        self._estado = None
+
+    # -------------------------------------------------
+    # ASSINATURAS
+    # -------------------------------------------------
+
+    def assinar(self, carteira_id: int | None = None) -> Assinante:
+        """
+        Registra um assinante e já enfileira o estado atual para ele. Inicia a
+        thread de verificação se for o primeiro.
+        """
+
+        assinante = Assinante(carteira_id, self.tamanho_fila)
+        with self._trava:
+            if self._estado is not None:
+                assinante.fila.put_nowait(self._evento_completo(assinante))
+            self._assinantes.add(assinante)
+
+            if self._thread is None:
+                self._parar.clear()
+                self._thread = threading.Thread(
+                    target=self._rodar, name="transmissor-cotacoes", daemon=True
+                )
+                self._thread.start()
+
+        return assinante
+
+    def cancelar(self, assinante: Assinante):
+        with self._trava:
+            self._assinantes.discard(assinante)
+
+    def parar(self):
+        self._parar.set()
+
+    # -------------------------------------------------
+    # LAÇO DE VERIFICAÇÃO
+    # -------------------------------------------------
+
+    def _rodar(self):
+        with self.app.app_context():
+            while not self._parar.is_set():
+                try:
+                    self.verificar()
+                except Exception:
+                    # Uma falha isolada não pode derrubar a transmissão
+                    logger.exception("Erro ao transmitir cotações")
+                finally:
+                    db.session.remove()
+
+                with self._trava:
+                    # Sem assinantes, a thread termina (a próxima assinatura recria)
+                    if not self._assinantes:
+                        self._encerrar()
+                        return
+
+                self._parar.wait(self.intervalo_verificacao)
+
+        with self._trava:
+            self._encerrar()
+
+    def _encerrar(self):
+        # O estado guardado deixa de ser acompanhado: descarta
+        self._thread = None
+        self._estado = None
+        self._versoes = None
+
+    def verificar(self):
+        """
+        Se as cotações ou as operações mudaram, monta o novo estado e envia as
+        diferenças aos assinantes. Deve ser chamado dentro do contexto da aplicação.
+        """
+
+        versoes = obter_versoes()
+        versoes = (versoes.get("cotacoes", 0), versoes.get("operacoes", 0))
+        if versoes == self._versoes:
+            return
+
+        novo = montar_estado()
+        with self._trava:
+            anterior = self._estado
+            self._estado = novo
+            self._versoes = versoes
+
+            # Primeira verificação: todos recebem o estado completo
+            if anterior is None:
+                for assinante in list(self._assinantes):
+                    self._enviar(assinante, self._evento_completo(assinante))
+                return
+
+            diferencas = {
+                "cotacoes": _diferencas(anterior["cotacoes"], novo["cotacoes"]),
+                "posicoes": _diferencas(anterior["posicoes"], novo["posicoes"]),
+                "removidas": [
+                    chave
+                    for chave in anterior["posicoes"]
+                    if chave not in novo["posicoes"]
+                ],
+            }
+            if not any(diferencas.values()):
+                return
+
+            for assinante in list(self._assinantes):
+                self._enviar(assinante, self._evento_atualizacao(assinante, diferencas))
+
+    def _enviar(self, assinante: Assinante, evento: str | None):
+        if evento is None:
+            return
+        try:
+            assinante.fila.put_nowait(evento)
+        except queue.Full:
+            # Consumidor lento: desconecta em vez de acumular eventos
+            assinante.desconectado = True
+            self._assinantes.discard(assinante)
+
+    # -------------------------------------------------
+    # EVENTOS
+    # -------------------------------------------------
+
+    def _evento_completo(self, assinante: Assinante) -> str:
+        posicoes = _filtrar(self._estado["posicoes"], assinante.carteira_id)
+        return formatar_evento(
+            "estado",
+            {
+                "cotacoes": list(self._estado["cotacoes"].values()),
+                "posicoes": list(posicoes.values()),
+                "totais": _totais(self._estado["posicoes"], assinante.carteira_id),
+            },
+        )
+
+    def _evento_atualizacao(self, assinante: Assinante, diferencas: dict) -> str | None:
+        posicoes = _filtrar(diferencas["posicoes"], assinante.carteira_id)
+        removidas = [
+            {"carteira_id": carteira_id, "ticker": ticker}
+            for carteira_id, ticker in diferencas["removidas"]
+            if assinante.carteira_id in (None, carteira_id)
+        ]
+        if not (diferencas["cotacoes"] or posicoes or removidas):
+            return None
+
+        return formatar_evento(
+            "atualizacao",
+            {
+                "cotacoes": list(diferencas["cotacoes"].values()),
+                "posicoes": list(posicoes.values()),
+                "removidas": removidas,
+                "totais": _totais(self._estado["posicoes"], assinante.carteira_id),
+            },
+        )
+
+
+def montar_estado() -> dict:
+    """
+    Cotações e resultado de todas as posições em aberto, em uma única
+    consulta (mesmos cálculos do dashboard: cotação ausente vale zero).
+    """
+
+    preco_atual = func.coalesce(Cotacao.preco, 0)
+    linhas = db.session.execute(
+        db.select(
+            PosicaoAtivo.carteira_id,
+            Ativo.ticker,
+            PosicaoAtivo.custodia,
+            (PosicaoAtivo.custodia * PosicaoAtivo.preco_medio).label("valor_investido"),
+            preco_atual.label("preco_atual"),
+            Cotacao.atualizado_em,
+        )
+        .join(Ativo, PosicaoAtivo.ativo_id == Ativo.id)
+        .outerjoin(Cotacao, Cotacao.ativo_id == Ativo.id)
+        .where(PosicaoAtivo.custodia > 0)
+    ).all()
+
+    cotacoes = {}
+    posicoes = {}
+    for linha in linhas:
+        ticker = linha.ticker.strip().upper()
+        preco = Decimal(linha.preco_atual)
+        if linha.atualizado_em is not None:
+            cotacoes[ticker] = {
+                "ticker": ticker,
+                "preco": float(preco),
+                "atualizado_em": linha.atualizado_em.isoformat(),
+            }
+
+        valor_mercado = linha.custodia * preco
+        lucro_prejuizo = valor_mercado - linha.valor_investido
+        posicoes[(linha.carteira_id, ticker)] = {
+            "carteira_id": linha.carteira_id,
+            "ticker": ticker,
+            "custodia": float(linha.custodia),
+            "preco_atual": float(preco),
+            "valor_investido": float(linha.valor_investido),
+            "valor_mercado": float(valor_mercado),
+            "lucro_prejuizo": float(lucro_prejuizo),
+            "percentual_valorizacao": (
+                float(lucro_prejuizo / linha.valor_investido * 100)
+                if linha.valor_investido
+                else 0.0
+            ),
+        }
+
+    return {"cotacoes": cotacoes, "posicoes": posicoes}
+
+
+def formatar_evento(nome: str, dados: dict) -> str:
+    return f"event: {nome}\ndata: {json.dumps(dados)}\n\n"
+
+
+def _diferencas(anterior: dict, novo: dict) -> dict:
+    return {
+        chave: valor for chave, valor in novo.items() if anterior.get(chave) != valor
+    }
+
+
+def _filtrar(posicoes: dict, carteira_id: int | None) -> dict:
+    if carteira_id is None:
+        return posicoes
+    return {
+        chave: valor for chave, valor in posicoes.items() if chave[0] == carteira_id
+    }
+
+
+def _totais(posicoes: dict, carteira_id: int | None) -> dict:
+    posicoes = _filtrar(posicoes, carteira_id).values()
+    total_investido = sum(posicao["valor_investido"] for posicao in posicoes)
+    total_valor_mercado = sum(posicao["valor_mercado"] for posicao in posicoes)
+    return {
+        "total_investido": round(total_investido, 2),
+        "total_valor_mercado": round(total_valor_mercado, 2),
+        "lucro_prejuizo": round(total_valor_mercado - total_investido, 2),
+    }
+
+
+def obter_transmissor() -> TransmissorCotacoes:
+    """Retorna o transmissor de cotações da aplicação, criando-o se preciso."""
+
+    transmissor = current_app.extensions.get("transmissor_cotacoes")
+    if transmissor is None:
+        transmissor = TransmissorCotacoes(
+            current_app._get_current_object(),
+            current_app.config["COTACOES_STREAM_VERIFICACAO"],
+            current_app.config["COTACOES_STREAM_FILA"],
+        )
+        current_app.extensions["transmissor_cotacoes"] = transmissor
+    return transmissor
+
+
+def transmitir(
+    transmissor: TransmissorCotacoes, assinante: Assinante, heartbeat: float
+):
+    """
+    Gerador do corpo da resposta SSE de um assinante. Envia um comentário a
+    cada `heartbeat` segundos sem eventos, o que mantém a conexão aberta em
+    proxies e revela clientes que já desconectaram.
+    """
+
+    try:
+        yield f"retry: {RECONECTAR_EM}\n\n"
+        while not assinante.desconectado:
+            try:
+                yield assinante.fila.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+    finally:
+        transmissor.cancelar(assinante)
@@ -0,0 +1,198 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from math import isnan
+from sqlalchemy import func
+from models import db, Ativo, Carteira, CarteiraValorDiario, Operacao
+
+CENTAVO = Decimal("0.01")
+
+
+def invalidar_valor_diario(carteira_id: int, a_partir_de: date | None = None):
+    """
+    Remove os valores diários da carteira que deixam de valer quando o
+    histórico muda a partir da data informada (todos, se a data for None).
+    O próximo job noturno recalcula os dias removidos.
+    """
+
+    query = db.delete(CarteiraValorDiario).where(
+        CarteiraValorDiario.carteira_id == carteira_id
+    )
+    if a_partir_de is not None:
+        query = query.where(CarteiraValorDiario.data >= a_partir_de)
+
+    db.session.execute(query)
+
+
+def _calcular_valores(carteira_id: int, inicio: date, ate: date) -> list[dict]:
+    """
+    Valor investido e valor de mercado da carteira em cada dia útil de
+    `inicio` a `ate`, com as posições calculadas em Decimal pela mesma regra de
+    posicao_ativos (a partir dos snapshots, ver posicao_por_dia). O mercado usa
+    o fechamento do histórico local de preços ou, sem ele, o último preço
+    negociado.
+    """
+
+    from services.historico_service import fechamentos
+    from services.posicao_service import condicao_efetivada, posicao_por_dia
+
+    dias = []
+    dia = inicio
+    while dia <= ate:
+        if dia.weekday() < 5:
+            dias.append(dia)
+        dia += timedelta(days=1)
+    if not dias:
+        return []
+
+    ativos = dict(
+        db.session.execute(
+            db.select(Ativo.id, Ativo.ticker)
+            .where(
+                Ativo.id.in_(
+                    db.select(Operacao.ativo_id)
+                    .filter_by(carteira_id=carteira_id)
+                    .where(condicao_efetivada(), Operacao.data <= ate)
+                )
+            )
+            .order_by(Ativo.id)
+        ).all()
+    )
+    historico = fechamentos(list(ativos.values()), dias)
+    investido = [Decimal("0")] * len(dias)
+    mercado = [Decimal("0")] * len(dias)
+    for ativo_id, ticker in ativos.items():
+        estados = posicao_por_dia(ativo_id, carteira_id, dias)
+        for indice, (custodia, preco_medio, preco) in enumerate(estados):
+            if not custodia:
+                continue
+            fechamento = historico[ticker][indice]
+            if not isnan(fechamento):
+                preco = Decimal(str(fechamento))
+            investido[indice] += custodia * preco_medio
+            mercado[indice] += custodia * (preco or 0)
+
+    linhas = []
+    for dia, valor_investido, valor_mercado in zip(dias, investido, mercado):
+        valor_investido = valor_investido.quantize(CENTAVO)
+        valor_mercado = valor_mercado.quantize(CENTAVO)
+        linhas.append(
+            {
+                "carteira_id": carteira_id,
+                "data": dia,
+                "valor_investido": valor_investido,
+                "valor_mercado": valor_mercado,
+                "lucro_prejuizo": valor_mercado - valor_investido,
+            }
+        )
+    return linhas
+
+
+def atualizar_valor_diario(
+    carteira_ids: list[int] | None = None,
+    ate: date | None = None,
+    refazer: bool = False,
+) -> dict[int, int]:
+    """
+    Job noturno: grava o valor investido, o valor de mercado e o resultado de
+    cada carteira em cada dia útil até `ate` (padrão: ontem).
+
+    Só processa os dias posteriores ao último já gravado de cada carteira,
+    partindo dos snapshots das posições nesse dia e lendo só as operações
+    seguintes; os dias invalidados por operações retroativas voltam a ser
+    processados. Pode ser executado mais de uma vez: os dias do período são
+    substituídos, nunca duplicados. Com `refazer`, recalcula todo o histórico.
+    Retorna a quantidade de dias gravados por carteira.
+    """
+
+    from services.posicao_service import condicao_efetivada
+
+    ate = ate or date.today() - timedelta(days=1)
+    if carteira_ids is None:
+        carteira_ids = db.session.execute(db.select(Carteira.id)).scalars().all()
+
+    gravados = {}
+    for carteira_id in carteira_ids:
+        if refazer:
+            invalidar_valor_diario(carteira_id)
+
+        ultimo_dia = db.session.execute(
+            db.select(func.max(CarteiraValorDiario.data)).where(
+                CarteiraValorDiario.carteira_id == carteira_id
+            )
+        ).scalar()
+        if ultimo_dia is not None:
+            inicio = ultimo_dia + timedelta(days=1)
+        else:
+            # Primeira execução: desde a primeira operação da carteira
+            inicio = db.session.execute(
+                db.select(func.min(Operacao.data)).where(
+                    Operacao.carteira_id == carteira_id, condicao_efetivada()
+                )
+            ).scalar()
+        if inicio is None or inicio > ate:
+            gravados[carteira_id] = 0
+            continue
+
+        linhas = _calcular_valores(carteira_id, inicio, ate)
+
+        db.session.execute(
+            db.delete(CarteiraValorDiario).where(
+                CarteiraValorDiario.carteira_id == carteira_id,
+                CarteiraValorDiario.data >= inicio,
+                CarteiraValorDiario.data <= ate,
+            )
+        )
+        if linhas:
+            db.session.execute(db.insert(CarteiraValorDiario), linhas)
+
+        db.session.commit()
+        gravados[carteira_id] = len(linhas)
+
+    return gravados
+
+
+def consultar_valor_diario(
+    carteira_id: int | None = None,
+    inicio: date | None = None,
+    fim: date | None = None,
+) -> dict:
+    """
+    Série diária de valores de uma carteira (ou a soma de todas) no período,
+    lida da tabela materializada com uma única consulta por intervalo.
+    """
+
+    if carteira_id is not None:
+        query = db.select(
+            CarteiraValorDiario.data,
+            CarteiraValorDiario.valor_investido,
+            CarteiraValorDiario.valor_mercado,
+            CarteiraValorDiario.lucro_prejuizo,
+        ).where(CarteiraValorDiario.carteira_id == carteira_id)
+    else:
+        query = db.select(
+            CarteiraValorDiario.data,
+            func.sum(CarteiraValorDiario.valor_investido),
+            func.sum(CarteiraValorDiario.valor_mercado),
+            func.sum(CarteiraValorDiario.lucro_prejuizo),
+        ).group_by(CarteiraValorDiario.data)
+
+    if inicio is not None:
+        query = query.where(CarteiraValorDiario.data >= inicio)
+    if fim is not None:
+        query = query.where(CarteiraValorDiario.data <= fim)
+
+    serie = {
+        "datas": [],
+        "valor_investido": [],
+        "valor_mercado": [],
+        "lucro_prejuizo": [],
+    }
+    for dia, investido, mercado, lucro in db.session.execute(
+        query.order_by(CarteiraValorDiario.data)
+    ):
+        serie["datas"].append(dia.isoformat())
+        serie["valor_investido"].append(float(investido))
+        serie["valor_mercado"].append(float(mercado))
+        serie["lucro_prejuizo"].append(float(lucro))
+
+    return serie
@@ -0,0 +1,26 @@
+from models import db, VersaoDados
+
+
+def incrementar_versao(*nomes: str):
+    """
+    Incrementa a versão dos conjuntos de dados informados, na mesma transação
+    da gravação que os alterou (quem chama faz o commit).
+    """
+
+    for nome in nomes:
+        atualizadas = db.session.execute(
+            db.update(VersaoDados)
+            .where(VersaoDados.nome == nome)
+            .values(versao=VersaoDados.versao + 1)
+        ).rowcount
+        if not atualizadas:
+            db.session.add(VersaoDados(nome=nome, versao=1))
+            db.session.flush()
+
+
+def obter_versoes() -> dict[str, int]:
+    """Retorna a versão atual de cada conjunto de dados já alterado."""
+
+    return dict(
+        db.session.execute(db.select(VersaoDados.nome, VersaoDados.versao)).all()
+    )
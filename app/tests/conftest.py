@@ -0,0 +1,157 @@
+"""
+Fixtures dos testes: cada teste recebe uma aplicação nova sobre um SQLite em
+memória, com os dados de referência cadastrados. Os serviços são chamados
+dentro de `contexto`; as requisições do `client` abrem o próprio contexto,
+como em produção. Rode a partir da pasta app/:
+
+    python -m pytest tests
+"""
+
+import os
+from datetime import date
+from decimal import Decimal
+
+# Configuração lida na importação de app.py; nada sai para a rede
+os.environ["DB_URL"] = "sqlite://"
+os.environ.setdefault("SECRET_KEY", "testes")
+os.environ["COTACOES_PROVEDOR"] = "fake"
+os.environ["METADADOS_PROVEDOR"] = "fake"
+os.environ["LOG_REQUISICOES"] = "0"
+
+import pytest
+from models import (
+    db,
+    Ativo,
+    Carteira,
+    GanhoRealizado,
+    Operacao,
+    PosicaoAtivo,
+    StatusOperacao,
+)
+from utils.database import carregar_dados_iniciais
+
+
+@pytest.fixture
+def configuracao():
+    """Valores da classe Config trocados antes de criar a aplicação."""
+    return {}
+
+
+@pytest.fixture
+def app(configuracao, monkeypatch):
+    from app import Config, create_app
+
+    for chave, valor in configuracao.items():
+        monkeypatch.setattr(Config, chave, valor)
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+
+    with app.app_context():
+        carregar_dados_iniciais()
+        db.session.add_all(
+            [StatusOperacao(nome="Efetivada"), StatusOperacao(nome="Agendada")]
+        )
+        db.session.add_all([Carteira(nome="Principal"), Carteira(nome="Outra")])
+        db.session.add_all(
+            [
+                Ativo(ticker="PETR4", nome="Petrobras PN", tipo_id=1),
+                Ativo(ticker="VALE3", nome="Vale ON", tipo_id=1),
+                Ativo(ticker="HGLG11", nome="CSHG Logística", tipo_id=2),
+            ]
+        )
+        db.session.commit()
+
+    yield app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def contexto(app):
+    """Contexto da aplicação (e sessão) para chamar os serviços diretamente."""
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def nova_operacao(contexto):
+    """Monta (sem gravar) uma operação pelos nomes do tipo, ticker e carteira."""
+
+    from services.referencia_service import obter_referencias
+
+    def montar(
+        data: date,
+        tipo: str,
+        quantidade,
+        preco,
+        ticker: str = "PETR4",
+        carteira: str = "Principal",
+        status: str = "Efetivada",
+        custos="0",
+    ) -> Operacao:
+        referencias = obter_referencias()
+        return Operacao(
+            data=data,
+            tipo_id=referencias.buscar_id("tipos_operacao", tipo),
+            ativo_id=referencias.buscar_id("ativos", ticker),
+            carteira_id=referencias.buscar_id("carteiras", carteira),
+            status_id=referencias.buscar_id("status_operacao", status),
+            quantidade=Decimal(str(quantidade)),
+            preco_unitario=Decimal(str(preco)),
+            custos=Decimal(str(custos)),
+        )
+
+    return montar
+
+
+@pytest.fixture
+def estado(contexto):
+    """Posições e resultado das vendas de um ativo, comparáveis entre cálculos."""
+
+    cinco_casas = Decimal("0.00001")
+
+    def ler(ativo_id: int = 1) -> dict:
+        db.session.expire_all()
+        posicoes = {
+            posicao.carteira_id: (
+                Decimal(posicao.custodia).quantize(cinco_casas),
+                Decimal(posicao.preco_medio).quantize(cinco_casas),
+            )
+            for posicao in PosicaoAtivo.query.filter_by(ativo_id=ativo_id)
+        }
+        ganhos = [
+            (
+                ganho.operacao_id,
+                ganho.quantidade,
+                ganho.resultado,
+                ganho.quantidade_day_trade,
+                ganho.resultado_day_trade,
+            )
+            for ganho in GanhoRealizado.query.filter_by(ativo_id=ativo_id).order_by(
+                GanhoRealizado.operacao_id
+            )
+        ]
+        return {"posicoes": posicoes, "ganhos": ganhos}
+
+    return ler
+
+
+@pytest.fixture
+def refeito_do_zero(estado):
+    """Estado do ativo depois de refazer todas as posições desde a primeira operação."""
+
+    from services.posicao_service import reprocessar_posicoes
+
+    def refazer(ativo_id: int = 1) -> dict:
+        reprocessar_posicoes()
+        return estado(ativo_id)
+
+    return refazer
@@ -0,0 +1,63 @@
+from datetime import date
+from decimal import Decimal
+from models import db, Operacao, PosicaoAtivo
+from services import agendamento_service
+from services.agendamento_service import _efetivar_lote, efetivar_agendadas
+from services.operacao_service import registrar_operacao
+from services.referencia_service import obter_referencias
+
+HOJE = date(2024, 3, 1)
+
+
+def _status(nome: str) -> int:
+    return obter_referencias().buscar_id("status_operacao", nome)
+
+
+def _agendar(nova_operacao):
+    registrar_operacao(nova_operacao(date(2024, 2, 1), "Compra", 100, 10))
+    for quantidade in (10, 20):
+        registrar_operacao(
+            nova_operacao(HOJE, "Compra", quantidade, 12, status="Agendada")
+        )
+
+
+def test_efetiva_as_vencidas_e_recalcula_a_posicao(nova_operacao):
+    _agendar(nova_operacao)
+    assert db.session.get(PosicaoAtivo, (1, 1)).custodia == Decimal("100")
+
+    resultado = efetivar_agendadas(hoje=HOJE, tamanho_lote=1)
+
+    assert (resultado["operacoes"], resultado["posicoes"]) == (2, 2)
+    db.session.expire_all()
+    assert db.session.get(PosicaoAtivo, (1, 1)).custodia == Decimal("130")
+    assert Operacao.query.filter_by(status_id=_status("Agendada")).count() == 0
+
+
+def test_dois_executores_reservando_o_mesmo_lote(app, nova_operacao, monkeypatch):
+    """
+    O segundo executor lê as mesmas linhas; o primeiro efetiva o lote entre a
+    leitura e a reserva do segundo, que então não efetiva nem recalcula nada
+    de novo.
+    """
+
+    _agendar(nova_operacao)
+    agendada, efetivada = _status("Agendada"), _status("Efetivada")
+    travar_posicoes = agendamento_service.travar_posicoes
+    primeiro = []
+
+    def executar_o_outro_antes(chaves):
+        if not primeiro:
+            primeiro.append(None)
+            # Outro contexto da aplicação: outra sessão, como outro processo
+            with app.app_context():
+                primeiro[0] = _efetivar_lote(HOJE, 10, agendada, efetivada)
+        travar_posicoes(chaves)
+
+    monkeypatch.setattr(agendamento_service, "travar_posicoes", executar_o_outro_antes)
+
+    segundo = _efetivar_lote(HOJE, 10, agendada, efetivada)
+
+    assert primeiro[0] == (2, 2, 1)
+    assert segundo == (2, 0, 0)
+    db.session.expire_all()
+    assert db.session.get(PosicaoAtivo, (1, 1)).custodia == Decimal("130")
@@ -0,0 +1,40 @@
+import warnings
+import numpy as np
+import pytest
+from services.analise_service import calcular_xirr
+
+
+def _vpl(datas, fluxos, taxa):
+    anos = (np.asarray(datas, dtype="datetime64[D]") - np.datetime64(datas[0])).astype(
+        float
+    ) / 365.0
+    return (np.asarray(fluxos) / (1 + taxa) ** anos).sum()
+
+
+def test_xirr_de_um_ano():
+    assert calcular_xirr(["2023-01-01", "2024-01-01"], [-100, 110]) == pytest.approx(
+        0.10
+    )
+
+
+def test_xirr_de_poucos_dias_acima_da_faixa_da_bissecao():
+    datas, fluxos = ["2024-01-01", "2024-01-11"], [-100, 130]
+    taxa = calcular_xirr(datas, fluxos)
+    assert taxa > 10
+    assert _vpl(datas, fluxos, taxa) == pytest.approx(0, abs=1e-6)
+
+
+def test_xirr_sem_solucao():
+    assert calcular_xirr(["2024-01-01", "2024-02-01"], [-100, -50]) is None
+
+
+def test_xirr_divergente_nao_emite_avisos_do_numpy():
+    # O Newton partindo de 10% estoura (1 + taxa) ** anos nestes fluxos
+    datas = ["2003-02-12", "2013-01-08", "2015-06-14"]
+    fluxos = [-0.18923619086466908, -1791.64534563951, 43.41232447352955]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        taxa = calcular_xirr(datas, fluxos)
+
+    assert _vpl(datas, fluxos, taxa) == pytest.approx(0, abs=1e-4)
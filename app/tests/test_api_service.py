@@ -0,0 +1,83 @@
+import pytest
+import requests
+from services import api_service
+
+
+class RespostaFalsa:
+    def __init__(self, status: int, dados: dict | None = None):
+        self.status_code = status
+        self.dados = dados
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code), response=self)
+
+    def json(self):
+        return self.dados
+
+
+@pytest.fixture
+def brapi(monkeypatch):
+    """Responde cada lote com o status escolhido por `status(tickers)`."""
+
+    chamadas = []
+
+    def configurar(status):
+        def get(url, params=None, timeout=None):
+            tickers = url.rsplit("/", 1)[1].split(",")
+            chamadas.append(tickers)
+            codigo = status(tickers)
+            if codigo != 200:
+                return RespostaFalsa(codigo)
+            return RespostaFalsa(
+                200,
+                {"results": [{"symbol": t, "regularMarketPrice": 10} for t in tickers]},
+            )
+
+        monkeypatch.setattr(api_service.requests, "get", get)
+        return chamadas
+
+    return configurar
+
+
+@pytest.mark.parametrize("codigo", [400, 404])
+def test_ticker_invalido_divide_o_lote(contexto, brapi, codigo):
+    chamadas = brapi(lambda tickers: codigo if "XXXX3" in tickers else 200)
+
+    cotacoes = api_service._buscar_lote_cotacoes(
+        "https://brapi/", "token", ["PETR4", "XXXX3", "VALE3", "ITUB4"]
+    )
+
+    assert sorted(cotacoes) == ["ITUB4", "PETR4", "VALE3"]
+    assert len(chamadas) > 1
+
+
+@pytest.mark.parametrize("codigo", [429, 500, 503])
+def test_limite_e_falha_do_servidor_nao_dividem_o_lote(contexto, brapi, codigo):
+    chamadas = brapi(lambda tickers: codigo)
+
+    cotacoes = api_service._buscar_lote_cotacoes(
+        "https://brapi/", "token", ["PETR4", "VALE3", "ITUB4", "BBAS3"]
+    )
+
+    assert cotacoes == {}
+    assert len(chamadas) == 1
+
+
+def test_chamadas_das_threads_entram_na_requisicao(app, brapi):
+    from flask import g
+    from utils.instrumentacao import EstatisticasRequisicao
+
+    chamadas = brapi(lambda tickers: 200)
+    app.config.update(COTACOES_PROVEDOR="brapi", BRAPI_TICKERS_POR_REQUISICAO=2)
+
+    with app.test_request_context():
+        g.instrumentacao = EstatisticasRequisicao()
+        cotacoes = api_service.buscar_cotacoes(
+            ["PETR4", "VALE3", "ITUB4", "BBAS3", "WEGE3"], usar_cache=False
+        )
+
+        assert len(cotacoes) == 5
+        assert len(chamadas) == 3
+        assert g.instrumentacao.chamadas_externas == 3
+        assert g.instrumentacao.tempo_externo > 0
@@ -0,0 +1,90 @@
+import pytest
+from models import db
+from services.referencia_service import registrar_alteracao
+from services.versao_service import incrementar_versao
+
+LISTAGENS = {
+    "/operacao/": ("operacoes", "ativos", "carteiras", "tipos_operacao"),
+    "/ativo/": ("ativos", "tipos_ativo"),
+    "/ativo/exibir/1": ("ativos", "tipos_ativo"),
+}
+
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def configuracao(request, tmp_path):
+    return {
+        "PAGINAS_CACHE_BACKEND": request.param,
+        "PAGINAS_CACHE_SQLITE_PATH": str(tmp_path / "paginas.sqlite3"),
+    }
+
+
+def _alterar(app, nome: str, referencia: bool):
+    with app.app_context():
+        if referencia:
+            registrar_alteracao(nome)
+        else:
+            incrementar_versao(nome)
+        db.session.commit()
+
+
+@pytest.mark.parametrize("url", LISTAGENS)
+def test_segunda_requisicao_vem_do_cache(client, url):
+    primeira = client.get(url)
+    segunda = client.get(url)
+
+    assert primeira.status_code == segunda.status_code == 200
+    assert primeira.headers["X-Cache"] == "MISS"
+    assert segunda.headers["X-Cache"] == "HIT"
+    assert segunda.get_data() == primeira.get_data()
+    assert segunda.headers["ETag"] == primeira.headers["ETag"]
+
+
+@pytest.mark.parametrize(
+    "url, nome",
+    [(url, nome) for url, conjuntos in LISTAGENS.items() for nome in conjuntos],
+)
+@pytest.mark.parametrize("referencia", [False, True])
+def test_alterar_um_conjunto_exibido_invalida_a_pagina(
+    app, client, url, nome, referencia
+):
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url).headers["X-Cache"] == "HIT"
+
+    _alterar(app, nome, referencia)
+
+    resposta = client.get(url)
+    assert resposta.headers["X-Cache"] == "MISS"
+    assert resposta.headers["ETag"] != etag
+    # A cópia que o navegador tinha deixou de valer
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_conjunto_nao_exibido_mantem_a_pagina(app, client):
+    client.get("/ativo/")
+    _alterar(app, "operacoes", referencia=False)
+    assert client.get("/ativo/").headers["X-Cache"] == "HIT"
+
+
+def test_etag_igual_responde_304(client):
+    etag = client.get("/operacao/").headers["ETag"]
+
+    resposta = client.get("/operacao/", headers={"If-None-Match": etag})
+
+    assert resposta.status_code == 304
+    assert resposta.get_data() == b""
+    assert resposta.headers["ETag"] == etag
+
+
+def test_mensagens_pendentes_nao_usam_nem_gravam_o_cache(client):
+    client.get("/ativo/")
+    with client.session_transaction() as sessao:
+        sessao["_flashes"] = [("success", "Ativo salvo.")]
+
+    com_mensagem = client.get("/ativo/")
+
+    assert "X-Cache" not in com_mensagem.headers
+    assert "Ativo salvo." in com_mensagem.get_data(as_text=True)
+    # A página com a mensagem não ficou no cache
+    resposta = client.get("/ativo/")
+    assert resposta.headers["X-Cache"] == "HIT"
+    assert "Ativo salvo." not in resposta.get_data(as_text=True)
@@ -0,0 +1,44 @@
+from datetime import date
+from decimal import Decimal
+import pytest
+from models import db, Cotacao
+from services import cotacao_service
+from services.cotacao_service import atualizar_cotacoes
+from services.operacao_service import registrar_operacao
+from services.versao_service import obter_versoes
+
+
+@pytest.fixture
+def precos(nova_operacao, monkeypatch):
+    """Preços devolvidos pelo provedor, alteráveis pelo teste."""
+
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 10))
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 10, 60, "VALE3"))
+    precos = {"PETR4": Decimal("38.5"), "VALE3": Decimal("61.25")}
+    monkeypatch.setattr(
+        cotacao_service, "buscar_cotacoes", lambda tickers, **_: dict(precos)
+    )
+    return precos
+
+
+def _versao() -> int:
+    return obter_versoes().get("cotacoes", 0)
+
+
+def test_versao_so_muda_quando_algum_preco_muda(precos):
+    assert atualizar_cotacoes() == 2
+    versao = _versao()
+    assert versao > 0
+    gravada_em = db.session.get(Cotacao, 1).atualizado_em
+
+    # Mesmos preços (mercado fechado): nada é gravado
+    assert atualizar_cotacoes() == 2
+    assert _versao() == versao
+    assert db.session.get(Cotacao, 1).atualizado_em == gravada_em
+
+    precos["VALE3"] = Decimal("61.30")
+    atualizar_cotacoes()
+    assert _versao() > versao
+    db.session.expire_all()
+    assert db.session.get(Cotacao, 2).preco == Decimal("61.30")
+    assert db.session.get(Cotacao, 1).atualizado_em == gravada_em
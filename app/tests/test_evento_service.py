@@ -0,0 +1,42 @@
+from datetime import date
+from decimal import Decimal
+from services.evento_service import aplicar_evento_corporativo
+from services.operacao_service import registrar_operacao
+
+CINCO_CASAS = Decimal("0.00001")
+
+
+def test_grupamento_e_bonificacao_pelo_update_iguais_ao_historico(
+    nova_operacao, estado, refeito_do_zero
+):
+    for carteira in ("Principal", "Outra"):
+        registrar_operacao(
+            nova_operacao(date(2024, 1, 2), "Compra", 100, 10, carteira=carteira)
+        )
+    registrar_operacao(
+        nova_operacao(date(2024, 1, 3), "Compra", 50, 16, carteira="Outra")
+    )
+
+    aplicar_evento_corporativo(1, "Grupamento", date(2024, 2, 1), Decimal("10"))
+    aplicar_evento_corporativo(
+        1, "Bonificação", date(2024, 3, 1), Decimal("0.1"), Decimal("5")
+    )
+
+    pelo_update = estado()
+    assert pelo_update["posicoes"][1] == (
+        Decimal("11"),
+        (Decimal("1005") / 11).quantize(CINCO_CASAS),
+    )
+    assert pelo_update["posicoes"][2][0] == Decimal("16.5")
+    assert pelo_update == refeito_do_zero()
+
+
+def test_evento_retroativo_reaplica_o_historico(nova_operacao, estado, refeito_do_zero):
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 10))
+    registrar_operacao(nova_operacao(date(2024, 3, 1), "Venda", 50, 3))
+
+    aplicar_evento_corporativo(1, "Desdobramento", date(2024, 2, 1), Decimal("2"))
+
+    depois = estado()
+    assert depois["posicoes"][1] == (Decimal("150"), Decimal("5"))
+    assert depois == refeito_do_zero()
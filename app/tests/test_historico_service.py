@@ -0,0 +1,86 @@
+import io
+import os
+import time
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+import pytest
+from services import historico_service
+from services.historico_service import (
+    _anos_antes,
+    carregar_historico_provedor,
+    importar_historico_csv,
+    ler_historico,
+)
+
+
+@pytest.fixture
+def diretorio(app, contexto, tmp_path):
+    app.config["HISTORICO_DIR"] = str(tmp_path)
+    return tmp_path
+
+
+def test_anos_antes_de_29_de_fevereiro():
+    assert _anos_antes(date(2024, 2, 29), 5) == date(2019, 2, 28)
+    assert _anos_antes(date(2024, 2, 29), 4) == date(2020, 2, 29)
+    assert _anos_antes(date(2025, 3, 31), 1) == date(2024, 3, 31)
+
+
+@pytest.mark.parametrize("ticker", ["../app", "a/b12", "PETR4.npy", "X", ""])
+def test_caminho_recusa_ticker_invalido(diretorio, ticker):
+    with pytest.raises(ValueError, match="Ticker inválido"):
+        historico_service._caminho(ticker)
+
+
+def test_caminho_normaliza_o_ticker(diretorio):
+    assert historico_service._caminho(" petr4 ") == os.path.join(diretorio, "PETR4.npy")
+
+
+def test_importacao_com_ticker_invalido_nao_grava_nada(diretorio):
+    arquivo = io.StringIO(
+        "ticker,data,fechamento\nPETR4,2024-01-02,30\n../../x,2024-01-02,1\n"
+    )
+
+    with pytest.raises(ValueError, match="Ticker inválido"):
+        importar_historico_csv(arquivo)
+    assert os.listdir(diretorio) == []
+
+
+def test_carga_ignora_tickers_invalidos(app, diretorio):
+    app.config["COTACOES_PROVEDOR"] = "fake"
+
+    resultado = carregar_historico_provedor(["PETR4", "../etc/passwd"], periodo="1y")
+
+    assert list(resultado) == ["PETR4"]
+    assert len(ler_historico("PETR4")["datas"]) == resultado["PETR4"]
+    assert len(ler_historico("../etc/passwd")["datas"]) == 0
+
+
+@pytest.fixture
+def servidor_em_utc(monkeypatch):
+    monkeypatch.setenv("TZ", "UTC")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_dia_do_pregao_da_brapi_no_fuso_de_brasilia(
+    app, contexto, servidor_em_utc, monkeypatch
+):
+    class Resposta:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            # 1º de março às 22h em Brasília, já dia 2 em UTC
+            fim_do_dia = datetime(2024, 3, 1, 22, tzinfo=ZoneInfo("America/Sao_Paulo"))
+            barra = {"date": int(fim_do_dia.timestamp()), "close": 30}
+            return {"results": [{"historicalDataPrice": [barra]}]}
+
+    monkeypatch.setattr(
+        historico_service.requests, "get", lambda *args, **kwargs: Resposta()
+    )
+
+    barras = historico_service._buscar_historico_brapi("PETR4", "1y")
+
+    assert barras["datas"] == [date(2024, 3, 1)]
@@ -0,0 +1,53 @@
+import io
+from decimal import Decimal
+from models import db, Operacao, PosicaoAtivo
+from services.importacao_service import importar_operacoes, ler_linhas_csv
+
+EXTRATO = """data;ticker;tipo;quantidade;preco;carteira
+02/01/2024;PETR4;Compra;100;10,00;Principal
+02/01/2024;PETR4;Venda;100;12,00;Principal
+02/01/2024;PETR4;Compra;50;11,00;Principal
+02/01/2024;PETR4;Compra;50;11,00;Principal
+"""
+
+
+def _importar(texto: str, **opcoes) -> dict:
+    return importar_operacoes(ler_linhas_csv(io.StringIO(texto)), **opcoes)
+
+
+def test_linhas_recebem_registro_na_ordem_do_arquivo(contexto):
+    resultado = _importar(EXTRATO)
+
+    assert resultado["importadas"] == 4
+    registros = db.session.scalars(
+        db.select(Operacao.registro).order_by(Operacao.id)
+    ).all()
+    assert registros == sorted(set(registros))
+
+    # Compra, venda de tudo e duas compras: a venda não encontra as compras seguintes
+    posicao = PosicaoAtivo.query.filter_by(ativo_id=1, carteira_id=1).one()
+    assert Decimal(posicao.custodia) == Decimal("100")
+    assert Decimal(posicao.preco_medio) == Decimal("11")
+
+
+def test_reimportar_o_mesmo_extrato_nao_duplica(contexto):
+    _importar(EXTRATO)
+
+    resultado = _importar(EXTRATO + "03/01/2024;PETR4;Compra;10;9,00;Principal\n")
+
+    assert resultado["importadas"] == 1
+    assert resultado["duplicadas"] == [2, 3, 4, 5]
+    assert Operacao.query.count() == 5
+
+
+def test_linhas_repetidas_alem_das_cadastradas_sao_importadas(contexto):
+    _importar(EXTRATO)
+
+    # Um terceiro negócio igual no mesmo dia; o dry_run também aponta as duplicadas
+    novo = EXTRATO + "02/01/2024;PETR4;Compra;50;11,00;Principal\n"
+    assert _importar(novo, dry_run=True)["duplicadas"] == [2, 3, 4, 5]
+
+    resultado = _importar(novo, tamanho_lote=2)
+    assert resultado["importadas"] == 1
+    assert resultado["duplicadas"] == [2, 3, 4, 5]
+    assert Operacao.query.count() == 5
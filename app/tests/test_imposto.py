@@ -0,0 +1,72 @@
+from datetime import date
+from decimal import Decimal
+import pytest
+from services.imposto_service import COMUM, FII, apurar_imposto
+from services.operacao_service import registrar_operacao
+
+
+def _mes(apuracao: dict, ano: int, mes: int) -> dict:
+    return next(item for item in apuracao["meses"] if item["mes"] == date(ano, mes, 1))
+
+
+def test_prejuizo_e_compensado_nos_meses_seguintes(nova_operacao):
+    # Vendas acima de R$ 20.000,00 no mês: sem a isenção das ações
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 1000, 30))
+    registrar_operacao(nova_operacao(date(2024, 1, 10), "Venda", 1000, 25))
+    registrar_operacao(nova_operacao(date(2024, 2, 1), "Compra", 1000, 30))
+    registrar_operacao(nova_operacao(date(2024, 2, 15), "Venda", 600, 40))
+
+    apuracao = apurar_imposto()
+
+    janeiro = _mes(apuracao, 2024, 1)
+    assert janeiro["grupos"][COMUM]["prejuizo_acumulado"] == Decimal("5000.00")
+    assert janeiro["darf"] == 0
+
+    fevereiro = _mes(apuracao, 2024, 2)
+    assert fevereiro["isento"] is False
+    assert fevereiro["grupos"][COMUM]["prejuizo_compensado"] == Decimal("5000.00")
+    assert fevereiro["grupos"][COMUM]["base_calculo"] == Decimal("1000.00")
+    assert fevereiro["darf"] == Decimal("150.00")
+    assert apuracao["prejuizos"][COMUM] == 0
+
+
+def test_vendas_de_acoes_ate_o_limite_sao_isentas(nova_operacao):
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 100))
+    registrar_operacao(nova_operacao(date(2024, 1, 10), "Venda", 100, 150))
+
+    janeiro = _mes(apurar_imposto(), 2024, 1)
+
+    assert janeiro["isento"] is True
+    assert janeiro["ganho_isento"] == Decimal("5000.00")
+    assert janeiro["darf"] == 0
+
+
+def test_imposto_abaixo_do_minimo_passa_para_o_mes_seguinte(nova_operacao):
+    fii = {"ticker": "HGLG11"}
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 20, 100, **fii))
+    # R$ 40,00 de ganho em FII: R$ 8,00 de imposto, abaixo do mínimo do DARF
+    registrar_operacao(nova_operacao(date(2024, 1, 10), "Venda", 10, 104, **fii))
+    registrar_operacao(nova_operacao(date(2024, 2, 10), "Venda", 10, 104, **fii))
+
+    apuracao = apurar_imposto()
+
+    janeiro = _mes(apuracao, 2024, 1)
+    assert janeiro["grupos"][FII]["imposto"] == Decimal("8.00")
+    assert janeiro["darf"] == 0
+    assert janeiro["imposto_pendente"] == Decimal("8.00")
+
+    fevereiro = _mes(apuracao, 2024, 2)
+    assert fevereiro["darf"] == Decimal("16.00")
+    assert fevereiro["imposto_pendente"] == 0
+
+
+def test_falha_sem_os_tipos_de_ativo_das_regras(contexto):
+    from models import db, TipoAtivo
+    from services.referencia_service import registrar_alteracao
+
+    db.session.get(TipoAtivo, 2).nome = "Fundos Imobiliários"
+    registrar_alteracao("tipos_ativo")
+    db.session.commit()
+
+    with pytest.raises(ValueError, match="FII"):
+        apurar_imposto()
@@ -0,0 +1,30 @@
+import os
+from flask_migrate import upgrade
+from models import db
+
+MIGRACOES = os.path.join(os.path.dirname(__file__), os.pardir, "migrations")
+
+
+def _indices(tabela: str) -> set[str]:
+    return {indice["name"] for indice in db.inspect(db.engine).get_indexes(tabela)}
+
+
+def test_migracao_cria_os_indices_em_tabelas_existentes(contexto):
+    for nome in ("ix_operacoes_carteira_data", "ix_ativos_nome_id"):
+        tabela = nome.split("_")[1]
+        db.session.execute(db.text(f"DROP INDEX {nome}"))
+        assert nome not in _indices(tabela)
+    db.session.commit()
+
+    upgrade(directory=MIGRACOES)
+    # Rodar de novo (banco já na última versão) não faz nada
+    upgrade(directory=MIGRACOES)
+
+    assert {
+        "ix_operacoes_ativo_carteira_data",
+        "ix_operacoes_carteira_data",
+        "ix_operacoes_data_id",
+    } <= _indices("operacoes")
+    assert "ix_ativos_nome_id" in _indices("ativos")
+    # O índice de trigramas é só do PostgreSQL
+    assert "ix_ativos_ticker_trgm" not in _indices("ativos")
@@ -0,0 +1,45 @@
+import csv
+import io
+from datetime import date
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+from models import db, Ativo
+from services.operacao_service import registrar_operacao
+
+
+@pytest.fixture
+def operacoes(nova_operacao):
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 10))
+    registrar_operacao(nova_operacao(date(2024, 1, 3), "Compra", 10, 60, "VALE3"))
+    registrar_operacao(nova_operacao(date(2024, 1, 4), "Compra", 5, 160, "HGLG11"))
+
+
+def _tickers_exportados(client, **filtros) -> list[str]:
+    resposta = client.get("/operacao/exportar", query_string=filtros)
+    linhas = list(csv.reader(io.StringIO(resposta.get_data(as_text=True))))
+    return [linha[1] for linha in linhas[1:]]
+
+
+@pytest.mark.parametrize(
+    "trecho, esperados",
+    [
+        ("etr", ["PETR4"]),
+        ("4", ["PETR4"]),
+        ("LE", ["VALE3"]),
+        ("%", []),
+        ("_", []),
+    ],
+)
+def test_filtro_por_trecho_do_ticker(client, operacoes, trecho, esperados):
+    assert _tickers_exportados(client, ticker=trecho) == esperados
+
+
+def test_indice_de_trigramas_do_ticker_so_no_postgresql(contexto):
+    indice = next(i for i in Ativo.__table__.indexes if i.name.endswith("_trgm"))
+
+    ddl = str(CreateIndex(indice).compile(dialect=postgresql.dialect()))
+    assert "USING gin (ticker gin_trgm_ops)" in ddl
+    # Criado só pela migração, e apenas no PostgreSQL
+    criados = {i["name"] for i in db.inspect(db.engine).get_indexes("ativos")}
+    assert indice.name not in criados
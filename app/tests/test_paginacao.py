@@ -0,0 +1,149 @@
+import base64
+import json
+from datetime import date
+import pytest
+from models import db, Ativo, Operacao
+from utils.paginacao import codificar_cursor, contar_registros, paginar_keyset
+
+
+@pytest.fixture
+def operacoes(nova_operacao):
+    """23 operações em 5 datas: muitos empates em (data), desempatados pelo id."""
+
+    db.session.add_all(
+        nova_operacao(date(2024, 1, 2 + indice % 5), "Compra", 1, 10)
+        for indice in range(23)
+    )
+    db.session.commit()
+    return db.select(Operacao)
+
+
+@pytest.fixture
+def ativos(contexto):
+    db.session.add_all(
+        Ativo(ticker=f"BANC{indice}", nome="Banco", tipo_id=1) for indice in range(7)
+    )
+    db.session.commit()
+    return db.select(Ativo)
+
+
+def _percorrer(query, colunas, descendente, por_pagina=4):
+    """Ids de todas as páginas indo para frente e, da última, voltando."""
+
+    paginas = [paginar_keyset(query, colunas, None, "next", por_pagina, descendente)]
+    while paginas[-1].has_next:
+        paginas.append(
+            paginar_keyset(
+                query, colunas, paginas[-1].next_cursor, "next", por_pagina, descendente
+            )
+        )
+
+    voltando = [paginas[-1]]
+    while voltando[-1].has_prev:
+        voltando.append(
+            paginar_keyset(
+                query,
+                colunas,
+                voltando[-1].prev_cursor,
+                "prev",
+                por_pagina,
+                descendente,
+            )
+        )
+
+    def ids(lista):
+        return [[item.id for item in pagina.items] for pagina in lista]
+
+    return ids(paginas), ids(reversed(voltando))
+
+
+def test_operacoes_por_data_e_id_com_empates(operacoes):
+    colunas = [Operacao.data, Operacao.id]
+    indo, voltando = _percorrer(operacoes, colunas, descendente=True)
+
+    esperado = [
+        operacao.id
+        for operacao in db.session.scalars(
+            operacoes.order_by(Operacao.data.desc(), Operacao.id.desc())
+        )
+    ]
+    assert [id_ for pagina in indo for id_ in pagina] == esperado
+    assert all(len(pagina) == 4 for pagina in indo[:-1]) and len(indo[-1]) == 3
+    assert voltando == indo
+
+
+def test_ativos_por_nome_e_id_com_empates(ativos):
+    colunas = [Ativo.nome, Ativo.id]
+    indo, voltando = _percorrer(ativos, colunas, descendente=False, por_pagina=3)
+
+    esperado = [
+        ativo.id for ativo in db.session.scalars(ativos.order_by(Ativo.nome, Ativo.id))
+    ]
+    assert [id_ for pagina in indo for id_ in pagina] == esperado
+    assert voltando == indo
+
+
+def _texto_cursor(valores) -> str:
+    texto = json.dumps(valores).encode()
+    return base64.urlsafe_b64encode(texto).decode().rstrip("=")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "nao-e-base64!",
+        _texto_cursor({"a": 1}),
+        _texto_cursor([["d", "2024-13-45"], ["v", 1]]),
+        # Chave de outra listagem (nome, id) e valores de tipos trocados
+        codificar_cursor(["Banco", 3]),
+        codificar_cursor([date(2024, 1, 3)]),
+        _texto_cursor([["v", "2024-01-03"], ["v", 5]]),
+        _texto_cursor([["t", "2024-01-03T10:00:00"], ["v", 5]]),
+        _texto_cursor([["d", "2024-01-03"], ["v", True]]),
+        _texto_cursor([["d", "2024-01-03"], ["v", 2**70]]),
+    ],
+)
+def test_cursor_adulterado_ou_de_outra_chave_volta_a_primeira_pagina(
+    operacoes, client, cursor
+):
+    colunas = [Operacao.data, Operacao.id]
+    primeira = paginar_keyset(operacoes, colunas, por_pagina=4, descendente=True)
+
+    for direcao in ("next", "prev"):
+        pagina = paginar_keyset(
+            operacoes, colunas, cursor, direcao, por_pagina=4, descendente=True
+        )
+        assert [item.id for item in pagina.items] == [
+            item.id for item in primeira.items
+        ]
+        assert not pagina.has_prev
+
+    assert client.get("/operacao/", query_string={"cursor": cursor}).status_code == 200
+    assert client.get("/ativo/", query_string={"cursor": cursor}).status_code == 200
+
+
+def test_contar_registros_so_quando_pedido(operacoes):
+    assert contar_registros(operacoes) is None
+    assert contar_registros(operacoes, exato=True) == 23
+    filtrada = operacoes.where(Operacao.data == date(2024, 1, 2))
+    assert contar_registros(filtrada, exato=True) == 5
+
+
+def test_contar_registros_estima_sem_filtros_no_postgresql(operacoes, monkeypatch):
+    consultas = []
+    executar = db.session.execute
+
+    def execute(consulta, parametros=None, *args, **kwargs):
+        if "pg_class" in str(consulta):
+            consultas.append(parametros)
+            return executar(db.text("SELECT 1000"))
+        return executar(consulta, parametros, *args, **kwargs)
+
+    monkeypatch.setattr(db.engine.dialect, "name", "postgresql")
+    monkeypatch.setattr(db.session, "execute", execute)
+
+    assert contar_registros(operacoes) == 1000
+    assert consultas == [{"tabela": "operacoes"}]
+    # Com filtro a estimativa da tabela não vale
+    assert contar_registros(operacoes.where(Operacao.carteira_id == 1)) is None
+    assert len(consultas) == 1
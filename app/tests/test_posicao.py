@@ -0,0 +1,140 @@
+from datetime import date
+from decimal import Decimal
+from models import db, GanhoRealizado, PosicaoSnapshot
+from services.operacao_service import atualizar_operacao, registrar_operacao
+from services.posicao_service import recalcular_posicao_historico
+
+
+def test_compra_e_venda_no_mesmo_dia_incremental_igual_ao_historico(
+    nova_operacao, estado, refeito_do_zero
+):
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 10))
+    registrar_operacao(nova_operacao(date(2024, 1, 3), "Compra", 100, 20))
+    registrar_operacao(nova_operacao(date(2024, 1, 3), "Venda", 150, 25))
+    registrar_operacao(nova_operacao(date(2024, 1, 4), "Venda", 10, 30))
+
+    incremental = estado()
+    assert incremental == refeito_do_zero()
+    assert incremental["posicoes"][1] == (Decimal("40"), Decimal("15"))
+
+
+def test_edicao_parte_do_snapshot_e_chega_ao_mesmo_resultado(
+    app, nova_operacao, estado, refeito_do_zero
+):
+    app.config["POSICAO_SNAPSHOT_INTERVALO"] = 2
+    operacoes = [
+        nova_operacao(date(2024, 1, dia), tipo, quantidade, preco)
+        for dia, tipo, quantidade, preco in [
+            (2, "Compra", 100, 10),
+            (3, "Compra", 50, 12),
+            (3, "Venda", 30, 15),
+            (4, "Compra", 20, 11),
+            (5, "Venda", 60, 14),
+            (8, "Compra", 40, 9),
+            (9, "Venda", 10, 13),
+        ]
+    ]
+    for operacao in operacoes:
+        registrar_operacao(operacao)
+    assert PosicaoSnapshot.query.count() > 0
+
+    atualizar_operacao(operacoes[4], quantidade=Decimal("70"))
+
+    assert estado() == refeito_do_zero()
+
+
+def test_compras_acrescentadas_mantem_a_precisao_do_historico(
+    nova_operacao, estado, refeito_do_zero
+):
+    # Preços médios com dízimas: arredondados a cada compra, o custo da venda
+    # se afastaria do histórico reaplicado
+    for dia, quantidade, preco in [
+        (2, 300007, "10.01"),
+        (3, 700001, "10.03"),
+        (4, 1100003, "10.07"),
+        (5, 900011, "9.97"),
+        (8, 1300009, "10.11"),
+    ]:
+        registrar_operacao(
+            nova_operacao(date(2024, 1, dia), "Compra", quantidade, preco)
+        )
+    venda = registrar_operacao(
+        nova_operacao(date(2024, 1, 9), "Venda", 4000000, "10.50")
+    )
+
+    # O último snapshot acompanha a última operação: a próxima edição parte dele
+    ultimo = db.session.execute(
+        db.select(PosicaoSnapshot.operacao_id, PosicaoSnapshot.num_operacoes)
+        .order_by(PosicaoSnapshot.data.desc())
+        .limit(1)
+    ).one()
+    assert tuple(ultimo) == (venda.id, 6)
+
+    incremental = estado()
+    assert incremental == refeito_do_zero()
+
+
+def test_livro_separa_day_trade_da_operacao_comum(nova_operacao):
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 10))
+    registrar_operacao(nova_operacao(date(2024, 1, 3), "Compra", 100, 20))
+    venda = registrar_operacao(nova_operacao(date(2024, 1, 3), "Venda", 150, 25))
+
+    ganho = db.session.get(GanhoRealizado, venda.id)
+    # 100 casadas com a compra do dia (a 20) e 50 pelo preço médio anterior (10)
+    assert ganho.quantidade_day_trade == Decimal("100")
+    assert ganho.valor_venda_day_trade == Decimal("2500.00")
+    assert ganho.resultado_day_trade == Decimal("500.00")
+    assert ganho.quantidade == Decimal("50")
+    assert ganho.valor_venda == Decimal("1250.00")
+    assert ganho.resultado == Decimal("750.00")
+
+
+def test_snapshot_no_meio_do_dia_nao_e_usado(nova_operacao, estado, refeito_do_zero):
+    compra = registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 10))
+    compra_dia = registrar_operacao(nova_operacao(date(2024, 1, 3), "Compra", 100, 20))
+    registrar_operacao(nova_operacao(date(2024, 1, 3), "Venda", 100, 25))
+    registrar_operacao(nova_operacao(date(2024, 1, 5), "Compra", 1, 10))
+    esperado = refeito_do_zero()
+
+    # Snapshot antigo, gravado entre a compra e a venda do mesmo dia
+    PosicaoSnapshot.query.delete()
+    db.session.add(
+        PosicaoSnapshot(
+            ativo_id=compra.ativo_id,
+            carteira_id=compra.carteira_id,
+            data=compra_dia.data,
+            registro=compra_dia.registro,
+            operacao_id=compra_dia.id,
+            num_operacoes=2,
+            custodia=Decimal("200"),
+            preco_medio=Decimal("15"),
+        )
+    )
+    db.session.flush()
+
+    recalcular_posicao_historico(
+        compra.ativo_id, compra.carteira_id, a_partir_de=date(2024, 1, 5)
+    )
+    db.session.commit()
+
+    assert estado() == esperado
+    assert esperado["ganhos"][0][3:] == (Decimal("100"), Decimal("500.00"))
+
+
+def test_regras_antigas_sao_refeitas_pelo_comando_e_nao_na_inicializacao(
+    app, nova_operacao
+):
+    from models import VersaoDados
+
+    registrar_operacao(nova_operacao(date(2024, 1, 2), "Compra", 100, 10))
+    registrar_operacao(nova_operacao(date(2024, 1, 3), "Dividendo", 100, 1))
+    assert db.session.get(VersaoDados, "regras_posicao") is None
+
+    comando = ["operacoes", "reprocessar", "--se-desatualizadas"]
+    resultado = app.test_cli_runner().invoke(args=comando)
+    assert resultado.output == "1 posições refeitas pelas regras atuais.\n"
+    db.session.expire_all()
+    assert db.session.get(VersaoDados, "regras_posicao").versao >= 1
+
+    resultado = app.test_cli_runner().invoke(args=comando)
+    assert resultado.output == "Posições já calculadas pelas regras atuais.\n"
@@ -0,0 +1,59 @@
+from models import db, Carteira
+from services import referencia_service
+from services.referencia_service import obter_referencias, registrar_alteracao
+
+
+def _carteiras() -> list[str]:
+    return [linha.nome for linha in obter_referencias().listar("carteiras")]
+
+
+def test_copia_local_so_e_descartada_depois_do_commit(contexto):
+    assert _carteiras() == ["Principal", "Outra"]
+
+    db.session.add(Carteira(nome="Nova"))
+    registrar_alteracao("carteiras")
+    db.session.flush()
+    # Antes do commit, quem lê continua com a cópia (e as linhas) de antes
+    assert _carteiras() == ["Principal", "Outra"]
+
+    db.session.rollback()
+    assert _carteiras() == ["Principal", "Outra"]
+
+    db.session.add(Carteira(nome="Nova"))
+    registrar_alteracao("carteiras")
+    db.session.commit()
+    assert _carteiras() == ["Principal", "Outra", "Nova"]
+
+
+def test_consulta_roda_fora_da_trava(contexto, monkeypatch):
+    cache = obter_referencias()
+    consulta = referencia_service.CONSULTAS["carteiras"]
+
+    def verificar_trava():
+        assert not cache._lock.locked()
+        return consulta()
+
+    monkeypatch.setitem(referencia_service.CONSULTAS, "carteiras", verificar_trava)
+    assert _carteiras() == ["Principal", "Outra"]
+
+
+def test_linhas_lidas_antes_de_uma_invalidacao_nao_ficam_no_cache(
+    contexto, monkeypatch
+):
+    cache = obter_referencias()
+    consulta = referencia_service.CONSULTAS["carteiras"]
+    consultas = []
+
+    def invalidar_durante_a_consulta():
+        consultas.append(None)
+        if len(consultas) == 1:
+            # Outra requisição grava e faz o commit enquanto esta consulta roda
+            cache.invalidar("carteiras")
+        return consulta()
+
+    monkeypatch.setitem(
+        referencia_service.CONSULTAS, "carteiras", invalidar_durante_a_consulta
+    )
+    _carteiras()
+    _carteiras()
+    assert len(consultas) == 2
@@ -0,0 +1,67 @@
+from datetime import date
+import pytest
+from models import db, Ativo, TipoAtivo
+from utils.replica import REPLICA
+
+
+@pytest.fixture
+def configuracao():
+    return {"DB_REPLICA_URL": "sqlite://", "PAGINAS_CACHE_BACKEND": "nenhum"}
+
+
+@pytest.fixture
+def replica(app):
+    """A réplica com as tabelas e um ativo que só existe nela."""
+
+    with app.app_context():
+        engine = db.engines[REPLICA]
+    db.metadata.create_all(engine)
+    with engine.begin() as conexao:
+        conexao.execute(db.insert(TipoAtivo).values(id=1, nome="Ações"))
+        conexao.execute(
+            db.insert(Ativo).values(ticker="REPL3", nome="Só na réplica", tipo_id=1)
+        )
+    return engine
+
+
+def test_consultas_vao_para_a_replica_ate_a_primeira_gravacao(contexto, replica):
+    sessao = db.session()
+    sessao.info["somente_leitura"] = True
+
+    assert sessao.get_bind(clause=db.select(Ativo)) is replica
+    # SELECT ... FOR UPDATE e gravações vão para o principal, e a sessão fica nele
+    assert sessao.get_bind(clause=db.select(Ativo).with_for_update()) is db.engine
+    assert sessao.get_bind(clause=db.select(Ativo)) is db.engine
+
+
+def test_sem_rota_somente_leitura_usa_o_principal(contexto, replica):
+    assert db.session().get_bind(clause=db.select(Ativo)) is db.engine
+
+
+def test_rota_somente_leitura_le_da_replica(client, replica):
+    pagina = client.get("/ativo/").get_data(as_text=True)
+
+    assert "REPL3" in pagina
+    assert "PETR4" not in pagina
+
+
+def test_apos_gravar_le_do_principal(client, replica):
+    resposta = client.post(
+        "/operacao/adicionar",
+        data={
+            "data_operacao": date(2024, 1, 2).isoformat(),
+            "ativo_busca": "PETR4",
+            "ativo": "1",
+            "tipo": "1",
+            "carteira": "1",
+            "quantidade": "10",
+            "preco_unitario": "5",
+            "custos": "0",
+        },
+    )
+    assert resposta.status_code == 302
+
+    pagina = client.get("/ativo/").get_data(as_text=True)
+
+    assert "PETR4" in pagina
+    assert "REPL3" not in pagina
@@ -0,0 +1,86 @@
+from datetime import date
+from decimal import Decimal
+import pytest
+from models import db, CarteiraValorDiario, Operacao, PosicaoAtivo, PosicaoSnapshot
+from services.analise_service import calcular_curva_patrimonio
+from services.evento_service import aplicar_evento_corporativo
+from services.operacao_service import registrar_operacao
+from services.posicao_service import posicao_por_dia, reprocessar_posicoes
+from services.valor_diario_service import atualizar_valor_diario
+
+
+@pytest.fixture
+def historico(app, nova_operacao, tmp_path):
+    """Operações com snapshots frequentes e sem histórico local de preços."""
+
+    app.config["HISTORICO_DIR"] = str(tmp_path)
+    app.config["POSICAO_SNAPSHOT_INTERVALO"] = 2
+    for dia, tipo, quantidade, preco in [
+        (date(2024, 1, 2), "Compra", 100, "10.33"),
+        (date(2024, 1, 10), "Compra", 70, "12.47"),
+        (date(2024, 1, 15), "Venda", 30, "13"),
+        (date(2024, 1, 22), "Compra", 3, "11.11"),
+    ]:
+        registrar_operacao(nova_operacao(dia, tipo, quantidade, preco))
+    aplicar_evento_corporativo(1, "Desdobramento", date(2024, 2, 1), Decimal("3"))
+    reprocessar_posicoes()
+    assert PosicaoSnapshot.query.count() > 0
+
+
+def _gravados() -> list[tuple]:
+    return [
+        (linha.data, linha.valor_investido, linha.valor_mercado)
+        for linha in CarteiraValorDiario.query.filter_by(carteira_id=1).order_by(
+            CarteiraValorDiario.data
+        )
+    ]
+
+
+def test_incremental_igual_a_refazer_e_ao_custo_da_posicao(historico):
+    atualizar_valor_diario([1], ate=date(2024, 1, 12))
+    atualizar_valor_diario([1], ate=date(2024, 1, 19))
+    atualizar_valor_diario([1], ate=date(2024, 2, 9))
+    incremental = _gravados()
+
+    atualizar_valor_diario([1], ate=date(2024, 2, 9), refazer=True)
+    assert _gravados() == incremental
+
+    # O valor investido gravado é o custo da posição, em Decimal
+    posicao = db.session.get(PosicaoAtivo, (1, 1))
+    custo = (posicao.custodia * posicao.preco_medio).quantize(Decimal("0.01"))
+    assert incremental[-1][1] == custo
+    # Sem histórico de preços, o mercado usa a última negociação, desdobrada
+    assert incremental[-1][2] == (posicao.custodia * Decimal("11.11") / 3).quantize(
+        Decimal("0.01")
+    )
+
+
+def test_mesmos_valores_da_curva_do_grafico(historico):
+    atualizar_valor_diario([1], ate=date(2024, 2, 9))
+
+    curva = calcular_curva_patrimonio([1], date(2024, 1, 2), date(2024, 2, 9))
+    gravados = _gravados()
+    assert [str(dia) for dia, _, _ in gravados] == curva["datas"]
+    for (_, investido, mercado), investido_grafico, mercado_grafico in zip(
+        gravados, curva["investido"], curva["valores"]
+    ):
+        assert float(investido) == pytest.approx(investido_grafico, abs=0.01)
+        assert float(mercado) == pytest.approx(mercado_grafico, abs=0.01)
+
+
+def test_parte_do_snapshot_sem_ler_as_operacoes_anteriores(historico):
+    dias = [date(2024, 1, 23), date(2024, 2, 1)]
+    esperado = list(posicao_por_dia(1, 1, dias))
+
+    # A primeira compra fica antes do último snapshot anterior aos dias:
+    # apagá-la (sem recalcular) não muda nada se ela não for lida
+    snapshot = (
+        PosicaoSnapshot.query.filter(PosicaoSnapshot.data < dias[0])
+        .order_by(PosicaoSnapshot.data.desc())
+        .first()
+    )
+    assert snapshot.data > date(2024, 1, 2)
+    db.session.execute(db.delete(Operacao).where(Operacao.data == date(2024, 1, 2)))
+
+    assert list(posicao_por_dia(1, 1, dias)) == esperado
+    assert esperado[-1][0] == snapshot.custodia * 3
@@ -0,0 +1,200 @@
+# utils/cache_paginas.py
+"""
+Cache das páginas HTML das listagens e dos detalhes.
+
+A chave de cada página é formada pela rota, pelos argumentos da URL, pelos
+filtros (query string) e pelas versões dos conjuntos de dados que ela exibe
+("versao_dados", incrementadas a cada gravação). Assim, uma página fica
+válida até alguém alterar um desses conjuntos, sem prazo de expiração; as
+páginas de versões antigas deixam de ser usadas e saem pelo limite de itens.
+
+A mesma chave serve de ETag: o navegador que já tem a página recebe 304.
+Respostas com mensagens (flash) pendentes não são servidas nem gravadas no
+cache, pois são diferentes para cada navegador.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, make_response, request, session
+from services.versao_service import obter_versoes
+from utils.instrumentacao import metricas
+from utils.respostas import cliente_tem_versao, gerar_etag
+
+
+class CachePaginasMemoria:
+    """Páginas no próprio processo, descartando a usada há mais tempo (LRU)."""
+
+    def __init__(self, max_itens: int):
+        self.max_itens = max_itens
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave: str) -> bytes | None:
+        with self._trava:
+            corpo = self._entradas.get(chave)
+            if corpo is not None:
+                self._entradas.move_to_end(chave)
+            return corpo
+
+    def gravar(self, chave: str, corpo: bytes):
+        with self._trava:
+            self._entradas[chave] = corpo
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_itens:
+                self._entradas.popitem(last=False)
+
+
+class CachePaginasSQLite:
+    """
+    Páginas em um arquivo SQLite, compartilhado entre os processos (workers
+    do gunicorn) da mesma máquina, descartando as acessadas há mais tempo.
+    """
+
+    def __init__(self, caminho: str, max_itens: int):
+        self.caminho = caminho
+        self.max_itens = max_itens
+
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS paginas_cache (
+                    chave TEXT PRIMARY KEY,
+                    corpo BLOB NOT NULL,
+                    acessado_em REAL NOT NULL
+                )
+                """)
+            conexao.execute(
+                "CREATE INDEX IF NOT EXISTS ix_paginas_cache_acessado_em "
+                "ON paginas_cache (acessado_em)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        # Uma conexão por operação: o sqlite3 não compartilha conexões entre threads
+        conexao = sqlite3.connect(self.caminho, timeout=5)
+        try:
+            with conexao:  # Faz o commit (ou rollback) ao final do bloco
+                yield conexao
+        finally:
+            conexao.close()
+
+    def obter(self, chave: str) -> bytes | None:
+        with self._conectar() as conexao:
+            linha = conexao.execute(
+                "SELECT corpo FROM paginas_cache WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None:
+                return None
+
+            conexao.execute(
+                "UPDATE paginas_cache SET acessado_em = ? WHERE chave = ?",
+                (time.time(), chave),
+            )
+            return linha[0]
+
+    def gravar(self, chave: str, corpo: bytes):
+        with self._conectar() as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO paginas_cache (chave, corpo, acessado_em) "
+                "VALUES (?, ?, ?)",
+                (chave, corpo, time.time()),
+            )
+            conexao.execute(
+                """
+                DELETE FROM paginas_cache WHERE chave IN (
+                    SELECT chave FROM paginas_cache
+                    ORDER BY acessado_em DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_itens,),
+            )
+
+
+def obter_cache_paginas():
+    """
+    Retorna o cache de páginas da aplicação, criando-o no primeiro uso, ou
+    None se estiver desligado (PAGINAS_CACHE_BACKEND=nenhum).
+    """
+
+    if "cache_paginas" in current_app.extensions:
+        return current_app.extensions["cache_paginas"]
+
+    backend = current_app.config["PAGINAS_CACHE_BACKEND"]
+    max_itens = current_app.config["PAGINAS_CACHE_MAX_ITENS"]
+
+    if backend == "nenhum":
+        cache = None
+    elif backend == "memoria":
+        cache = CachePaginasMemoria(max_itens)
+    elif backend == "sqlite":
+        caminho = current_app.config["PAGINAS_CACHE_SQLITE_PATH"] or os.path.join(
+            current_app.instance_path, "paginas_cache.sqlite3"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        cache = CachePaginasSQLite(caminho, max_itens)
+    else:
+        raise ValueError(f"Backend de cache de páginas desconhecido: {backend}")
+
+    current_app.extensions["cache_paginas"] = cache
+    return cache
+
+
+def _contar(resultado: str):
+    metricas.contar(
+        "cache_paginas_total", endpoint=request.endpoint, resultado=resultado
+    )
+
+
+def cache_pagina(*conjuntos: str):
+    """
+    Guarda a página renderizada pela rota (GET, status 200) até mudar a
+    versão de algum dos `conjuntos` de dados ("operacoes", "ativos", ...).
+    """
+
+    def decorador(view):
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            cache = obter_cache_paginas()
+            if cache is None or request.method != "GET" or "_flashes" in session:
+                _contar("ignorada")
+                return view(*args, **kwargs)
+
+            versoes = obter_versoes()
+            chave = gerar_etag(
+                request.endpoint,
+                sorted(kwargs.items()),
+                sorted(request.args.items(multi=True)),
+                *(versoes.get(nome, 0) for nome in conjuntos),
+            )
+
+            if cliente_tem_versao(chave):
+                _contar("nao_modificada")
+                resposta = current_app.response_class(status=304)
+            else:
+                corpo = cache.obter(chave)
+                if corpo is not None:
+                    _contar("acerto")
+                    resposta = current_app.response_class(corpo, mimetype="text/html")
+                    resposta.headers["X-Cache"] = "HIT"
+                else:
+                    resposta = make_response(view(*args, **kwargs))
+                    if resposta.status_code != 200 or session.modified:
+                        _contar("ignorada")
+                        return resposta
+                    _contar("falha")
+                    cache.gravar(chave, resposta.get_data())
+                    resposta.headers["X-Cache"] = "MISS"
+
+            # O navegador sempre revalida (If-None-Match) antes de usar a cópia local
+            resposta.set_etag(chave, weak=True)
+            resposta.cache_control.no_cache = True
+            return resposta
+
+        return envolvida
+
+    return decorador
@@ -0,0 +1,29 @@
+# utils/conversao.py
+from datetime import date, datetime
+from decimal import Decimal
+
+
+def converter_decimal(valor: str) -> Decimal:
+    """Converte valores como '1.234,56', 'R$ 10,50' ou '10.5' para Decimal."""
+
+    valor = valor.replace("R$", "").replace(" ", "").strip()
+    if not valor or valor == "-":
+        return Decimal("0")
+
+    # Com vírgula, o formato é o brasileiro: ponto separa milhar
+    if "," in valor:
+        valor = valor.replace(".", "").replace(",", ".")
+
+    return Decimal(valor)
+
+
+def converter_data(valor: str) -> date:
+    """Converte datas em dd/mm/aaaa, aaaa-mm-dd ou dd/mm/aa."""
+
+    valor = valor.strip()
+    for formato in ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%y"):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"data inválida '{valor}'")
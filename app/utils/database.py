@@ -1,5 +1,6 @@
 # utils/database.py
-from app.models import TipoOperacao, db
+from models import TipoAtivo, TipoOperacao, db
+from services.referencia_service import registrar_alteracao
 
 
 def carregar_dados_iniciais():
@@ -18,4 +19,34 @@ def carregar_dados_iniciais():
             novo_tipo = TipoOperacao(**tipo)
             db.session.add(novo_tipo)
 
+    # "Ações" e "FII" têm regras próprias na apuração do imposto (imposto_service);
+    # os nomes seguem os do catálogo da brapi (catalogo_service.TIPOS_BRAPI)
+    tipos_ativo = ["Ações", "FII", "ETF", "BDR"]
+
+    for nome in tipos_ativo:
+        if not TipoAtivo.query.filter_by(nome=nome).first():
+            db.session.add(TipoAtivo(nome=nome))
+
+    registrar_alteracao("tipos_operacao", "tipos_ativo")
     db.session.commit()
+
+
+def opcoes_engine(config) -> dict:
+    """
+    Opções do engine (pool de conexões) a partir da configuração. Tamanho,
+    excedente e espera só são passados se definidos: o SQLite em memória usa
+    um pool que não os aceita.
+    """
+
+    opcoes = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    for opcao, chave in (
+        ("pool_size", "DB_POOL_SIZE"),
+        ("max_overflow", "DB_POOL_MAX_OVERFLOW"),
+        ("pool_timeout", "DB_POOL_TIMEOUT"),
+    ):
+        if config[chave] is not None:
+            opcoes[opcao] = config[chave]
+    return opcoes
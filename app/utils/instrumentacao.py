@@ -0,0 +1,367 @@
+# utils/instrumentacao.py
+"""
+Instrumentação das requisições: consultas SQL (quantidade, tempo e consultas
+repetidas, sinal de N+1), chamadas a APIs externas e duração de cada
+requisição, registradas em logs estruturados (JSON) e em métricas no formato
+do Prometheus (rota /metrics).
+
+As métricas são do processo: com vários processos (gunicorn), cada um expõe
+as suas, como o Prometheus espera de alvos separados.
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) dos histogramas
+FAIXAS_REQUISICAO = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAIXAS_CONSULTA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+FAIXAS_API_EXTERNA = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+# -----------------------------------------------------
+# MÉTRICAS (FORMATO PROMETHEUS)
+# -----------------------------------------------------
+
+
+class Metricas:
+    """Contadores e histogramas com rótulos, exportados no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        # nome -> (tipo, ajuda, faixas)
+        self._definicoes = {}
+        # nome -> {rótulos (tupla de pares): valor ou [contagens, soma, total]}
+        self._valores = {}
+
+    def definir(self, nome: str, tipo: str, ajuda: str, faixas: tuple = ()):
+        with self._trava:
+            self._definicoes[nome] = (tipo, ajuda, faixas)
+            self._valores.setdefault(nome, {})
+
+    def contar(self, nome: str, valor: float = 1, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        with self._trava:
+            serie = self._valores[nome]
+            serie[chave] = serie.get(chave, 0) + valor
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        chave = tuple(sorted(rotulos.items()))
+        faixas = self._definicoes[nome][2]
+        with self._trava:
+            serie = self._valores[nome]
+            estado = serie.get(chave)
+            if estado is None:
+                estado = serie[chave] = [[0] * len(faixas), 0.0, 0]
+            for indice, limite in enumerate(faixas):
+                if valor <= limite:
+                    estado[0][indice] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def exportar(self) -> str:
+        linhas = []
+        with self._trava:
+            for nome, (tipo, ajuda, faixas) in self._definicoes.items():
+                linhas.append(f"# HELP {nome} {ajuda}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for chave, valor in sorted(self._valores[nome].items()):
+                    if tipo != "histogram":
+                        linhas.append(f"{nome}{_rotulos(chave)} {_numero(valor)}")
+                        continue
+
+                    contagens, soma, total = valor
+                    for limite, contagem in zip(faixas, contagens):
+                        rotulos = _rotulos(chave + (("le", _numero(limite)),))
+                        linhas.append(f"{nome}_bucket{rotulos} {contagem}")
+                    rotulos = _rotulos(chave + (("le", "+Inf"),))
+                    linhas.append(f"{nome}_bucket{rotulos} {total}")
+                    linhas.append(f"{nome}_sum{_rotulos(chave)} {_numero(soma)}")
+                    linhas.append(f"{nome}_count{_rotulos(chave)} {total}")
+        return "\n".join(linhas) + "\n"
+
+
+def _rotulos(chave: tuple) -> str:
+    if not chave:
+        return ""
+    pares = ",".join(
+        '{}="{}"'.format(
+            nome,
+            str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for nome, valor in chave
+    )
+    return "{" + pares + "}"
+
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+metricas = Metricas()
+metricas.definir(
+    "http_requisicoes_total", "counter", "Requisições atendidas por rota e status."
+)
+metricas.definir(
+    "http_requisicao_segundos",
+    "histogram",
+    "Duração das requisições por rota.",
+    FAIXAS_REQUISICAO,
+)
+metricas.definir(
+    "db_consultas_total", "counter", "Consultas SQL executadas, por rota (ou tarefa)."
+)
+metricas.definir(
+    "db_consulta_segundos",
+    "histogram",
+    "Duração de cada consulta SQL.",
+    FAIXAS_CONSULTA,
+)
+metricas.definir(
+    "db_consultas_repetidas_total",
+    "counter",
+    "Requisições com a mesma consulta repetida acima do limite (possível N+1).",
+)
+metricas.definir(
+    "api_externa_segundos",
+    "histogram",
+    "Duração das chamadas a APIs externas, por serviço.",
+    FAIXAS_API_EXTERNA,
+)
+metricas.definir(
+    "api_externa_erros_total", "counter", "Chamadas a APIs externas que falharam."
+)
+metricas.definir(
+    "cache_paginas_total",
+    "counter",
+    "Páginas pedidas às rotas com cache, por resultado (acerto, falha, "
+    "nao_modificada ou ignorada).",
+)
+
+
+# -----------------------------------------------------
+# LOGS ESTRUTURADOS
+# -----------------------------------------------------
+
+# Atributos de todo LogRecord; os demais vêm de extra={...} e viram campos do JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class FormatadorJson(logging.Formatter):
+    """Uma linha JSON por registro, com os campos passados em `extra`."""
+
+    def format(self, registro: logging.LogRecord) -> str:
+        dados = {
+            "data": self.formatTime(registro, "%Y-%m-%dT%H:%M:%S"),
+            "nivel": registro.levelname,
+            "origem": registro.name,
+            "mensagem": registro.getMessage(),
+        }
+        dados.update(
+            (chave, valor)
+            for chave, valor in vars(registro).items()
+            if chave not in _ATRIBUTOS_PADRAO
+        )
+        if registro.exc_info:
+            dados["excecao"] = self.formatException(registro.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+def configurar_logs(app):
+    """
+    Configura o log raiz da aplicação (nível LOG_NIVEL, formato LOG_FORMATO:
+    "json" ou "texto"). Não altera os handlers de um servidor que já os tenha
+    configurado (gunicorn --log-config, por exemplo).
+    """
+
+    raiz = logging.getLogger()
+    raiz.setLevel(app.config["LOG_NIVEL"])
+    if raiz.handlers:
+        return
+
+    handler = logging.StreamHandler(sys.stderr)
+    if app.config["LOG_FORMATO"] == "json":
+        handler.setFormatter(FormatadorJson())
+    else:
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+    raiz.addHandler(handler)
+
+
+# -----------------------------------------------------
+# CONSULTAS SQL E APIS EXTERNAS
+# -----------------------------------------------------
+
+
+class EstatisticasRequisicao:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_db = 0.0
+        self.por_comando = {}
+        self.chamadas_externas = 0
+        self.tempo_externo = 0.0
+        self._trava = threading.Lock()
+
+    def registrar_chamada_externa(self, duracao: float):
+        # Pode vir de várias threads auxiliares da mesma requisição ao mesmo tempo
+        with self._trava:
+            self.chamadas_externas += 1
+            self.tempo_externo += duracao
+
+
+def _estatisticas() -> EstatisticasRequisicao | None:
+    if has_request_context():
+        return g.get("instrumentacao")
+    return None
+
+
+def estatisticas_requisicao() -> EstatisticasRequisicao | None:
+    """
+    Estatísticas da requisição atual (None fora de uma), para repassar a
+    chamada_externa() nas threads auxiliares, que não têm o contexto dela.
+    """
+    return _estatisticas()
+
+
+def _antes_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("instrumentacao_inicio", []).append(time.perf_counter())
+
+
+def _depois_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get("instrumentacao_inicio")
+    if not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+
+    estatisticas = _estatisticas()
+    endpoint = (request.endpoint or "-") if estatisticas else "(fora de requisição)"
+    metricas.contar("db_consultas_total", endpoint=endpoint)
+    metricas.observar("db_consulta_segundos", duracao)
+
+    if estatisticas is not None:
+        estatisticas.consultas += 1
+        estatisticas.tempo_db += duracao
+        # O texto é o mesmo para parâmetros diferentes: repetições indicam N+1
+        estatisticas.por_comando[statement] = (
+            estatisticas.por_comando.get(statement, 0) + 1
+        )
+
+
+def _erro_na_consulta(contexto):
+    # A consulta que falhou não chega a after_cursor_execute
+    if contexto.connection is not None:
+        inicios = contexto.connection.info.get("instrumentacao_inicio")
+        if inicios:
+            inicios.pop()
+
+
+@contextmanager
+def chamada_externa(servico: str, estatisticas: EstatisticasRequisicao | None = None):
+    """
+    Mede uma chamada a uma API externa (brapi, SerpApi, ...): duração por
+    serviço, falhas e, dentro de uma requisição, o tempo gasto nelas. Em uma
+    thread auxiliar, as `estatisticas` da requisição (estatisticas_requisicao())
+    devem ser informadas; chamadas em paralelo somam o tempo de cada uma.
+    """
+
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metricas.contar("api_externa_erros_total", servico=servico)
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        metricas.observar("api_externa_segundos", duracao, servico=servico)
+        estatisticas = estatisticas or _estatisticas()
+        if estatisticas is not None:
+            estatisticas.registrar_chamada_externa(duracao)
+
+
+# -----------------------------------------------------
+# REQUISIÇÕES
+# -----------------------------------------------------
+
+
+def instrumentar(app):
+    """Liga a instrumentação das consultas (todos os engines) e das requisições."""
+
+    if not event.contains(Engine, "before_cursor_execute", _antes_da_consulta):
+        event.listen(Engine, "before_cursor_execute", _antes_da_consulta)
+        event.listen(Engine, "after_cursor_execute", _depois_da_consulta)
+        event.listen(Engine, "handle_error", _erro_na_consulta)
+
+    from utils.perfilador import descartar_perfil, encerrar_perfil, iniciar_perfil
+
+    @app.before_request
+    def iniciar_instrumentacao():
+        g.instrumentacao = EstatisticasRequisicao()
+        iniciar_perfil()
+
+    @app.after_request
+    def registrar_instrumentacao(resposta):
+        estatisticas = g.pop("instrumentacao", None)
+        if estatisticas is None:
+            return resposta
+
+        duracao = time.perf_counter() - estatisticas.inicio
+        endpoint = request.endpoint or "-"
+        metricas.contar(
+            "http_requisicoes_total",
+            endpoint=endpoint,
+            metodo=request.method,
+            status=resposta.status_code,
+        )
+        metricas.observar("http_requisicao_segundos", duracao, endpoint=endpoint)
+
+        repetidas = {
+            comando: vezes
+            for comando, vezes in estatisticas.por_comando.items()
+            if vezes >= app.config["INSTRUMENTACAO_CONSULTAS_REPETIDAS"]
+        }
+        campos = {
+            "metodo": request.method,
+            "caminho": request.path,
+            "endpoint": endpoint,
+            "status": resposta.status_code,
+            "duracao_ms": round(duracao * 1000, 2),
+            "consultas": estatisticas.consultas,
+            "tempo_db_ms": round(estatisticas.tempo_db * 1000, 2),
+            "chamadas_externas": estatisticas.chamadas_externas,
+            "tempo_externo_ms": round(estatisticas.tempo_externo * 1000, 2),
+        }
+
+        if repetidas:
+            metricas.contar("db_consultas_repetidas_total", endpoint=endpoint)
+            comando, vezes = max(repetidas.items(), key=lambda item: item[1])
+            logger.warning(
+                "Consulta repetida %d vezes na mesma requisição (possível N+1)",
+                vezes,
+                extra={**campos, "consulta": " ".join(comando.split())[:300]},
+            )
+        if app.config["LOG_REQUISICOES"]:
+            logger.info("%s %s", request.method, request.path, extra=campos)
+
+        encerrar_perfil(duracao, endpoint)
+
+        # Para as ferramentas do navegador (aba Network > Timing)
+        resposta.headers.add(
+            "Server-Timing",
+            f'db;dur={campos["tempo_db_ms"]};desc="{estatisticas.consultas} consultas", '
+            f'ext;dur={campos["tempo_externo_ms"]}, total;dur={campos["duracao_ms"]}',
+        )
+        return resposta
+
+    @app.teardown_request
+    def finalizar_instrumentacao(_erro):
+        descartar_perfil()
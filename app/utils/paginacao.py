@@ -0,0 +1,180 @@
+# utils/paginacao.py
+import base64
+import json
+from datetime import date, datetime
+from sqlalchemy import func, tuple_
+from models import db
+
+
+class PaginaKeyset:
+    """
+    Página de resultados paginada por chave (keyset). Em vez do número da
+    página, guarda cursores opacos com a chave da primeira e da última linha,
+    de modo que o custo de cada página não depende de quão longe ela está.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # Total de registros, apenas quando solicitado (pode ser estimado)
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def codificar_cursor(valores) -> str:
+    """Transforma os valores da chave em um texto opaco, seguro para a URL."""
+
+    serializados = []
+    for valor in valores:
+        if isinstance(valor, datetime):
+            serializados.append(["t", valor.isoformat()])
+        elif isinstance(valor, date):
+            serializados.append(["d", valor.isoformat()])
+        else:
+            serializados.append(["v", valor])
+
+    texto = json.dumps(serializados, separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> tuple | None:
+    """Desfaz `codificar_cursor`. Retorna None se o cursor for inválido."""
+
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = []
+        for tipo, valor in json.loads(texto):
+            if tipo == "t":
+                valores.append(datetime.fromisoformat(valor))
+            elif tipo == "d":
+                valores.append(date.fromisoformat(valor))
+            else:
+                valores.append(valor)
+        return tuple(valores)
+    except (ValueError, TypeError):
+        return None
+
+
+def _cursor_compativel(valores: tuple, colunas) -> bool:
+    """
+    Confere se os valores do cursor (vindos da URL) correspondem às colunas da
+    chave, em quantidade e tipo, para não montar uma comparação inválida.
+    """
+
+    if len(valores) != len(colunas):
+        return False
+
+    for valor, coluna in zip(valores, colunas):
+        try:
+            tipo = coluna.type.python_type
+        except NotImplementedError:
+            continue
+        if isinstance(valor, bool) or not isinstance(valor, tipo):
+            return False
+        # datetime é subclasse de date, mas não serve para uma coluna Date
+        if tipo is date and isinstance(valor, datetime):
+            return False
+        # Inteiros fora de 64 bits não cabem no parâmetro da consulta
+        if tipo is int and not -(2**63) <= valor < 2**63:
+            return False
+
+    return True
+
+
+def paginar_keyset(
+    query,
+    colunas,
+    cursor: str | None = None,
+    direcao: str = "next",
+    por_pagina: int = 10,
+    descendente: bool = False,
+    total=None,
+) -> PaginaKeyset:
+    """
+    Pagina `query` pela chave formada por `colunas` (a última deve ser única,
+    normalmente o id), todas ordenadas no mesmo sentido.
+
+    `direcao` "next" traz os registros depois do cursor e "prev" os anteriores.
+    Um cursor inválido (ou de outra chave) leva à primeira página.
+    A consulta busca uma linha a mais que `por_pagina` só para saber se existe
+    outra página, sem precisar de COUNT(*).
+    """
+
+    chave = tuple_(*colunas)
+    valores_cursor = decodificar_cursor(cursor) if cursor else None
+    if valores_cursor is not None and not _cursor_compativel(valores_cursor, colunas):
+        valores_cursor = None
+    voltando = valores_cursor is not None and direcao == "prev"
+
+    # Voltando, a consulta anda no sentido inverso e o resultado é desinvertido
+    ordem_invertida = descendente != voltando
+    ordenacao = [
+        coluna.desc() if ordem_invertida else coluna.asc() for coluna in colunas
+    ]
+
+    if valores_cursor is not None:
+        if ordem_invertida:
+            query = query.where(chave < tuple_(*valores_cursor))
+        else:
+            query = query.where(chave > tuple_(*valores_cursor))
+
+    linhas = (
+        db.session.execute(
+            query.order_by(None).order_by(*ordenacao).limit(por_pagina + 1)
+        )
+        .scalars()
+        .all()
+    )
+
+    tem_mais = len(linhas) > por_pagina
+    linhas = linhas[:por_pagina]
+    if voltando:
+        linhas.reverse()
+
+    def chave_de(item):
+        return codificar_cursor(getattr(item, coluna.key) for coluna in colunas)
+
+    tem_proxima = tem_mais if not voltando else True
+    tem_anterior = tem_mais if voltando else valores_cursor is not None
+
+    return PaginaKeyset(
+        linhas,
+        next_cursor=chave_de(linhas[-1]) if linhas and tem_proxima else None,
+        prev_cursor=chave_de(linhas[0]) if linhas and tem_anterior else None,
+        total=total,
+    )
+
+
+def contar_registros(query, exato: bool = False) -> int | None:
+    """
+    Conta os registros de `query` apenas quando pedido (`exato`). Sem filtros no
+    PostgreSQL, usa a estimativa das estatísticas da tabela, que é instantânea.
+    """
+
+    if exato:
+        return db.session.execute(
+            db.select(func.count()).select_from(query.order_by(None).subquery())
+        ).scalar()
+
+    tabelas = query.get_final_froms()
+    if (
+        db.engine.dialect.name == "postgresql"
+        and query.whereclause is None
+        and len(tabelas) == 1
+    ):
+        estimativa = db.session.execute(
+            db.text("SELECT reltuples::bigint FROM pg_class WHERE relname = :tabela"),
+            {"tabela": tabelas[0].name},
+        ).scalar()
+        if estimativa is not None and estimativa >= 0:
+            return estimativa
+
+    return None
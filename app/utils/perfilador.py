@@ -0,0 +1,120 @@
+# utils/perfilador.py
+"""
+Perfilador por amostragem, opcional: a cada PERFILADOR_AMOSTRAGEM requisições,
+uma é acompanhada por uma thread que lê a pilha da thread da requisição a cada
+PERFILADOR_INTERVALO_MS. Se a requisição demorar pelo menos
+PERFILADOR_LIMITE_MS, as pilhas são gravadas em PERFILADOR_DIR no formato
+"folded" (uma pilha por linha, com a contagem de amostras), lido pelo
+flamegraph.pl, pelo speedscope e por ferramentas semelhantes.
+
+Como só lê as pilhas de tempos em tempos, o custo na requisição acompanhada
+é pequeno, e nas demais é nulo.
+"""
+
+import itertools
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import current_app, g
+
+logger = logging.getLogger(__name__)
+
+_contador_requisicoes = itertools.count(1)
+
+
+class AmostradorPilhas:
+    """Conta as pilhas de uma thread, amostradas a cada `intervalo` segundos."""
+
+    def __init__(self, id_thread: int, intervalo: float):
+        self.id_thread = id_thread
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(
+            target=self._rodar, name="perfilador", daemon=True
+        )
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.id_thread)
+            if quadro is None:
+                continue
+
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(
+                    f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:"
+                    f"{codigo.co_firstlineno})"
+                )
+                quadro = quadro.f_back
+            self.pilhas[";".join(reversed(pilha))] += 1
+
+    def gravar(self, caminho: str):
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            for pilha, amostras in self.pilhas.most_common():
+                arquivo.write(f"{pilha} {amostras}\n")
+
+
+def iniciar_perfil():
+    """Começa a amostrar a requisição atual, se for a vez dela."""
+
+    amostragem = current_app.config["PERFILADOR_AMOSTRAGEM"]
+    if not amostragem or next(_contador_requisicoes) % amostragem:
+        return
+
+    amostrador = AmostradorPilhas(
+        threading.get_ident(), current_app.config["PERFILADOR_INTERVALO_MS"] / 1000
+    )
+    amostrador.iniciar()
+    g.perfilador = amostrador
+
+
+def encerrar_perfil(duracao: float, endpoint: str):
+    """Para a amostragem e grava as pilhas se a requisição passou do limite."""
+
+    amostrador = g.pop("perfilador", None)
+    if amostrador is None:
+        return
+
+    amostrador.parar()
+    if duracao * 1000 < current_app.config["PERFILADOR_LIMITE_MS"]:
+        return
+    if not amostrador.pilhas:
+        return
+
+    pasta = current_app.config["PERFILADOR_DIR"] or os.path.join(
+        current_app.instance_path, "perfis"
+    )
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(
+        pasta, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{endpoint}.folded"
+    )
+    amostrador.gravar(caminho)
+    logger.info(
+        "Perfil da requisição gravado",
+        extra={
+            "endpoint": endpoint,
+            "duracao_ms": round(duracao * 1000, 2),
+            "amostras": sum(amostrador.pilhas.values()),
+            "arquivo": caminho,
+        },
+    )
+
+
+def descartar_perfil():
+    """Para a amostragem pendente (requisição que terminou em erro)."""
+
+    amostrador = g.pop("perfilador", None)
+    if amostrador is not None:
+        amostrador.parar()
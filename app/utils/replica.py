@@ -0,0 +1,86 @@
+# utils/replica.py
+"""
+Leituras em uma réplica do banco (opcional, DB_REPLICA_URL).
+
+As rotas marcadas com @somente_leitura consultam a réplica; todo o resto
+(gravações, serviços de posição, executores em segundo plano) usa o banco
+principal. Mesmo numa rota marcada, qualquer gravação (flush, INSERT,
+UPDATE, DELETE) ou SELECT ... FOR UPDATE vai para o principal, e a partir
+dela a sessão não volta mais à réplica.
+
+Como a réplica pode estar atrasada, o navegador que acabou de gravar lê do
+principal por DB_REPLICA_PRIMARIO_APOS_ESCRITA segundos: quem cadastra uma
+operação e é redirecionado para a listagem a encontra lá.
+"""
+
+import time
+from functools import wraps
+import sqlalchemy as sa
+from flask import current_app, session
+from flask_sqlalchemy.session import Session
+
+REPLICA = "replica"
+
+
+class SessaoRoteada(Session):
+    """Sessão que envia as consultas das rotas somente leitura para a réplica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get("somente_leitura"):
+            if (
+                self._flushing
+                or isinstance(clause, sa.UpdateBase)
+                or getattr(clause, "_for_update_arg", None) is not None
+            ):
+                self.info["escreveu"] = True
+            elif not self.info.get("escreveu") and REPLICA in self._db.engines:
+                return self._db.engines[REPLICA]
+        elif self._flushing or isinstance(clause, sa.UpdateBase):
+            self.info["escreveu"] = True
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _sessao():
+    return current_app.extensions["sqlalchemy"].session
+
+
+def somente_leitura(view):
+    """Faz as consultas da rota irem para a réplica, se houver uma configurada."""
+
+    @wraps(view)
+    def envolvida(*args, **kwargs):
+        if session.get("ler_do_primario_ate", 0) > time.time():
+            return view(*args, **kwargs)
+
+        sessao = _sessao()
+        sessao.info["somente_leitura"] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            sessao.info.pop("somente_leitura", None)
+
+    return envolvida
+
+
+def configurar_replica(app):
+    """Registra a réplica como bind do Flask-SQLAlchemy (antes de db.init_app)."""
+
+    url = app.config["DB_REPLICA_URL"]
+    if not url:
+        return
+
+    # As opções do engine principal (pool) só valem para ele; a réplica as recebe aqui
+    app.config["SQLALCHEMY_BINDS"] = {
+        **(app.config.get("SQLALCHEMY_BINDS") or {}),
+        REPLICA: {"url": url, **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})},
+    }
+
+    @app.after_request
+    def ler_do_primario_apos_escrita(resposta):
+        sessao = _sessao()
+        if sessao.info.get("escreveu") and resposta.status_code < 400:
+            session["ler_do_primario_ate"] = (
+                time.time() + app.config["DB_REPLICA_PRIMARIO_APOS_ESCRITA"]
+            )
+        return resposta
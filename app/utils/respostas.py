@@ -0,0 +1,46 @@
+# utils/respostas.py
+import gzip
+import hashlib
+from flask import request
+
+# Respostas menores que isso não compensam a compressão
+TAMANHO_MINIMO_GZIP = 500
+
+
+def gerar_etag(*partes) -> str:
+    """ETag a partir das versões (ou outros valores) que determinam a resposta."""
+
+    texto = "|".join(str(parte) for parte in partes)
+    return hashlib.sha1(texto.encode()).hexdigest()[:20]
+
+
+def cliente_tem_versao(etag: str) -> bool:
+    """Indica se o cliente já tem a versão `etag` (If-None-Match)."""
+
+    return request.if_none_match.contains_weak(etag)
+
+
+def comprimir(resposta):
+    """
+    Comprime a resposta com gzip quando o cliente aceita e o corpo é grande o
+    suficiente. O ETag deve ser fraco (W/"..."), pois o corpo muda com a
+    codificação.
+    """
+
+    resposta.vary.add("Accept-Encoding")
+
+    if (
+        "gzip" not in request.headers.get("Accept-Encoding", "")
+        or resposta.direct_passthrough
+        or resposta.status_code != 200
+        or "Content-Encoding" in resposta.headers
+    ):
+        return resposta
+
+    corpo = resposta.get_data()
+    if len(corpo) < TAMANHO_MINIMO_GZIP:
+        return resposta
+
+    resposta.set_data(gzip.compress(corpo, compresslevel=6))
+    resposta.headers["Content-Encoding"] = "gzip"
+    return resposta